@@ -6,7 +6,59 @@ browsing articles' metadata based on keywords provided by the user.
 
 The API offers an endpoint `/articles/find` that accepts both POST requests.
 The request body should be in JSON format and include a 'keywords' field containing
-a list of strings representing the keywords to search for.
+a list of strings representing the keywords to search for. An optional 'order' field
+selects the ordering of the results: 'newest' (default) or 'relevance', which ranks
+the articles by full-text relevance of their headers to the keywords.
+
+Results are paged. The optional 'limit' field sets the page size (at most
+`MAX_PAGE_SIZE`, `DEFAULT_PAGE_SIZE` by default) and 'cursor' continues after
+the page which returned it in 'next_cursor'. The cursor is an opaque keyset
+over (`timestamp`, `id`), so deep pages stay stable and cheap; it is available
+for the 'newest' order only. With `"count": true` the response also contains
+'total_estimate', the planner's estimate of the number of matching articles.
+
+Searches are read from a replica when replicas are configured (see `app.db`), which
+can lag behind the scraper by up to `DB_REPLICA_MAX_LAG` seconds. Clients which need
+to read their own writes set 'max_staleness' to the lag they accept in seconds (0 reads
+the primary); such requests bypass the result cache and the keyword index.
+
+Only articles of the last `RECENT_SEARCH_DAYS` days are searched, so that only
+the recent partitions of the article table are read; `"history": true` searches
+all stored articles.
+
+Large result sets can be streamed instead of paged: with the query parameter
+`stream=json` the articles are written as a chunked JSON array, with `stream=ndjson`
+(or the `Accept: application/x-ndjson` header) as newline-delimited JSON. Streamed
+results are read from a server-side cursor and are not limited unless 'limit' is set.
+
+Paged results are cached in the process for `RESULT_CACHE_TTL` seconds, keyed by
+the lowercased, deduplicated and sorted keywords and the paging fields. The cache
+is emptied whenever the scraper stores new articles (the ingest generation in the
+DB changes; it is checked at most once per `GENERATION_CHECK_INTERVAL`). Its
+counters are available at `GET /articles/cache`.
+
+With `API_KEYWORD_INDEX=1` every process loads an in-memory inverted index of the
+headers of the recent articles at startup (see `app.keyword_index`) and serves
+recent 'newest' pages from it instead of the DB; it is extended by new articles whenever the ingest generation
+changes, and articles older than `RECENT_SEARCH_DAYS` are evicted from it then. Until it is loaded, and for the 'relevance' order, the DB is searched.
+
+New articles can be followed incrementally at `POST /articles/feed`: the request holds
+the optional 'keywords' and the 'since' watermark of a previous response, the response
+holds only articles stored after it (oldest first) and the new 'watermark'. Without
+'since' the response has no articles, only the current watermark. With 'wait' (seconds,
+at most `MAX_FEED_WAIT`) the request waits until the scraper commits new articles
+(long-poll). `GET /articles/feed/events` sends them as Server-Sent Events instead.
+Both hold a server thread, so a process serves at most `API_MAX_STREAMS` of them at a
+time (see `app.notifications`): further long-polls are answered at once as if 'wait'
+was 0 and further event streams get 503 with `Retry-After`.
+
+Paged results and feed responses are serialized by a fast JSON encoder and compressed
+when the client accepts `br` or `gzip` by `Accept-Encoding` (see `app.encoding`); the
+search selects only the columns of the response, not whole ORM objects. The cache keeps
+the serialized and compressed bodies, so hits are neither serialized nor compressed again.
+
+Metrics of the API (request and DB query latencies, see `app.metrics`) are
+available in the Prometheus text format at `GET /metrics`.
 
 The API validates the request format and handles potential errors like missing fields,
 invalid keyword types, or data parsing issues. It also handles cases where news servers
@@ -20,19 +72,288 @@ response with a list of articles. Each article object contains the following fie
 - url: The URL of the article.
 """
 
+import base64
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
 from http import HTTPStatus
+from typing import Iterable, Iterator, List, Optional, Tuple
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 
-from app import db
-from app.service import get_articles_with_keywords
+from app import db, metrics, service
+from app.notifications import listener
+from app.cache import ResultCache
+from app.encoding import ENCODINGS, EncodedBody, dumps
+from app.keyword_index import KeywordIndex
+from app.model import Article
+from app.service import SEARCH_ORDERS, estimate_articles_with_keywords, get_articles_with_keywords, \
+    iter_articles_with_keywords
 from flask_cors import CORS
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+STREAM_CHUNK_SIZE = 100
+RESULT_CACHE_SIZE = 1000
+RESULT_CACHE_TTL = 60
+GENERATION_CHECK_INTERVAL = 1.0
+MAX_FEED_WAIT = 30
+SSE_HEARTBEAT = 15
+SSE_MAX_DURATION = 300
+KEYWORD_INDEX = os.environ.get('API_KEYWORD_INDEX', '0') == '1'
+RECENT_SEARCH_DAYS = int(os.environ.get('API_RECENT_SEARCH_DAYS', 90))
+EMPTY_WATERMARK = (datetime(1970, 1, 1, tzinfo=timezone.utc), 0)
+
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+_generation: Tuple[float, Optional[int]] = (0.0, None)
+keyword_index = KeywordIndex(timedelta(days=RECENT_SEARCH_DAYS) if RECENT_SEARCH_DAYS else None)
+
 
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:8000"], supports_credentials=True)
 
 
+def encode_cursor(article: Article) -> str:
+    """
+    Encodes the keyset of the article into an opaque cursor.
+
+    Args:
+        article: The last article of a page.
+    """
+    return encode_key((article.timestamp, article.id))
+
+
+def encode_key(key: Tuple[datetime, int]) -> str:
+    """Encodes a (timestamp, id) keyset into an opaque cursor."""
+    data = json.dumps([key[0].isoformat(), key[1]])
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decodes a cursor created by `encode_cursor`.
+
+    Args:
+        cursor: The cursor from a client.
+
+    Returns:
+        The (timestamp, id) keyset of the article.
+
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    try:
+        timestamp, article_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), int(article_id)
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+
+def get_stream_format() -> Optional[str]:
+    """
+    Returns the streaming format requested by the client, or None for a paged response.
+
+    Raises:
+        ValueError: If the requested format is not supported.
+    """
+    stream = request.args.get('stream')
+    if stream is None:
+        if request.accept_mimetypes.best_match([STREAM_FORMATS['json'], STREAM_FORMATS['ndjson']]) == STREAM_FORMATS['ndjson']:
+            return 'ndjson'
+        return None
+    if stream not in STREAM_FORMATS:
+        raise ValueError(f"Stream has to be one of: {', '.join(STREAM_FORMATS)}.")
+    return stream
+
+
+def serialize_chunks(articles: Iterable[Article]) -> Iterator[List[bytes]]:
+    """Serializes articles into JSON objects, `STREAM_CHUNK_SIZE` per chunk."""
+    chunk = []
+    for article in articles:
+        chunk.append(dumps({'text': article.header, 'url': article.url}))
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate_stream(articles: Iterable[Article], stream: str) -> Iterator[bytes]:
+    """
+    Serializes articles into chunks of a JSON array or of NDJSON lines.
+
+    The request teardown runs before a streamed response is sent, so the database
+    session holding the server-side cursor is removed here once the stream ends.
+
+    Args:
+        articles: The articles to serialize.
+        stream: 'json' or 'ndjson'.
+    """
+    try:
+        if stream == 'ndjson':
+            for chunk in serialize_chunks(articles):
+                yield b'\n'.join(chunk) + b'\n'
+            return
+
+        yield b'{"articles":['
+        separator = b''
+        for chunk in serialize_chunks(articles):
+            yield separator + b','.join(chunk)
+            separator = b','
+        yield b']}'
+    finally:
+        db.remove_sessions()
+
+
+def json_response(body: EncodedBody, status: int = HTTPStatus.OK) -> Response:
+    """Sends the body in the best content coding which the client accepts."""
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    data = body.encoded(encoding)
+    response = Response(data, status=status, mimetype='application/json')
+    if data is not body.data:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def normalize_keywords(keywords: List[str]) -> Tuple[str, ...]:
+    """
+    Returns the keywords lowercased, deduplicated and sorted.
+
+    The search does not depend on case or order of the keywords, so the result
+    is used as the key of cached results.
+    """
+    return tuple(sorted({keyword.lower() for keyword in keywords}))
+
+
+def get_generation() -> int:
+    """
+    Returns the ingest generation, read from the DB at most once per `GENERATION_CHECK_INTERVAL`.
+    """
+    global _generation
+    checked_at, generation = _generation
+    now = time.monotonic()
+    if generation is None or now - checked_at >= GENERATION_CHECK_INTERVAL:
+        generation = service.get_generation()
+        _generation = (now, generation)
+    return generation
+
+
+def recent_bound() -> Optional[datetime]:
+    """Returns the start of the period searched by default, None if all articles are."""
+    if not RECENT_SEARCH_DAYS:
+        return None
+    return datetime.now(timezone.utc) - timedelta(days=RECENT_SEARCH_DAYS)
+
+
+def find_page(keywords: List[str], order: str, limit: int, after: Optional[Tuple[datetime, int]], count: bool,
+              newer_than: Optional[datetime] = None, use_index: bool = True) -> dict:
+    """
+    Finds one page of articles matching the keywords, stored since `newer_than`.
+
+    The keyword index serves the page if it can and `use_index` is set, otherwise the DB.
+
+    Returns:
+        The response body with the articles, the cursor of the next page and,
+        if `count` is set, the estimate of the number of matching articles.
+    """
+    articles = None
+    # the index holds only the recent articles unless all are searched by default
+    if use_index and order == 'newest' and keyword_index.ready and (newer_than is not None or not RECENT_SEARCH_DAYS):
+        keyword_index.refresh(get_generation())
+        articles = keyword_index.search(keywords, limit=limit + 1, after=after, newer_than=newer_than)
+    if articles is None:
+        articles = get_articles_with_keywords(keywords, order, limit=limit + 1, after=after, newer_than=newer_than)
+    next_cursor = encode_cursor(articles[limit - 1]) if len(articles) > limit and order == 'newest' else None
+    response = {
+        'articles': [
+            {'text': i.header, 'url': i.url} for i in articles[:limit]
+        ],
+        'next_cursor': next_cursor,
+    }
+    if count:
+        response['total_estimate'] = estimate_articles_with_keywords(keywords, newer_than)
+    return response
+
+
+def get_feed_keywords(keywords) -> List[str]:
+    """
+    Validates the keywords of a feed request.
+
+    Raises:
+        ValueError: If the keywords are not a list of strings.
+    """
+    if not isinstance(keywords, list) or not all(isinstance(keyword, str) for keyword in keywords):
+        raise ValueError("Keywords have to be a list of strings.")
+    return keywords
+
+
+def get_watermark() -> Tuple[datetime, int]:
+    """Returns the key of the newest stored article, `EMPTY_WATERMARK` if there is none."""
+    return service.get_watermark() or EMPTY_WATERMARK
+
+
+def feed_since(keywords: List[str], since: Tuple[datetime, int], limit: int, wait: float) -> List[Article]:
+    """
+    Fetches articles stored after the watermark, waiting up to `wait` seconds for them.
+
+    The DB session is removed before waiting, so no connection is held by idle clients.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        ticket = listener.ticket() if wait else 0
+        articles = service.get_articles_since(keywords, since, limit)
+        remaining = deadline - time.monotonic()
+        if articles or remaining <= 0:
+            return articles
+        db.remove_sessions()
+        if not listener.wait(ticket, remaining):
+            return []
+
+
+def generate_events(keywords: List[str], since: Optional[Tuple[datetime, int]]) -> Iterator[str]:
+    """
+    Sends articles stored after the watermark as Server-Sent Events.
+
+    Every event holds a batch of articles and has the new watermark as its id, so that
+    a reconnecting client continues by `Last-Event-ID`. A comment is sent after
+    `SSE_HEARTBEAT` seconds without articles, the stream ends after `SSE_MAX_DURATION`.
+    """
+    deadline = time.monotonic() + SSE_MAX_DURATION
+    try:
+        if since is None:
+            since = get_watermark()
+            yield f"event: watermark\nid: {encode_key(since)}\ndata: {{}}\n\n"
+        while time.monotonic() < deadline:
+            ticket = listener.ticket()
+            articles = service.get_articles_since(keywords, since, MAX_PAGE_SIZE)
+            db.remove_sessions()
+            if articles:
+                since = (articles[-1].timestamp, articles[-1].id)
+                data = json.dumps({'articles': [{'text': i.header, 'url': i.url} for i in articles]})
+                yield f"event: articles\nid: {encode_key(since)}\ndata: {data}\n\n"
+                continue
+            if not listener.wait(ticket, min(SSE_HEARTBEAT, max(0.0, deadline - time.monotonic()))):
+                yield ": keepalive\n\n"
+    finally:
+        db.remove_sessions()
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_duration(response: Response) -> Response:
+    """Records the duration of the request; streamed responses are timed until the first byte."""
+    metrics.api_request_seconds.observe(time.perf_counter() - g.request_start,
+                                        request.endpoint or 'unknown', str(response.status_code))
+    return response
+
+
 # noinspection PyUnusedLocal
 @app.teardown_request
 def remove_db_session(exception=None):
@@ -42,7 +363,7 @@ def remove_db_session(exception=None):
     Ensures proper database session management by removing it after each request
     to avoid potential connection issues.
     """
-    db.session.remove()
+    db.remove_sessions()
 
 
 @app.route('/articles/find', methods=['POST'])
@@ -65,6 +386,12 @@ def find_articles():
     try:
         data = request.get_json()
         keywords = data.get('keywords', [])
+        order = data.get('order', 'newest')
+        limit = data.get('limit')
+        cursor = data.get('cursor')
+        count = data.get('count', False)
+        history = data.get('history', False)
+        max_staleness = data.get('max_staleness')
 
         required_fields = ['keywords']
         for field in required_fields:
@@ -75,16 +402,142 @@ def find_articles():
             if not isinstance(keyword, str):
                 raise ValueError("Keywords have to be string.")
 
+        if order not in SEARCH_ORDERS:
+            raise ValueError(f"Order has to be one of: {', '.join(SEARCH_ORDERS)}.")
+
+        if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or not 0 < limit <= MAX_PAGE_SIZE):
+            raise ValueError(f"Limit has to be an integer from 1 to {MAX_PAGE_SIZE}.")
+
+        if cursor is not None and order != 'newest':
+            raise ValueError("Cursor can be used only with the 'newest' order.")
+        after = decode_cursor(cursor) if isinstance(cursor, str) else None
+        if cursor is not None and after is None:
+            raise ValueError("Invalid cursor.")
+
+        if not isinstance(history, bool):
+            raise ValueError("History has to be a boolean.")
+
+        if max_staleness is not None and (not isinstance(max_staleness, (int, float)) or isinstance(max_staleness, bool)
+                                          or max_staleness < 0):
+            raise ValueError("Max staleness has to be a non-negative number of seconds.")
+
+        stream = get_stream_format()
+
     except ValueError as err:
         return jsonify({'error': str(err)}),HTTPStatus.UNPROCESSABLE_ENTITY
-           
-    return jsonify(
-        {
-            'articles': [
-                {'text': i.header, 'url': i.url} for i in get_articles_with_keywords(keywords)
-            ]
-        }
-    ), HTTPStatus.OK
+
+    newer_than = None if history else recent_bound()
+    if max_staleness is not None:
+        db.set_max_staleness(max_staleness)
+    if stream:
+        articles = iter_articles_with_keywords(keywords, order, limit=limit, after=after, newer_than=newer_than)
+        return Response(stream_with_context(generate_stream(articles, stream)), status=HTTPStatus.OK,
+                        mimetype=STREAM_FORMATS[stream])
+
+    keywords = normalize_keywords(keywords)
+    if max_staleness is not None:
+        # the cache and the index can be older than the bound, search the chosen replica or the primary
+        return json_response(EncodedBody(find_page(list(keywords), order, limit or DEFAULT_PAGE_SIZE, after,
+                                                   count is True, newer_than, use_index=False)))
+    key = (keywords, order, limit or DEFAULT_PAGE_SIZE, cursor, count is True, history)
+    generation = get_generation()
+    body = result_cache.get(key, generation)
+    if body is None:
+        body = EncodedBody(find_page(list(keywords), order, limit or DEFAULT_PAGE_SIZE, after, count is True, newer_than))
+        result_cache.put(key, body, generation)
+    return json_response(body)
+
+
+@app.route('/articles/feed', methods=['POST'])
+def feed_articles():
+    """
+    Returns articles stored after the watermark given in 'since'.
+
+    Returns:
+        A JSON response with the new articles (oldest first), the new 'watermark'
+        and 'more' set if the limit cut off further articles.
+    """
+    if not request.is_json:
+        return jsonify({'error': 'Request have to be JSON.'}), HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+
+    try:
+        data = request.get_json()
+        keywords = get_feed_keywords(data.get('keywords', []))
+        since = data.get('since')
+        limit = data.get('limit', DEFAULT_PAGE_SIZE)
+        wait = data.get('wait', 0)
+
+        if not isinstance(limit, int) or isinstance(limit, bool) or not 0 < limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"Limit has to be an integer from 1 to {MAX_PAGE_SIZE}.")
+        if not isinstance(wait, (int, float)) or isinstance(wait, bool) or not 0 <= wait <= MAX_FEED_WAIT:
+            raise ValueError(f"Wait has to be a number of seconds from 0 to {MAX_FEED_WAIT}.")
+        if since is not None and not isinstance(since, str):
+            raise ValueError("Invalid watermark.")
+        since = decode_cursor(since) if since is not None else None
+
+    except ValueError as err:
+        return jsonify({'error': str(err)}), HTTPStatus.UNPROCESSABLE_ENTITY
+
+    if since is None:
+        return jsonify({'articles': [], 'watermark': encode_key(get_watermark()), 'more': False}), HTTPStatus.OK
+
+    streaming = wait > 0 and listener.acquire_stream()
+    try:
+        articles = feed_since(keywords, since, limit + 1, wait if streaming else 0)
+    finally:
+        if streaming:
+            listener.release_stream()
+    page = articles[:limit]
+    return json_response(EncodedBody({
+        'articles': [{'text': i.header, 'url': i.url} for i in page],
+        'watermark': encode_cursor(page[-1]) if page else encode_key(since),
+        'more': len(articles) > limit,
+    }))
+
+
+@app.route('/articles/feed/events', methods=['GET'])
+def feed_events():
+    """
+    Streams articles stored after the watermark as Server-Sent Events.
+
+    The keywords are given by repeated `keywords` query parameters, the watermark by
+    the `since` query parameter or the `Last-Event-ID` header of a reconnecting client.
+    """
+    try:
+        since = request.headers.get('Last-Event-ID') or request.args.get('since')
+        since = decode_cursor(since) if since else None
+    except ValueError as err:
+        return jsonify({'error': str(err)}), HTTPStatus.UNPROCESSABLE_ENTITY
+
+    if not listener.acquire_stream():
+        return jsonify({'error': 'Too many event streams, retry later.'}), HTTPStatus.SERVICE_UNAVAILABLE, \
+            {'Retry-After': str(SSE_HEARTBEAT)}
+    keywords = request.args.getlist('keywords')
+    response = Response(stream_with_context(generate_events(keywords, since)), status=HTTPStatus.OK,
+                        mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # released when the stream ends or the client goes away, even before the first event
+    response.call_on_close(listener.release_stream)
+    return response
+
+
+@app.route('/articles/cache', methods=['GET'])
+def cache_stats():
+    """
+    Returns the size and the hit, miss, eviction and invalidation counters of the result cache.
+    """
+    return jsonify(result_cache.stats()), HTTPStatus.OK
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Returns the metrics of the process in the Prometheus text format.
+    """
+    return Response(metrics.render(), status=HTTPStatus.OK, content_type=metrics.CONTENT_TYPE)
+
+
+if KEYWORD_INDEX:
+    keyword_index.start(since=recent_bound())
 
 
 if __name__ == '__main__':
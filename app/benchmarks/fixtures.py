@@ -0,0 +1,93 @@
+"""
+Front-page fixtures for benchmarks.
+
+Benchmarks replay front pages saved in `app/benchmarks/fixtures/<name>.html`,
+so they run without network access. This script, when run directly, records
+the current front pages of all news servers into that directory.
+
+A source without a recorded page is replayed from a synthetic page. It contains
+the markup read by the source's scraper, surrounded by the navigation, scripts
+and other links of a typical front page, so that parsing costs are realistic.
+"""
+import logging
+import random
+from pathlib import Path
+from typing import Dict
+from app.news import NewsScraper, get_http_session, HTTP_TIMEOUT
+from app.sources import SOURCES_FILE, load_entries, load_scrapers
+logger = logging.getLogger(__name__)
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+# the sources shipped in `app/sources.json`
+SOURCES: Dict[str, NewsScraper] = {scraper.name: scraper for scraper in load_scrapers(load_entries(SOURCES_FILE))}
+
+WORDS = ('vláda', 'prezident', 'Babiš', 'Praha', 'volby', 'ekonomika', 'počasí', 'sport', 'fotbal', 'soud',
+         'government', 'election', 'market', 'London', 'climate', 'football', 'police', 'health', 'war', 'energy')
+
+
+def article_markup(name: str, i: int, header: str) -> str:
+    """Returns the markup of one article teaser as the source's scraper expects it."""
+    if name == 'idnes':
+        return f'<a href="https://www.idnes.cz/zpravy/domaci/clanek-{i}.A{i:06d}" score-type="Article"><h3>{header}</h3></a>'
+    if name == 'ihned':
+        return f'<h3 class="article-title"><a href="https://ihned.cz/c1-{i:08d}-clanek">{header}</a></h3>'
+    return (f'<a href="news/articles/c{i:08d}" data-testid="internal-link">'
+            f'<h2 data-testid="card-headline">{header}</h2><p>{header} {header}</p></a>')
+
+
+def synthetic_page(name: str, articles: int = 300, noise: int = 3000, seed: int = 0) -> bytes:
+    """
+    Generates a front page of the source.
+
+    Args:
+        name: The name of the source (a key of `SOURCES`).
+        articles: The number of article teasers.
+        noise: The number of other elements (links, navigation, images).
+        seed: The seed of the generated headers.
+    """
+    rng = random.Random(seed)
+    parts = ['<!DOCTYPE html><html><head><title>Front page</title>',
+             '<script>' + 'var x = 1;' * 2000 + '</script>',
+             '<style>' + '.c{color:red}' * 2000 + '</style></head><body><nav>']
+    parts += [f'<a href="/section/{i}">Section {i}</a>' for i in range(50)]
+    parts.append('</nav><main>')
+    for i in range(articles + noise):
+        if i % (1 + noise // max(articles, 1)) == 0 and i // (1 + noise // max(articles, 1)) < articles:
+            header = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 10)))
+            parts.append(f'<div class="card">{article_markup(name, i, header)}</div>')
+        else:
+            parts.append(f'<div class="promo"><img src="/img/{i}.jpg" alt="promo {i}">'
+                         f'<a href="/promo/{i}" class="promo-link">Promo {i}</a><span>text {i}</span></div>')
+    parts.append('</main><footer>' + '<a href="/about">About</a>' * 100 + '</footer></body></html>')
+    return ''.join(parts).encode()
+
+
+def load_page(name: str) -> bytes:
+    """
+    Returns the recorded front page of the source, or a synthetic one if none is recorded.
+
+    Args:
+        name: The name of the source (a key of `SOURCES`).
+    """
+    path = FIXTURES_DIR / f'{name}.html'
+    if path.exists():
+        return path.read_bytes()
+    return synthetic_page(name)
+
+
+def record() -> None:
+    """Downloads the current front pages of all sources into `FIXTURES_DIR`."""
+    FIXTURES_DIR.mkdir(exist_ok=True)
+    for name, scraper in SOURCES.items():
+        try:
+            response = get_http_session().get(scraper.website_url, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+            (FIXTURES_DIR / f'{name}.html').write_bytes(response.content)
+            logger.info(f"Recorded {scraper.website_url} ({len(response.content)} bytes)")
+        except Exception as e:
+            logger.error(f"Error recording {scraper.website_url}: {e}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    record()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the import time of the application's entry points.
+
+This script, when run directly, imports every module of `ENTRY_POINTS` in
+`--repeat` fresh interpreters started with `python -X importtime` and prints the
+median cumulative import time of the module and the number of modules it loads.
+
+It also guards the import path against regressions: it exits with 1 when an
+entry point loads a module listed for it in `ENTRY_POINTS` (the scraping stack
+in the API and the service layer, the DB driver anywhere, since the engine is
+created on first use), or when `--budget` milliseconds are given and a median
+import time exceeds them.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).parents[2]
+SCRAPING_MODULES = ('app.news', 'requests', 'bs4')
+DB_DRIVER_MODULES = ('psycopg2', 'asyncpg')
+# the entry points and the modules which must not be loaded by importing them
+ENTRY_POINTS: Dict[str, Tuple[str, ...]] = {
+    'app.db': SCRAPING_MODULES + DB_DRIVER_MODULES,
+    'app.service': SCRAPING_MODULES + DB_DRIVER_MODULES,
+    'app.api': SCRAPING_MODULES + DB_DRIVER_MODULES,
+    'app.scraper': DB_DRIVER_MODULES,
+    'app.worker': DB_DRIVER_MODULES,
+}
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """
+    Imports the module in a fresh interpreter.
+
+    Returns:
+        The cumulative import time in microseconds of every module it loaded.
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def unwanted_imports(module: str, times: Dict[str, int]) -> List[str]:
+    """Returns the modules of `ENTRY_POINTS` which must not be loaded by the module but were."""
+    return [name for name in ENTRY_POINTS.get(module, ()) if name in times]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per entry point')
+    parser.add_argument('--budget', type=float, help='maximum median import time of an entry point in ms')
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<14} {'median ms':>10} {'modules':>8}  unwanted")
+    for module in ENTRY_POINTS:
+        runs = [import_times(module) for _ in range(args.repeat)]
+        median = statistics.median(times[module] for times in runs) / 1000
+        unwanted = unwanted_imports(module, runs[0])
+        print(f"{module:<14} {median:10.1f} {len(runs[0]):8d}  {', '.join(unwanted) or '-'}")
+        if unwanted or (args.budget is not None and median > args.budget):
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
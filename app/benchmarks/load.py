@@ -0,0 +1,107 @@
+"""
+Load test of the production API server.
+
+This script, when run directly, starts `gunicorn app.api:app` (configured by
+`gunicorn.conf.py`) with 1, 2, 4, ... up to `--max-workers` workers (the number
+of CPUs by default), calls `POST /articles/find` from `--clients` keep-alive
+connections for `--duration` seconds and reports requests per second and
+latency percentiles for every worker count, showing how throughput scales
+with cores.
+
+It only reads the DB configured in `app.db`; fill it by running the scraper
+or `app.benchmarks.pipeline` first. The client runs in a separate process per
+connection, so that it does not become the bottleneck.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+from app.benchmarks.fixtures import WORDS
+from app.benchmarks.pipeline import percentile
+
+ROOT = Path(__file__).parents[2]
+
+
+def wait_until_ready(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/articles/cache')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start within {timeout}s")
+
+
+def client(port: int, duration: float, seed: int) -> Tuple[int, List[float]]:
+    """Calls the search API over one keep-alive connection; returns the number of errors and the latencies."""
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    errors, latencies = 0, []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        body = json.dumps({'keywords': [rng.choice(WORDS) for _ in range(rng.randint(1, 2))]})
+        start = time.perf_counter()
+        connection.request('POST', '/articles/find', body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        errors += response.status != 200
+    connection.close()
+    return errors, latencies
+
+
+def run(workers: int, clients: int, duration: float, port: int) -> dict:
+    """Starts the server with the given number of workers and measures it."""
+    env = dict(os.environ, WEB_WORKERS=str(workers), WEB_BIND=f'127.0.0.1:{port}')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app.api:app'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port)
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.starmap(client, [(port, duration, seed) for seed in range(clients)])
+    finally:
+        server.terminate()
+        server.wait()
+    latencies = [latency for _, client_latencies in results for latency in client_latencies]
+    return {
+        'workers': workers,
+        'requests_per_s': len(latencies) / duration,
+        'errors': sum(errors for errors, _ in results),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--max-workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--clients', type=int, default=16, help='concurrent keep-alive connections')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per worker count')
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    counts, workers = [], 1
+    while workers < args.max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(args.max_workers)
+
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for workers in counts:
+        result = run(workers, args.clients, args.duration, args.port)
+        print(f"{result['workers']:>7} {result['requests_per_s']:>9.0f} {result['p50_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
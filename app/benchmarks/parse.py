@@ -0,0 +1,64 @@
+"""
+Benchmark of front-page parsing.
+
+This script, when run directly, parses the front-page fixtures of all sources
+(see `app.benchmarks.fixtures`) with every available parser, with and without
+the scraper's `parse_only` strainer, and prints the median parse time, the peak
+memory of the parsed tree and the number of extracted articles.
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+from typing import List, Tuple
+from bs4 import BeautifulSoup
+from app.benchmarks.fixtures import SOURCES, load_page
+
+
+def available_parsers() -> List[str]:
+    """Returns the installed BeautifulSoup parsers."""
+    parsers = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        parsers.append('lxml')
+    except ImportError:
+        pass
+    return parsers
+
+
+def measure(content: bytes, parser: str, strainer, repeat: int) -> Tuple[float, int, BeautifulSoup]:
+    """
+    Parses the content `repeat` times.
+
+    Returns:
+        The median time in seconds, the peak traced memory in bytes and the last parsed tree.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        soup = BeautifulSoup(content, parser, parse_only=strainer)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    soup = BeautifulSoup(content, parser, parse_only=strainer)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak, soup
+
+
+def main(repeat: int) -> None:
+    print(f"{'source':<8} {'parser':<12} {'strainer':<9} {'median ms':>10} {'peak MiB':>9} {'articles':>9}")
+    for name, scraper in SOURCES.items():
+        content = load_page(name)
+        for parser in available_parsers():
+            for strainer in (None, scraper.parse_only):
+                elapsed, peak, soup = measure(content, parser, strainer, repeat)
+                articles = len(scraper.extract_articles(soup))
+                print(f"{name:<8} {parser:<12} {'yes' if strainer else 'no':<9} "
+                      f"{elapsed * 1000:>10.1f} {peak / 2 ** 20:>9.1f} {articles:>9}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed parses per variant')
+    main(parser.parse_args().repeat)
@@ -0,0 +1,69 @@
+"""
+Micro-benchmark of URL validation.
+
+This script, when run directly, collects the links of all anchors of the
+front-page fixtures (see `app.benchmarks.fixtures`, several thousand per page),
+resolved against the page's URL as the scrapers do, and prints the median cost
+per link of checking all of them by:
+
+- validators: `validators.url` (how every link was checked before),
+- pattern: the precompiled `app.urls.URL_PATTERN` alone,
+- cold: `app.urls.check_url` with an empty cache,
+- cached: `app.urls.check_url` with the links already cached, as in every
+  scraping cycle after the first one,
+
+together with the number of links on which `check_url` and `validators.url` disagree.
+"""
+import argparse
+import time
+from typing import Callable, List
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+import validators
+from app import urls
+from app.benchmarks.fixtures import SOURCES, load_page
+
+
+def front_page_links() -> List[str]:
+    """Returns the resolved links of all anchors of all front-page fixtures."""
+    links = []
+    for name, scraper in SOURCES.items():
+        soup = BeautifulSoup(load_page(name), 'html.parser')
+        links.extend(urljoin(scraper.website_url + '/', anchor['href']) for anchor in soup.find_all('a', href=True))
+    return links
+
+
+def ns_per_link(check: Callable[[str], object], links: List[str], repeat: int,
+                before: Callable[[], None] = lambda: None) -> float:
+    """Returns the median time of checking all links divided by their number, in nanoseconds."""
+    times = []
+    for _ in range(repeat):
+        before()
+        start = time.perf_counter()
+        for link in links:
+            check(link)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] / len(links) * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='passes over all links')
+    args = parser.parse_args()
+
+    links = front_page_links()
+    print(f"{len(links)} links, {len(set(links))} distinct")
+    results = {
+        'validators': ns_per_link(validators.url, links, args.repeat),
+        'pattern': ns_per_link(urls.URL_PATTERN.fullmatch, links, args.repeat),
+        'cold': ns_per_link(urls.check_url, links, args.repeat, before=urls._is_valid.cache_clear),
+    }
+    results['cached'] = ns_per_link(urls.check_url, links, args.repeat)
+    for name, value in results.items():
+        print(f'{name:<12} {value:10.0f} ns/link')
+    disagree = sum(urls.check_url(link) != (validators.url(link) == True) for link in set(links))
+    print(f"disagreements with validators.url: {disagree}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+In-process caches.
+
+This module defines `LRUSet`, a set of bounded size that evicts the least
+recently used items once it is full. The scraper uses it to remember URLs
+which are already stored, so that unchanged articles never reach the DB.
+
+`ResultCache` is a bounded LRU mapping whose entries expire after a TTL and
+which is emptied whenever the data generation it was filled from changes.
+The API uses it to serve repeated keyword searches without querying the DB.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+
+class LRUSet:
+    """Set holding at most `capacity` items, evicting the least recently used ones."""
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: The maximum number of items kept in the set.
+        """
+        if capacity < 1:
+            raise ValueError("Capacity has to be positive.")
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, item: Hashable) -> bool:
+        """Checks the item and marks it as recently used."""
+        with self._lock:
+            if item in self._items:
+                self._items.move_to_end(item)
+                return True
+            return False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item: Hashable) -> None:
+        """Adds the item, evicting the least recently used one if the set is full."""
+        with self._lock:
+            self._items[item] = None
+            self._items.move_to_end(item)
+            if len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def update(self, items: Iterable[Hashable]) -> None:
+        """Adds all items; the last one becomes the most recently used."""
+        for item in items:
+            self.add(item)
+
+    def clear(self) -> None:
+        """Removes all items."""
+        with self._lock:
+            self._items.clear()
+
+
+class ResultCache:
+    """
+    Mapping holding at most `capacity` entries for at most `ttl` seconds.
+
+    Entries belong to a generation of the underlying data; reading or writing
+    with a different generation empties the cache first, so no entry outlives
+    a change of the data.
+    """
+
+    def __init__(self, capacity: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            capacity: The maximum number of entries.
+            ttl: The number of seconds an entry stays valid.
+            clock: The source of the current time in seconds.
+        """
+        if capacity < 1:
+            raise ValueError("Capacity has to be positive.")
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _set_generation(self, generation: Hashable) -> None:
+        if generation != self.generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.generation = generation
+
+    def get(self, key: Hashable, generation: Hashable) -> Optional[Any]:
+        """
+        Returns the valid entry for the key, or None.
+
+        Args:
+            key: The key of the entry.
+            generation: The current generation of the data.
+        """
+        with self._lock:
+            self._set_generation(generation)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any, generation: Hashable) -> None:
+        """
+        Stores the entry, evicting the least recently used one if the cache is full.
+
+        Args:
+            key: The key of the entry.
+            value: The value of the entry.
+            generation: The generation of the data the value was computed from.
+        """
+        with self._lock:
+            self._set_generation(generation)
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Removes all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the size of the cache and its hit, miss, eviction and invalidation counters."""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,169 @@
+"""
+Deduplication of scraped articles.
+
+The same article is often linked by URLs which differ only in details: `http`
+and `https`, a `www.` prefix, tracking parameters (`utm_source`, `fbclid`, ...),
+the order of query parameters, a fragment, repeated or trailing slashes.
+`canonical_url` maps all of them to one form and `url_key` hashes it to a 16-byte
+UUID (the MD5 of the canonical URL). The key is stored with every article and
+claimed in the `article_url` table (see `app.model`), so a duplicate is detected
+by one probe of a fixed-width unique index, however long the URLs are.
+
+Different sources also publish the same story under their own URLs.
+`NearDuplicateIndex` detects headlines which are nearly the same as a recently
+stored one: every headline is reduced to its word shingles, the shingles to
+a MinHash signature, and signatures are bucketed by locality-sensitive hashing,
+so a lookup compares the headline only with the few candidates sharing a band.
+The index is optional (`SCRAPER_NEAR_DUPLICATES=1`) and kept per process.
+"""
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Set, Tuple
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+NEAR_DUPLICATES = os.environ.get('SCRAPER_NEAR_DUPLICATES', '0') == '1'
+NEAR_DUPLICATE_THRESHOLD = 0.8
+NEAR_DUPLICATE_CAPACITY = 50_000
+SHINGLE_SIZE = 2
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+
+TRACKING_PARAMETER = re.compile(
+    r'^(utm_\w+|at_\w+|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|igshid|ocid|xtor|_ga|ref|ref_src|spm)$',
+    re.IGNORECASE
+)
+DEFAULT_PORTS = {80, 443}
+PATH_SAFE = "/:@!$&'()*+,;=-._~%"
+ESCAPE = re.compile(r'%[0-9a-fA-F]{2}')
+WORD = re.compile(r'\w+')
+
+# 64-bit multipliers and offsets of the MinHash permutations, fixed so signatures are comparable across runs
+_MASK = (1 << 64) - 1
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f'a{i}'.encode(), digest_size=8).digest(), 'big') | 1,
+     int.from_bytes(hashlib.blake2b(f'b{i}'.encode(), digest_size=8).digest(), 'big'))
+    for i in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+
+
+def canonical_url(url: str) -> str:
+    """
+    Returns the canonical form of an absolute URL.
+
+    The scheme is `https`, the host is lowercase without `www.` and a default port,
+    repeated slashes in the path are collapsed and a trailing one removed, percent
+    escapes are uppercase, tracking parameters and the fragment are dropped and the
+    remaining query parameters sorted.
+
+    Raises:
+        ValueError: If the URL cannot be parsed, e.g. its port is out of range or its IPv6 host invalid.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in DEFAULT_PORTS:
+        host = f'{host}:{parts.port}'
+    path = re.sub(r'/{2,}', '/', parts.path)
+    if len(path) > 1:
+        path = path.rstrip('/')
+    path = ESCAPE.sub(lambda escape: escape[0].upper(), quote(path or '/', safe=PATH_SAFE))
+    query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not TRACKING_PARAMETER.match(name)))
+    return urlunsplit(('https', host, path, query, ''))
+
+
+def url_key(url: str) -> uuid.UUID:
+    """
+    Returns the 16-byte key of the canonical URL; equal to `md5(canonical_url)::uuid` in PostgreSQL.
+
+    Raises:
+        ValueError: If the URL cannot be parsed (see `canonical_url`).
+    """
+    return uuid.UUID(hashlib.md5(canonical_url(url).encode()).hexdigest())
+
+
+def shingles(header: str, size: int = SHINGLE_SIZE) -> FrozenSet[str]:
+    """Returns the sequences of `size` consecutive words of the header, lowercase and without diacritics."""
+    text = unicodedata.normalize('NFKD', header.lower())
+    words = WORD.findall(''.join(char for char in text if not unicodedata.combining(char)))
+    if len(words) < size:
+        return frozenset([' '.join(words)]) if words else frozenset()
+    return frozenset(' '.join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def minhash(items: FrozenSet[str]) -> Tuple[int, ...]:
+    """Returns the MinHash signature of a set; equal positions estimate the Jaccard similarity of two sets."""
+    hashes = [int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), 'big') for item in items]
+    return tuple(min((a * value + b) & _MASK for value in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    """Returns the estimated Jaccard similarity of the sets with the given signatures."""
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+class NearDuplicateIndex:
+    """Bounded index of recent headlines finding nearly equal ones by MinHash LSH."""
+
+    def __init__(self, capacity: int = NEAR_DUPLICATE_CAPACITY, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        """
+        Args:
+            capacity: The number of most recently added headlines kept.
+            threshold: The estimated Jaccard similarity of shingles from which headlines are near-duplicates.
+        """
+        self.capacity = capacity
+        self.threshold = threshold
+        self._signatures: 'OrderedDict[int, Tuple[int, ...]]' = OrderedDict()
+        self._buckets: List[Dict[Tuple[int, ...], Set[int]]] = [{} for _ in range(MINHASH_BANDS)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def contains(self, header: str) -> bool:
+        """Returns True if a nearly equal headline has been added."""
+        items = shingles(header)
+        if not items:
+            return False
+        signature = minhash(items)
+        with self._lock:
+            candidates = set()
+            for band, bucket in zip(self._bands(signature), self._buckets):
+                candidates |= bucket.get(band, set())
+            return any(similarity(signature, self._signatures[candidate]) >= self.threshold
+                       for candidate in candidates)
+
+    def add(self, headers: List[str]) -> None:
+        """Adds the headlines, evicting the oldest ones above the capacity."""
+        signatures = [minhash(items) for items in map(shingles, headers) if items]
+        with self._lock:
+            for signature in signatures:
+                entry = self._next_id
+                self._next_id += 1
+                self._signatures[entry] = signature
+                for band, bucket in zip(self._bands(signature), self._buckets):
+                    bucket.setdefault(band, set()).add(entry)
+                while len(self._signatures) > self.capacity:
+                    self._evict()
+
+    def _evict(self) -> None:
+        entry, signature = self._signatures.popitem(last=False)
+        for band, bucket in zip(self._bands(signature), self._buckets):
+            entries = bucket[band]
+            entries.discard(entry)
+            if not entries:
+                del bucket[band]
+
+    @staticmethod
+    def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        return [signature[i:i + MINHASH_ROWS] for i in range(0, len(signature), MINHASH_ROWS)]
+
+
+near_duplicates = NearDuplicateIndex()
@@ -0,0 +1,65 @@
+"""
+Encoding of API response bodies.
+
+Bodies are serialized by orjson when it is installed (several times faster than
+the standard `json` module, which is the fallback) and compressed with Brotli
+(when the `brotli` package is installed) or gzip if the client accepts it by
+`Accept-Encoding`. Bodies shorter than `COMPRESS_MIN_SIZE` are sent as they are.
+
+`EncodedBody` holds a serialized body together with its compressed variants,
+each computed once, so that a cached result is neither serialized nor
+compressed again when it is served.
+"""
+import gzip
+import json
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def dumps(value: Any) -> bytes:
+    """Serializes the value into compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compresses the data by the content coding `br` or `gzip`."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding {encoding}.")
+
+
+class EncodedBody:
+    """Serialized JSON body with its compressed variants."""
+
+    __slots__ = ('data', '_variants')
+
+    def __init__(self, value: Any):
+        self.data = dumps(value)
+        self._variants: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        """Returns the body in the content coding, the serialized body for None or short bodies."""
+        if encoding is None or len(self.data) < COMPRESS_MIN_SIZE:
+            return self.data
+        variant = self._variants.get(encoding)
+        if variant is None:
+            variant = self._variants[encoding] = compress(self.data, encoding)
+        return variant
@@ -0,0 +1,213 @@
+"""
+In-memory inverted index of article headers.
+
+`KeywordIndex` maps every lexeme of the articles' search vectors (the headers
+tokenized by PostgreSQL when they are inserted, lowercased and without
+diacritics, see `app.model`) to the positions of the articles containing it.
+A keyword search is then a union of the posting lists of lexemes starting with
+a query word, intersected across the words of a keyword and united across the
+keywords, so its cost grows with the number of matches, not with the table.
+
+Query words are normalized by the same `to_tsquery` calls as the DB search
+(`service.get_query_lexemes`, cached per word), so both return the same articles;
+the only difference is that words which PostgreSQL splits into a phrase
+(`covid_19`) match their parts anywhere in the header.
+
+The index is loaded once in a background thread (`start`), optionally only with
+articles stored since a given moment, and then extended by articles stored after
+its watermark whenever the ingest generation changes (`refresh`). Articles are kept in ascending (timestamp, id) order, so the newest
+matches are the ones with the highest positions.
+
+With `max_age` every update also evicts the articles older than that, together
+with their postings and the lexemes left without any, so an index of the recent
+articles does not grow for the lifetime of the process. Positions are never
+reused: the evicted ones are counted in an offset.
+"""
+import heapq
+import logging
+import threading
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from app import db, service
+from app.model import SEARCH_CONFIGS
+
+logger = logging.getLogger(__name__)
+
+LOAD_BATCH_SIZE = 1000
+LEXEME_CACHE_SIZE = 10_000
+
+
+class IndexedArticle(NamedTuple):
+    """Article held by the index; has the attributes of `model.Article` used by the API."""
+    id: int
+    timestamp: datetime
+    header: str
+    url: str
+
+
+@lru_cache(maxsize=LEXEME_CACHE_SIZE)
+def query_lexemes(word: str) -> Tuple[Tuple[str, ...], ...]:
+    """Returns `service.get_query_lexemes` of the word, cached."""
+    return tuple(tuple(lexemes) for lexemes in service.get_query_lexemes(word))
+
+
+class KeywordIndex:
+    """Inverted index from lexemes to articles, ordered by (timestamp, id)."""
+
+    def __init__(self, max_age: Optional[timedelta] = None):
+        """
+        Args:
+            max_age: Articles older than this are evicted on every update, none if None.
+        """
+        self.max_age = max_age
+        self.ready = False
+        self.watermark: Optional[Tuple[datetime, int]] = None
+        self.generation: Optional[int] = None
+        self._articles: List[IndexedArticle] = []
+        self._keys: List[Tuple[datetime, int]] = []
+        # the number of evicted articles; the article at position p is `_articles[p - _offset]`
+        self._offset = 0
+        self._postings: Dict[str, array] = {}
+        self._lexemes: List[str] = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._articles)
+
+    def start(self, since: Optional[datetime] = None) -> threading.Thread:
+        """Loads the index in a background thread; searches return None until it is loaded."""
+        thread = threading.Thread(target=self.load, args=(since,), name='keyword-index', daemon=True)
+        thread.start()
+        return thread
+
+    def load(self, since: Optional[datetime] = None) -> None:
+        """
+        Loads the stored articles and marks the index ready.
+
+        Args:
+            since: Only articles stored since this moment are loaded, all if None.
+        """
+        generation = service.get_generation()
+        if since is not None:
+            self.watermark = (since, 0)
+        self._update()
+        self.generation = generation
+        self.ready = True
+        logger.info(f"Keyword index loaded with {len(self)} articles and {len(self._lexemes)} lexemes")
+
+    def refresh(self, generation: int) -> None:
+        """
+        Adds articles stored since the last refresh if the ingest generation changed.
+
+        Concurrent calls do not wait, one of them refreshes the index.
+
+        Args:
+            generation: The current ingest generation, read before calling.
+        """
+        if not self.ready or generation == self.generation or not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._update()
+            self.generation = generation
+        finally:
+            self._refresh_lock.release()
+
+    def _update(self) -> None:
+        batch = []
+        try:
+            for row in service.iter_index_rows(self.watermark):
+                batch.append(row)
+                if len(batch) == LOAD_BATCH_SIZE:
+                    self._add(batch)
+                    batch = []
+            self._add(batch)
+        finally:
+            db.remove_sessions()
+        if self.max_age is not None:
+            self._evict(datetime.now(timezone.utc) - self.max_age)
+
+    def _add(self, rows: List[Tuple[int, datetime, str, str, List[str]]]) -> None:
+        with self._lock:
+            for article_id, timestamp, header, url, lexemes in rows:
+                position = self._offset + len(self._articles)
+                self._articles.append(IndexedArticle(article_id, timestamp, header, url))
+                self._keys.append((timestamp, article_id))
+                for lexeme in set(lexemes):
+                    postings = self._postings.get(lexeme)
+                    if postings is None:
+                        postings = self._postings[lexeme] = array('I')
+                        insort(self._lexemes, lexeme)
+                    postings.append(position)
+            if rows:
+                self.watermark = self._keys[-1]
+
+    def _evict(self, bound: datetime) -> None:
+        """Removes the articles stored before the bound and the postings pointing to them."""
+        with self._lock:
+            count = bisect_left(self._keys, (bound, 0))
+            if not count:
+                return
+            del self._articles[:count]
+            del self._keys[:count]
+            self._offset += count
+            emptied = False
+            for lexeme, postings in list(self._postings.items()):
+                del postings[:bisect_left(postings, self._offset)]
+                if not postings:
+                    del self._postings[lexeme]
+                    emptied = True
+            if emptied:
+                self._lexemes = sorted(self._postings)
+        logger.info(f"Keyword index evicted {count} articles older than {bound:%Y-%m-%d %H:%M}, {len(self)} left")
+
+    def search(self, keywords: List[str], limit: Optional[int] = None, after: Optional[Tuple[datetime, int]] = None,
+               newer_than: Optional[datetime] = None) -> Optional[List[IndexedArticle]]:
+        """
+        Finds articles containing at least one keyword, newest first.
+
+        Args:
+            keywords: A list of keywords to search for.
+            limit: The maximum number of articles to return, no limit if None.
+            after: The (timestamp, id) key of the last article of the previous page.
+            newer_than: Only articles stored since this moment are returned.
+
+        Returns:
+            The matching articles, or None if the index is not loaded yet.
+        """
+        if not self.ready:
+            return None
+        # normalize the words (possibly querying the DB) before taking the lock
+        queries = [[query_lexemes(word) for word in service.WORD_PATTERN.findall(keyword)] for keyword in keywords]
+        with self._lock:
+            matches: Set[int] = set()
+            for words in queries:
+                for config in range(len(SEARCH_CONFIGS)):
+                    terms = [lexeme for lexemes in words for lexeme in lexemes[config]]
+                    if terms:
+                        matches |= self._match_all(terms)
+            if after is not None:
+                bound = self._offset + bisect_left(self._keys, after)
+                matches = {position for position in matches if position < bound}
+            if newer_than is not None:
+                bound = self._offset + bisect_left(self._keys, (newer_than, 0))
+                matches = {position for position in matches if position >= bound}
+            positions = heapq.nlargest(limit, matches) if limit is not None else sorted(matches, reverse=True)
+            return [self._articles[position - self._offset] for position in positions]
+
+    def _match_all(self, prefixes: List[str]) -> Set[int]:
+        """Returns positions of articles which have a lexeme starting with every prefix."""
+        sets = sorted((self._match_prefix(prefix) for prefix in prefixes), key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def _match_prefix(self, prefix: str) -> Set[int]:
+        """Returns positions of articles which have a lexeme starting with the prefix."""
+        positions = set()
+        i = bisect_left(self._lexemes, prefix)
+        while i < len(self._lexemes) and self._lexemes[i].startswith(prefix):
+            positions.update(self._postings[self._lexemes[i]])
+            i += 1
+        return positions
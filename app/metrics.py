@@ -0,0 +1,299 @@
+"""
+Metrics of the scraper and the API in the Prometheus text format.
+
+This module defines counters and histograms cheap enough to stay enabled
+permanently: an observation is one dict lookup and a few additions under
+a lock, buckets are accumulated only when the metrics are rendered.
+
+The metrics of the hot paths are defined here, so that both processes share
+their names:
+
+- `scraper_phase_seconds{source,phase}`: time of a fetch split into `request`
+  (DNS, connect and waiting for the response headers), `download` and `parse`,
+- `scraper_get_headers_seconds{source}`: the whole `get_headers` call,
+- `scraper_pages_total{source,result}`: fetched pages by result (`fetched`,
+  `parsed`, `unchanged`, `failed`),
+- `scraper_articles_total{source,result}`: scraped articles by result
+  (`new`, `duplicate`),
+- `service_call_seconds{function}`: calls of the service functions,
+- `db_query_seconds{statement}`: every DB statement, by its first keyword,
+- `api_request_seconds{endpoint,status}`: requests of the API,
+- `scraper_queue_depth{stage}`: sources waiting for a stage of the scraping
+  pipeline (see `app.pipeline`),
+- `scraper_stage_seconds{stage}`: processing of one item by a pipeline stage;
+  its `_count` is the throughput of the stage.
+
+The API exposes them at `GET /metrics`; the scraper starts a small HTTP
+listener (`serve`) when `SCRAPER_METRICS_PORT` is set.
+
+The metrics are kept in the memory of every process and are not aggregated
+across processes. Under gunicorn (see `gunicorn.conf.py`) a scrape of
+`GET /metrics` is answered by any one of the workers, so every worker labels
+its metrics by `worker` (`set_worker`); counters of different workers must be
+summed by the query (e.g. `sum without (worker) (rate(...))`), and a restarted
+worker starts from zero.
+"""
+import abc
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: List['Metric'] = []
+_worker = ''
+
+
+class Metric(abc.ABC):
+    """Base class of metrics with a fixed set of label names."""
+
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        """
+        Args:
+            name: The name of the metric.
+            help: The description of the metric.
+            labels: The names of the labels whose values are given to every observation.
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def label_text(self, values: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{name}="{escape(value)}"' for name, value in zip(self.labels, values)]
+        if _worker:
+            pairs.append(f'worker="{escape(_worker)}"')
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """Removes the values of all label values."""
+
+
+class Counter(Metric):
+    """Monotonically increasing count of events."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *values: str, amount: float = 1) -> None:
+        """Adds the amount to the count of the given label values."""
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def value(self, *values: str) -> float:
+        with self._lock:
+            return self._values.get(values, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return super().render() + [f'{self.name}{self.label_text(key)} {value:g}' for key, value in values]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Metric):
+    """Current value which can go up and down."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *values: str) -> None:
+        """Sets the value for the given label values."""
+        with self._lock:
+            self._values[values] = value
+
+    def value(self, *values: str) -> float:
+        with self._lock:
+            return self._values.get(values, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return super().render() + [f'{self.name}{self.label_text(key)} {value:g}' for key, value in values]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        """
+        Args:
+            name: The name of the metric.
+            help: The description of the metric.
+            labels: The names of the labels whose values are given to every observation.
+            buckets: The ascending upper bounds of the buckets; +Inf is added.
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # per label values: the counts of the individual buckets (+Inf last) and the sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *values: str) -> None:
+        """Records the value for the given label values."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(values)
+            if entry is None:
+                entry = self._values[values] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    @contextmanager
+    def time(self, *values: str) -> Iterator[None]:
+        """Observes the duration of the `with` block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *values)
+
+    def count(self, *values: str) -> int:
+        with self._lock:
+            entry = self._values.get(values)
+            return sum(entry[0]) if entry else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines = super().render()
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                labels = self.label_text(key, 'le="' + le + '"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{self.label_text(key)} {total:g}')
+            lines.append(f'{self.name}_count{self.label_text(key)} {cumulative}')
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+def escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def timed(histogram: Histogram, *values: str) -> Callable:
+    """
+    Decorator observing the duration of every call of the function; its name is the default label value.
+
+    The duration of a coroutine function is observed until its coroutine finishes.
+    """
+    def decorator(function: Callable) -> Callable:
+        labels = values or (function.__name__,)
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with histogram.time(*labels):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with histogram.time(*labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_worker(name: str) -> None:
+    """
+    Labels all metrics of the process by the worker which serves them.
+
+    Args:
+        name: The value of the `worker` label, empty for no label.
+    """
+    global _worker
+    _worker = name
+
+
+def render() -> str:
+    """Returns all metrics in the Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def clear() -> None:
+    """Resets all metrics."""
+    for metric in _registry:
+        metric.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int, host: str = '') -> ThreadingHTTPServer:
+    """
+    Serves `GET /metrics` from a daemon thread.
+
+    Args:
+        port: The port to listen on, 0 for any free port.
+        host: The address to listen on, all addresses by default.
+
+    Returns:
+        The running server; `server_address` holds the actual port.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+scraper_phase_seconds = Histogram('scraper_phase_seconds', 'Time of fetching a page by phase.', ('source', 'phase'))
+scraper_get_headers_seconds = Histogram('scraper_get_headers_seconds', 'Time of scraping a source.', ('source',))
+scraper_pages_total = Counter('scraper_pages_total', 'Fetched pages by result.', ('source', 'result'))
+scraper_articles_total = Counter('scraper_articles_total', 'Scraped articles by result.', ('source', 'result'))
+service_call_seconds = Histogram('service_call_seconds', 'Time of service calls.', ('function',))
+db_query_seconds = Histogram('db_query_seconds', 'Time of DB statements.', ('statement',))
+api_request_seconds = Histogram('api_request_seconds', 'Time of API requests.', ('endpoint', 'status'))
+scraper_queue_depth = Gauge('scraper_queue_depth', 'Sources waiting in the queue of a pipeline stage.', ('stage',))
+scraper_stage_seconds = Histogram('scraper_stage_seconds', 'Time of processing one item by a pipeline stage.', ('stage',))
@@ -0,0 +1,168 @@
+"""
+Upgrades the schema of an existing DB.
+
+`db.create_empty_db` always creates the current schema from scratch. This script,
+when run directly, upgrades a DB created by an older version of the application
+in place, keeping the stored articles. Every migration is applied only once;
+the last applied one is recorded in the `schema_version` table.
+
+Migrations normally run in a transaction. Index builds on the `article` table
+run outside of it with `CREATE INDEX CONCURRENTLY`, so they do not block the
+scraper's inserts; if such a build fails, drop the INVALID index it leaves
+behind and run the script again.
+
+A migration step is either an SQL statement or a function called with the connection,
+for steps which depend on the data (e.g. creating partitions for all stored months).
+"""
+import logging
+from typing import Callable, List, Tuple, Union
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from app import db
+from app.model import CLAIM_URL_FUNCTION, CLAIM_URL_TRIGGER, INGEST_GENERATION_ROW, SEARCH_VECTOR, UNACCENT_EXTENSION, UNACCENT_FUNCTION
+from app.dedup import url_key
+from app.retention import ensure_partitions
+logger = logging.getLogger(__name__)
+
+KEY_BATCH_SIZE = 1000
+
+
+def partition_stored_months(connection: Connection) -> None:
+    """Creates partitions for all months of the articles in `article_legacy`."""
+    oldest = connection.execute(text("SELECT min(timestamp) FROM article_legacy")).scalar()
+    ensure_partitions(connection, since=oldest)
+
+
+def fill_url_keys(connection: Connection) -> None:
+    """Sets the keys of the canonical URLs of the stored articles (see `dedup.url_key`)."""
+    connection.execute(text("CREATE TEMPORARY TABLE url_keys (url VARCHAR NOT NULL, key UUID NOT NULL) ON COMMIT DROP"))
+    urls = connection.execute(text("SELECT DISTINCT url FROM article").execution_options(yield_per=KEY_BATCH_SIZE))
+    for batch in urls.partitions():
+        connection.execute(text("INSERT INTO url_keys (url, key) VALUES (:url, CAST(:key AS UUID))"),
+                           [{'url': url, 'key': str(url_key(url))} for url, in batch])
+    connection.execute(text("UPDATE article SET url_key = url_keys.key FROM url_keys WHERE article.url = url_keys.url"))
+
+
+# (version, description, statements, transactional)
+MIGRATIONS: List[Tuple[int, str, List[Union[str, Callable[[Connection], None]]], bool]] = [
+    (1, 'Unique article URL', [
+        "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY)",
+        "DELETE FROM article a USING article b WHERE a.url = b.url AND a.id > b.id",
+        "DROP INDEX IF EXISTS ix_article_url",
+        "CREATE UNIQUE INDEX ix_article_url ON article (url)",
+    ], True),
+    (2, 'Full-text search vector of headers (rewrites the article table, writes wait until it is done)', [
+        UNACCENT_EXTENSION,
+        UNACCENT_FUNCTION,
+        f"ALTER TABLE article ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED",
+    ], True),
+    (3, 'Full-text search index of headers', [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_article_search_vector ON article USING gin (search_vector)",
+    ], False),
+    (4, 'Ingest generation counter', [
+        "CREATE TABLE IF NOT EXISTS ingest_generation (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)",
+        INGEST_GENERATION_ROW,
+    ], True),
+    (5, 'Article table partitioned by month (copies the article table, writes wait until it is done)', [
+        "CREATE TABLE article_url (url VARCHAR NOT NULL PRIMARY KEY, timestamp TIMESTAMP WITH TIME ZONE NOT NULL)",
+        "CREATE INDEX ix_article_url_timestamp ON article_url (timestamp)",
+        "INSERT INTO article_url (url, timestamp) SELECT url, timestamp FROM article",
+        "ALTER TABLE article RENAME TO article_legacy",
+        "ALTER SEQUENCE article_id_seq RENAME TO article_legacy_id_seq",
+        "ALTER TABLE article_legacy DROP CONSTRAINT article_pkey",
+        "DROP INDEX ix_article_header, ix_article_url, ix_article_timestamp, ix_article_search_vector",
+        "CREATE TABLE article (id SERIAL NOT NULL, header VARCHAR NOT NULL, url VARCHAR NOT NULL, "
+        "timestamp TIMESTAMP WITH TIME ZONE NOT NULL, "
+        f"search_vector TSVECTOR GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED, "
+        "PRIMARY KEY (id, timestamp)) PARTITION BY RANGE (timestamp)",
+        "CREATE INDEX ix_article_search_vector ON article USING gin (search_vector)",
+        "CREATE INDEX ix_article_header ON article (header)",
+        "CREATE INDEX ix_article_timestamp ON article (timestamp)",
+        partition_stored_months,
+        "INSERT INTO article (id, header, url, timestamp) SELECT id, header, url, timestamp FROM article_legacy",
+        "SELECT setval('article_id_seq', coalesce((SELECT max(id) FROM article), 0) + 1, false)",
+        "DROP TABLE article_legacy",
+        CLAIM_URL_FUNCTION,
+        CLAIM_URL_TRIGGER,
+    ], True),
+    (6, 'Work queue of source fetch jobs', [
+        "CREATE TABLE IF NOT EXISTS source_job (name VARCHAR NOT NULL PRIMARY KEY, "
+        "next_run TIMESTAMP WITH TIME ZONE NOT NULL, interval FLOAT NOT NULL, failures INTEGER NOT NULL, "
+        "leased_by VARCHAR, leased_until TIMESTAMP WITH TIME ZONE)",
+        "CREATE INDEX IF NOT EXISTS ix_source_job_next_run ON source_job (next_run)",
+    ], True),
+    (7, 'Canonical URL keys (rewrites the article_url table, removes duplicate articles)', [
+        "ALTER TABLE article ADD COLUMN url_key UUID",
+        fill_url_keys,
+        "ALTER TABLE article ALTER COLUMN url_key SET NOT NULL",
+        "DELETE FROM article a USING article b "
+        "WHERE a.url_key = b.url_key AND (b.timestamp, b.id) < (a.timestamp, a.id)",
+        "DROP TABLE article_url",
+        "CREATE TABLE article_url (key UUID NOT NULL PRIMARY KEY, timestamp TIMESTAMP WITH TIME ZONE NOT NULL)",
+        "CREATE INDEX ix_article_url_timestamp ON article_url (timestamp)",
+        "INSERT INTO article_url (key, timestamp) SELECT url_key, timestamp FROM article",
+        CLAIM_URL_FUNCTION,
+    ], True),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(connection: Connection) -> int:
+    """
+    Returns the version of the DB schema, 0 for a DB without version.
+
+    Args:
+        connection: An open DB connection.
+    """
+    if connection.execute(text("SELECT to_regclass('schema_version')")).scalar() is None:
+        return 0
+    return connection.execute(text("SELECT coalesce(max(version), 0) FROM schema_version")).scalar()
+
+
+def set_version(connection: Connection, version: int) -> None:
+    """
+    Records the version of the DB schema.
+
+    Args:
+        connection: An open DB connection.
+        version: The version to record.
+    """
+    connection.execute(text("DELETE FROM schema_version"))
+    connection.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {'version': version})
+
+
+def migrate() -> int:
+    """
+    Applies all migrations newer than the current DB schema.
+
+    Every transactional migration runs in its own transaction, the others
+    in autocommit mode.
+
+    Returns:
+        The number of applied migrations.
+    """
+    applied = 0
+    for version, description, statements, transactional in MIGRATIONS:
+        with db.engine.connect() as connection:
+            if not transactional:
+                connection.execution_options(isolation_level='AUTOCOMMIT')
+            with connection.begin():
+                if get_version(connection) >= version:
+                    continue
+                logger.info(f"Applying migration {version}: {description}")
+                for statement in statements:
+                    if callable(statement):
+                        statement(connection)
+                    else:
+                        connection.execute(text(statement))
+                set_version(connection, version)
+                applied += 1
+    return applied
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    try:
+        logger.info(f'Applied {migrate()} migrations')
+    except Exception as e:
+        logger.error(f'Error migrating database: {e}')
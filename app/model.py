@@ -1,22 +1,129 @@
 """
 ORM definitions for storing scraped articles using SQLAlchemy.
+
+Headers are indexed for full-text search by the generated `search_vector`
+column. It combines the `simple` configuration (exact words, suitable for
+Czech, which has no built-in stemmer) with the `english` one (stemmed words),
+both applied to the header without diacritics, so "babis" matches "Babiš".
+
+The `article` table is partitioned by month of `timestamp` (see `app.retention`),
+so searches of recent articles only touch recent partitions and old ones can be
+dropped without deleting rows. A unique index of a partitioned table has to
+contain the partition key, so the uniqueness of URLs is enforced by the separate
+`article_url` table: a trigger claims the URL key of every inserted article there
+and skips the article if the key is already claimed. The key is the hash of the
+canonical URL (see `app.dedup`), so URLs differing only in scheme, `www.`,
+tracking parameters and the like are duplicates too.
 """
+import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, String, Integer, TIMESTAMP, func
+from sqlalchemy import Column, DDL, Computed, Float, Index, PrimaryKeyConstraint, String, Integer, TIMESTAMP, event, func
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 #from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import declarative_base, deferred
+from app import dedup
 
 Base = declarative_base()
 
+SEARCH_CONFIGS = ('simple', 'english')
+
+# unaccent() is only STABLE, generated columns and indexes need an IMMUTABLE function
+UNACCENT_EXTENSION = "CREATE EXTENSION IF NOT EXISTS unaccent"
+UNACCENT_FUNCTION = (
+    "CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text "
+    "LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE "
+    "AS $$ SELECT public.unaccent('public.unaccent', $1) $$"
+)
+SEARCH_VECTOR = " || ".join(f"to_tsvector('{config}', f_unaccent(header))" for config in SEARCH_CONFIGS)
+
+event.listen(Base.metadata, 'before_create', DDL(UNACCENT_EXTENSION))
+event.listen(Base.metadata, 'before_create', DDL(UNACCENT_FUNCTION))
+
 
 class Article(Base):
     __tablename__ = 'article'
+    __table_args__ = (
+        # the primary key of a partitioned table has to contain the partition key
+        PrimaryKeyConstraint('id', 'timestamp'),
+        Index('ix_article_search_vector', 'search_vector', postgresql_using='gin'),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
 
-    id: int = Column(Integer, primary_key=True)
+    id: int = Column(Integer, autoincrement=True)
     header: str = Column(String, nullable=False, index=True)
-    url: str = Column(String, nullable=False, index=True)
-    timestamp: datetime = Column(TIMESTAMP(timezone=True), nullable=False, default=func.now(), index=True)
+    url: str = Column(String, nullable=False)
+    url_key: uuid.UUID = Column(UUID(as_uuid=True), nullable=False,
+                                default=lambda context: dedup.url_key(context.get_current_parameters()['url']))
+    # the time of the insert, not the start of the transaction, see `service.generation_lock`
+    timestamp: datetime = Column(TIMESTAMP(timezone=True), nullable=False, default=func.clock_timestamp(), index=True)
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR, persisted=True)))
+
+    __mapper_args__ = {'primary_key': [id]}
 
     def __str__(self):
         return f"Article(id={self.id}, header={self.header}, url={self.url})"
+
+
+class ArticleUrl(Base):
+    """Key of the canonical URL of a stored article, unique across all partitions of `article`."""
+    __tablename__ = 'article_url'
+
+    key: uuid.UUID = Column(UUID(as_uuid=True), primary_key=True)
+    timestamp: datetime = Column(TIMESTAMP(timezone=True), nullable=False, default=func.now(), index=True)
+
+
+CLAIM_URL_FUNCTION = """CREATE OR REPLACE FUNCTION article_claim_url() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO article_url (key, timestamp) VALUES (NEW.url_key, NEW.timestamp) ON CONFLICT DO NOTHING;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    RETURN NEW;
+END $$"""
+CLAIM_URL_TRIGGER = (
+    "CREATE TRIGGER article_claim_url BEFORE INSERT ON article "
+    "FOR EACH ROW EXECUTE FUNCTION article_claim_url()"
+)
+event.listen(Article.__table__, 'after_create', DDL(CLAIM_URL_FUNCTION))
+event.listen(Article.__table__, 'after_create', DDL(CLAIM_URL_TRIGGER))
+
+
+class SchemaVersion(Base):
+    """Version of the DB schema, maintained by `app.migrate`."""
+    __tablename__ = 'schema_version'
+
+    version: int = Column(Integer, primary_key=True)
+
+
+class IngestGeneration(Base):
+    """
+    Counter increased whenever new articles are stored.
+
+    The single row lets other processes (the API) notice new articles cheaply.
+    """
+    __tablename__ = 'ingest_generation'
+
+    id: int = Column(Integer, primary_key=True)
+    value: int = Column(Integer, nullable=False, default=0)
+
+
+INGEST_GENERATION_ROW = "INSERT INTO ingest_generation (id, value) VALUES (1, 0) ON CONFLICT DO NOTHING"
+event.listen(IngestGeneration.__table__, 'after_create', DDL(INGEST_GENERATION_ROW))
+
+
+class SourceJob(Base):
+    """
+    Fetch job of one news source in the work queue of `app.worker`.
+
+    A worker leases the job until `leased_until`; if it dies, the lease expires
+    and another worker claims the job.
+    """
+    __tablename__ = 'source_job'
+
+    name: str = Column(String, primary_key=True)
+    next_run: datetime = Column(TIMESTAMP(timezone=True), nullable=False, default=func.now(), index=True)
+    interval: float = Column(Float, nullable=False)
+    failures: int = Column(Integer, nullable=False, default=0)
+    leased_by: str = Column(String)
+    leased_until: datetime = Column(TIMESTAMP(timezone=True))
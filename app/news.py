@@ -11,36 +11,144 @@ article headers and URLs from their respective websites.
 """
 from abc import abstractmethod
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, List, Optional
+from urllib.parse import urljoin, urlsplit
+import hashlib
 import logging
+import re
+import threading
+import time
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError
-import validators
+from app import metrics
+from app.urls import check_url  # noqa: F401, re-exported for the scrapers
 logger = logging.getLogger(__name__)
 
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+HTTP_TIMEOUT = 5
+HTTP_DEADLINE = 15
+HTTP_CHUNK_SIZE = 64 * 1024
+MAX_CONNECTIONS_PER_HOST = 2
+
+_http_session: Optional[requests.Session] = None
+_host_limits: Dict[str, threading.BoundedSemaphore] = {}
+_fetch_states: Dict[str, 'FetchState'] = {}
+_lock = threading.Lock()
+
 
 @dataclass
 class Article:
-    """Represents an article from a news server."""
+    """
+    Represents an article from a news server.
+
+    `validated` is set by the scrapers, which check the URL when extracting the
+    article, so that the later stages do not check it again.
+    """
     header: str
     url: str
+    validated: bool = False
 
-def check_url(url=None) -> bool:
-        """
-        Checks if the provided URL is valid.
+@dataclass
+class FetchState:
+    """
+    What is known about the last fetch of a URL.
 
-        Args:
-            url: The URL to validate
+    The validators (`etag`, `last_modified`) are sent back in conditional requests,
+    `content_hash` detects unchanged content of servers which do not support them.
+    """
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    fetches: int = 0
+    unchanged: int = 0
+    consecutive_errors: int = 0
+
+
+def get_fetch_state(url: str) -> FetchState:
+    """
+    Returns the state of the last fetch of the URL.
+
+    Args:
+        url: The fetched URL.
+    """
+    with _lock:
+        if url not in _fetch_states:
+            _fetch_states[url] = FetchState()
+        return _fetch_states[url]
+
+
+def forget_content(url: str) -> None:
+    """
+    Forgets the validators and hash of the URL, so its next fetch is processed in full.
+
+    Used when the articles from the last fetch could not be stored.
+
+    Args:
+        url: The fetched URL.
+    """
+    state = get_fetch_state(url)
+    state.etag = state.last_modified = state.content_hash = None
+
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the HTTP session shared by all scrapers.
+
+    The session keeps a pool of keep-alive connections per host, so repeated
+    scrape cycles reuse TCP/TLS connections instead of opening new ones.
+    """
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=MAX_CONNECTIONS_PER_HOST)
+            _http_session.mount('http://', adapter)
+            _http_session.mount('https://', adapter)
+        return _http_session
+
+
+def host_limit(url: str) -> threading.BoundedSemaphore:
+    """
+    Returns the semaphore limiting concurrent requests to the host of the URL.
+
+    Args:
+        url: The URL which is going to be fetched.
+    """
+    host = urlsplit(url).netloc.lower()
+    with _lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(MAX_CONNECTIONS_PER_HOST)
+        return _host_limits[host]
+
+
+def read_content(response: requests.Response, deadline: float) -> bytes:
+    """
+    Reads the body of a streamed response, giving up once the deadline passes.
+
+    `HTTP_TIMEOUT` only limits a single socket read, so a server sending the body
+    slowly could otherwise hold the download for an unlimited time.
+
+    Args:
+        response: A response requested with `stream=True`.
+        deadline: The `time.monotonic()` value by which the body has to be read.
+
+    Raises:
+        requests.exceptions.Timeout: If the deadline passes.
+    """
+    chunks = []
+    for chunk in response.iter_content(HTTP_CHUNK_SIZE):
+        if time.monotonic() > deadline:
+            raise requests.exceptions.Timeout(f"Download of {response.url} exceeded {HTTP_DEADLINE}s")
+        chunks.append(chunk)
+    return b''.join(chunks)
 
-        Returns:
-            True if the URL is valid, False otherwise.
-        """        
-        #pattern = "^https?://(?:[a-zA-Z0-9-\.]+\.)+[a-zA-Z]{2,}(?:[:\d]+)?(?:/[^\s]*)?$"    
-        if url and isinstance(url, str) and validators.url(url)==True:
-            return True
-        else:
-            return False
 
 class NewsScraper:
     """
@@ -49,7 +157,17 @@ class NewsScraper:
     This class defines an abstract method `get_headers` that needs to be
     implemented by specific scraper classes. It also provides helper methods
     for fetching and parsing website content, and basic error logging.
+    Scrapers declare the elements they read in `parse_only`, so that parsing
+    skips the rest of the page.
     """
+
+    website_url: Optional[str] = None
+    parse_only: Optional[SoupStrainer] = None
+
+    @property
+    def name(self) -> str:
+        """The name of the source in logs and metrics."""
+        return type(self).__name__
     
     @abstractmethod
     def get_headers(self) -> List[Article]:     
@@ -66,43 +184,120 @@ class NewsScraper:
 
     def get_soup(self, url):
         """
-        Connects to the provided URL, fetches content, and parses it with BeautifulSoup.
+        Fetches the URL over the shared HTTP session and parses it with BeautifulSoup.
 
         Args:
             url: The URL of the website to scrape.
 
         Returns:
             A BeautifulSoup object representing the parsed website content,
-            or None if there's an error.                 
+            or None if there's an error or the content has not changed.
+        """
+        content = self.fetch(url)
+        if content is None:
+            return None
+        with metrics.scraper_phase_seconds.time(self.name, 'parse'):
+            soup = self.parse(content)
+        metrics.scraper_pages_total.inc(self.name, 'parsed')
+        return soup
+
+    def fetch(self, url) -> Optional[bytes]:
+        """
+        Fetches the content of the URL over the shared HTTP session.
+
+        The request is conditional (`If-None-Match`, `If-Modified-Since`) when the
+        previous response had validators. Content which the server reports as not
+        modified, or whose hash equals the previous one, is not returned again.
+
+        Args:
+            url: The URL of the website to scrape.
+
+        Returns:
+            The content of the website, or None if there's an error or the content has not changed.
         """
         if not check_url(url):
             return None
 
-        headers = {}                       
+        source = self.name
+        state = get_fetch_state(url)
+        headers = {}
+        if state.etag:
+            headers['If-None-Match'] = state.etag
+        if state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
         try:
-            response = requests.get(url, headers=headers, timeout=5)
-            if response.status_code == 200:            
+            state.fetches += 1
+            with host_limit(url):
+                deadline = time.monotonic() + HTTP_DEADLINE
+                with metrics.scraper_phase_seconds.time(source, 'request'):
+                    response = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT, stream=True)
+                try:
+                    with metrics.scraper_phase_seconds.time(source, 'download'):
+                        content = read_content(response, deadline) if response.status_code == 200 else None
+                finally:
+                    response.close()
+            if response.status_code == 304:
+                state.consecutive_errors = 0
+                return self.unchanged(url, state)
+            if response.status_code == 200:
+                state.consecutive_errors = 0
+                metrics.scraper_pages_total.inc(source, 'fetched')
+                content_hash = hashlib.sha256(content).hexdigest()
+                if content_hash == state.content_hash:
+                    return self.unchanged(url, state)
+                state.content_hash = content_hash
+                state.etag = response.headers.get('ETag')
+                state.last_modified = response.headers.get('Last-Modified')
                 logger.info(f"Successfully retrieved content of {url}.")
             else:
+                state.consecutive_errors += 1
+                metrics.scraper_pages_total.inc(source, 'failed')
                 logger.error(f"Error: Failed to retrieve content of {url}. Status code: {response.status_code}")              
                 return None       
         except ConnectionError as e:
+            state.consecutive_errors += 1
+            metrics.scraper_pages_total.inc(source, 'failed')
             logger.error(f"ConnectionError: {e}")
             return None
         except requests.exceptions.RequestException as e:
+            state.consecutive_errors += 1
+            metrics.scraper_pages_total.inc(source, 'failed')
             logger.error(f"Request error: {e}")
             return None
         except Exception as e:
+            state.consecutive_errors += 1
+            metrics.scraper_pages_total.inc(source, 'failed')
             logger.error(f"{e}")
             return None
         else:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            return soup
+            return content
+
+    def parse(self, content: bytes) -> BeautifulSoup:
+        """
+        Parses HTML content with the fastest available parser (`HTML_PARSER`).
+
+        Only the elements matched by the scraper's `parse_only` strainer are kept
+        in the tree, the rest of the page is skipped while parsing.
+
+        Args:
+            content: The HTML content of a page.
+        """
+        return BeautifulSoup(content, HTML_PARSER, parse_only=self.parse_only)
+
+    def unchanged(self, url: str, state: FetchState) -> None:
+        """Records and logs a fetch which returned unchanged content."""
+        state.unchanged += 1
+        metrics.scraper_pages_total.inc(self.name, 'unchanged')
+        logger.info(f"Content of {url} unchanged ({state.unchanged} of {state.fetches} fetches).")
+        return None
         
 
 class IdnesScraper(NewsScraper):
     """Scraper class for Idnes news website."""
 
+    website_url = "https://idnes.cz"
+    parse_only = SoupStrainer('a', attrs={"score-type": "Article"})
+
     def get_headers(self) -> List[Article]:
         """
         Scrapes article headers and URLs from Idnes website.
@@ -112,24 +307,30 @@ class IdnesScraper(NewsScraper):
         Returns:
             A list of articles (Article class) containing headers and URLs from Idnes.
         """        
-        website_url = f"https://idnes.cz"
+        website_url = self.website_url
         soup = super().get_soup(website_url)
-        articles = []
-
-        if soup:
-            for item in soup.find_all('a', href=True, attrs={"score-type": "Article"}):
-                header = item.text.strip()
-                url = item.get('href', None)
-                if header and url and check_url(url)==True:
-                    articles.append(Article(header=header, url=website_url))  
-        
+        articles = self.extract_articles(soup) if soup else []
         logger.info(f"Articles from {website_url}: {len(articles)}")
         return articles
+
+    def extract_articles(self, soup: BeautifulSoup) -> List[Article]:
+        """Extracts articles from the parsed Idnes front page."""
+        articles = []
+        for item in soup.find_all('a', href=True, attrs={"score-type": "Article"}):
+            header = item.text.strip()
+            url = item.get('href', None)
+            if header and url and check_url(url)==True:
+                articles.append(Article(header=header, url=url, validated=True))
+        return articles
     
 
 class IhnedScraper(NewsScraper):
     """Scraper class for Ihned news website."""
 
+    website_url = "https://ihned.cz"
+    # the strainer sees the raw class attribute, which can hold more classes
+    parse_only = SoupStrainer('h3', attrs={"class": re.compile(r'(^|\s)article-title(\s|$)')})
+
     def get_headers(self) -> List[Article]:
         """
         Scrapes article headers and URLs from Ihned website.
@@ -139,26 +340,31 @@ class IhnedScraper(NewsScraper):
         Returns:
             A list of articles (Article class) containing headers and URLs from Ihned.
         """    
-        website_url = f"https://ihned.cz"
+        website_url = self.website_url
         soup = super().get_soup(website_url)
-        articles = []
-
-        if soup:
-            for item in soup.find_all('h3', attrs={"class": "article-title"}):
-                header = item.text.strip()          
-                link = item.find("a")
-                if link:
-                    url = link.get("href", None)
-                    if header and url and check_url(url)==True:
-                        articles.append(Article(header=header, url=url)) 
-
+        articles = self.extract_articles(soup) if soup else []
         logger.info(f"Articles from {website_url}: {len(articles)}")
         return articles
+
+    def extract_articles(self, soup: BeautifulSoup) -> List[Article]:
+        """Extracts articles from the parsed Ihned front page."""
+        articles = []
+        for item in soup.find_all('h3', attrs={"class": "article-title"}):
+            header = item.text.strip()
+            link = item.find("a")
+            if link:
+                url = link.get("href", None)
+                if header and url and check_url(url)==True:
+                    articles.append(Article(header=header, url=url, validated=True))
+        return articles
     
 
 class BbcScraper(NewsScraper):
     """Scraper class for Bbc news website."""
 
+    website_url = "https://bbc.com"
+    parse_only = SoupStrainer('a', attrs={"data-testid": "internal-link"})
+
     def get_headers(self) -> List[Article]: 
         """
         Scrapes article headers and URLs from Bbc website.
@@ -168,18 +374,20 @@ class BbcScraper(NewsScraper):
         Returns:
             A list of articles (Article class) containing headers and URLs from Bbc.
         """          
-        website_url = f"https://bbc.com"        
+        website_url = self.website_url
         soup = super().get_soup(website_url)
-        articles = []
-
-        if soup:
-            for item in soup.find_all('a', href=True, attrs={"data-testid": "internal-link"}):
-                url = website_url+'/'+item['href']
-                h2 = item.find("h2", attrs={"data-testid": "card-headline"})
-                if h2:
-                    header = h2.text.strip()
-                    if header and url and check_url(url)==True:
-                        articles.append(Article(header=header, url=url))            
-
+        articles = self.extract_articles(soup) if soup else []
         logger.info(f"Articles from {website_url}: {len(articles)}")
-        return articles
\ No newline at end of file
+        return articles
+
+    def extract_articles(self, soup: BeautifulSoup) -> List[Article]:
+        """Extracts articles from the parsed Bbc front page."""
+        articles = []
+        for item in soup.find_all('a', href=True, attrs={"data-testid": "internal-link"}):
+            url = urljoin(self.website_url + '/', item['href'])
+            h2 = item.find("h2", attrs={"data-testid": "card-headline"})
+            if h2:
+                header = h2.text.strip()
+                if header and url and check_url(url)==True:
+                    articles.append(Article(header=header, url=url, validated=True))
+        return articles
@@ -0,0 +1,124 @@
+"""
+Notifications of newly stored articles.
+
+The scraper sends a PostgreSQL notification on `service.INGEST_CHANNEL` in every
+transaction which stores new articles (see `service.bump_generation`).
+`IngestListener` listens on the channel from a background thread over its own
+connection and wakes the threads waiting in `wait`, so that long-polling
+clients of the API get new articles as soon as they are committed, without
+querying the DB in a loop.
+
+A waiting client holds a server thread (not a DB connection) for up to minutes,
+so at most `API_MAX_STREAMS` of them (8 by default) are served by one process at
+a time (`acquire_stream`); the thread budget of `gunicorn.conf.py` reserves that
+many threads above those of the ordinary requests.
+"""
+import logging
+import os
+import select
+import threading
+import time
+from typing import Optional
+from app import db
+from app.service import INGEST_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 5
+POLL_INTERVAL = 5
+MAX_STREAMS = int(os.environ.get('API_MAX_STREAMS', 8))
+
+
+class IngestListener:
+    """Background listener of `INGEST_CHANNEL` notifications."""
+
+    def __init__(self, max_streams: int = MAX_STREAMS):
+        """
+        Args:
+            max_streams: The maximum number of clients waiting at a time.
+        """
+        self._condition = threading.Condition()
+        self._events = 0
+        self._thread: Optional[threading.Thread] = None
+        self._streams = threading.BoundedSemaphore(max_streams)
+
+    def start(self) -> None:
+        """Starts the listening thread unless it is running already."""
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ingest-listener', daemon=True)
+                self._thread.start()
+
+    def ticket(self) -> int:
+        """
+        Returns the number of notifications received so far.
+
+        Take the ticket before checking for new articles and pass it to `wait`,
+        so that a notification arriving in between is not missed.
+        """
+        self.start()
+        with self._condition:
+            return self._events
+
+    def wait(self, ticket: int, timeout: float) -> bool:
+        """
+        Waits until a notification arrives after the ticket was taken.
+
+        Args:
+            ticket: The value returned by `ticket`.
+            timeout: The maximum waiting time in seconds.
+
+        Returns:
+            True if new articles were stored, False on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._events > ticket, timeout)
+
+    def acquire_stream(self) -> bool:
+        """
+        Reserves a slot for a long-lived client; release it by `release_stream` when the client is done.
+
+        Returns:
+            False if all `MAX_STREAMS` slots are taken.
+        """
+        return self._streams.acquire(blocking=False)
+
+    def release_stream(self) -> None:
+        self._streams.release()
+
+    def notify(self) -> None:
+        """Wakes all waiting threads."""
+        with self._condition:
+            self._events += 1
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                logger.error(f"Ingest listener error: {e}")
+            # wake the waiters, articles may have been stored while disconnected
+            self.notify()
+            time.sleep(RECONNECT_DELAY)
+
+    def _listen(self) -> None:
+        # a dedicated DBAPI connection outside of the pool, LISTEN holds it for good
+        cargs, cparams = db.engine.dialect.create_connect_args(db.engine.url)
+        connection = db.engine.dialect.loaded_dbapi.connect(*cargs, **cparams)
+        try:
+            connection.autocommit = True
+            connection.cursor().execute(f"LISTEN {INGEST_CHANNEL}")
+            logger.info(f"Listening on {INGEST_CHANNEL}")
+            while True:
+                if select.select([connection], [], [], POLL_INTERVAL) == ([], [], []):
+                    continue
+                connection.poll()
+                if connection.notifies:
+                    connection.notifies.clear()
+                    self.notify()
+        finally:
+            connection.close()
+
+
+listener = IngestListener()
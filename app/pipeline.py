@@ -0,0 +1,287 @@
+"""
+Staged scraping pipeline.
+
+A scraped source passes four stages, each with its own threads:
+
+1. fetch (`FETCH_WORKERS`): downloads the front page (network),
+2. parse (`PARSE_WORKERS`): parses it and extracts the articles (CPU),
+3. dedup (one thread): drops invalid articles (URLs are checked only if the
+   scraper did not mark them `validated`; URLs without a canonical form are
+   logged), URLs in the seen-URL cache and repeated canonical URLs (see `app.dedup`),
+4. write (one thread): saves the new articles of all sources waiting for it
+   by one batch insert (DB).
+
+The stages are connected by queues of at most `QUEUE_SIZE` sources. A stage
+which falls behind fills its queue and blocks the stage before it, so memory
+use stays bounded, and while one source is being written the next ones are
+already being fetched and parsed. A cycle therefore takes about as long as its
+slowest stage instead of the sum of all of them.
+
+Scrapers without `website_url` (custom `get_headers` implementations) are
+scraped as a whole in the fetch stage and skip parsing.
+
+The depth of every queue is exported as `scraper_queue_depth{stage}` and the
+time of every processed item as `scraper_stage_seconds{stage}`; `Pipeline.stats`
+returns the same figures together with the throughput of the last cycle.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from app import db, dedup, metrics, service
+from app.cache import LRUSet
+from app.news import Article, NewsScraper, check_url, forget_content, get_fetch_state
+
+logger = logging.getLogger(__name__)
+
+FETCH_WORKERS = int(os.environ.get('SCRAPER_FETCH_WORKERS', 16))
+PARSE_WORKERS = int(os.environ.get('SCRAPER_PARSE_WORKERS', 2))
+QUEUE_SIZE = int(os.environ.get('SCRAPER_QUEUE_SIZE', 32))
+WRITE_BATCH_SOURCES = 16
+
+
+class Job:
+    """One source passing the pipeline."""
+
+    def __init__(self, scraper: NewsScraper):
+        self.scraper = scraper
+        self.started = time.perf_counter()
+        self.content: Optional[bytes] = None
+        self.articles: List[Article] = []
+        self.scraped = 0
+        self.result: Optional[int] = None
+        self.done = threading.Event()
+
+    def finish(self, result: Optional[int]) -> None:
+        """Records the number of new articles, None if the source failed."""
+        self.result = result
+        self.done.set()
+
+
+class Stage:
+    """Threads processing the jobs of a bounded queue."""
+
+    def __init__(self, name: str, workers: int, handler: Callable[[List[Job]], None], queue_size: int = QUEUE_SIZE,
+                 batch: int = 1):
+        """
+        Args:
+            name: The name of the stage in logs and metrics.
+            workers: The number of threads.
+            handler: The function processing a list of jobs; it passes them to the next stage or finishes them.
+            queue_size: The maximum number of jobs waiting for the stage.
+            batch: The maximum number of waiting jobs given to the handler at once.
+        """
+        self.name = name
+        self.workers = workers
+        self.handler = handler
+        self.batch = batch
+        self.queue: 'queue.Queue[Job]' = queue.Queue(queue_size)
+        self.processed = 0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f'pipeline-{name}-{i}', daemon=True).start()
+
+    def put(self, job: Job) -> None:
+        """Queues the job, waiting while the queue is full."""
+        self.queue.put(job)
+        depth = self.queue.qsize()
+        metrics.scraper_queue_depth.set(depth, self.name)
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+
+    def _work(self) -> None:
+        while True:
+            jobs = [self.queue.get()]
+            while len(jobs) < self.batch:
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            metrics.scraper_queue_depth.set(self.queue.qsize(), self.name)
+            start = time.perf_counter()
+            try:
+                self.handler(jobs)
+            except Exception as e:
+                for job in jobs:
+                    metrics.scraper_pages_total.inc(job.scraper.name, 'failed')
+                    logger.error(f"Scraper Errror: {job.scraper.name} : exit(){e}")
+                    job.finish(None)
+            metrics.scraper_stage_seconds.observe(time.perf_counter() - start, self.name)
+            with self._lock:
+                self.processed += len(jobs)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'workers': self.workers, 'depth': self.queue.qsize(), 'max_depth': self.max_depth,
+                    'processed': self.processed}
+
+
+class Pipeline:
+    """Fetch, parse, dedup and write stages scraping sources concurrently."""
+
+    def __init__(self, seen_urls: LRUSet, fetch_workers: int = FETCH_WORKERS, parse_workers: int = PARSE_WORKERS,
+                 queue_size: int = QUEUE_SIZE):
+        """
+        Args:
+            seen_urls: The cache of URLs known to be stored; updated with the saved ones.
+            fetch_workers: The number of fetching threads.
+            parse_workers: The number of parsing threads.
+            queue_size: The maximum number of sources waiting for every stage.
+        """
+        self.seen_urls = seen_urls
+        self._pending: Dict[NewsScraper, Job] = {}
+        self._throughput = 0.0
+        self.write = Stage('write', 1, self._write, queue_size, batch=WRITE_BATCH_SOURCES)
+        self.dedup = Stage('dedup', 1, self._dedup, queue_size)
+        self.parse = Stage('parse', parse_workers, self._parse, queue_size)
+        self.fetch = Stage('fetch', fetch_workers, self._fetch, queue_size)
+
+    def run(self, scrapers: List[NewsScraper], timeout: float) -> Dict[NewsScraper, Optional[int]]:
+        """
+        Scrapes the sources and saves their new articles.
+
+        A source still in the pipeline from an earlier call is not started again,
+        so hung sources cannot occupy all fetching threads.
+
+        Args:
+            scrapers: The scrapers to run.
+            timeout: The deadline of the whole cycle in seconds.
+
+        Returns:
+            The number of new articles saved from each scraper, None for scrapers which failed,
+            were skipped or did not finish before the deadline.
+        """
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        jobs = []
+        for scraper in scrapers:
+            previous = self._pending.get(scraper)
+            if previous is not None and not previous.done.is_set():
+                logger.warning(f"Scraper Busy: {scraper.name} is still running, skipped")
+                continue
+            logger.info(f"Scraping news using {scraper.name}")
+            job = self._pending[scraper] = Job(scraper)
+            self.fetch.put(job)
+            jobs.append(job)
+
+        results: Dict[NewsScraper, Optional[int]] = {scraper: None for scraper in scrapers}
+        for job in jobs:
+            if job.done.wait(max(0.0, deadline - time.monotonic())):
+                results[job.scraper] = job.result
+            else:
+                metrics.scraper_pages_total.inc(job.scraper.name, 'failed')
+                logger.error(f"Scraper Timeout: {job.scraper.name} did not finish within {timeout}s")
+        elapsed = time.perf_counter() - start
+        scraped = sum(job.scraped for job in jobs if job.done.is_set())
+        self._throughput = scraped / elapsed if elapsed else 0.0
+        logger.info(f"Cycle of {len(jobs)} sources took {elapsed:.2f}s ({self._throughput:.0f} articles/s), "
+                    f"queue depths: {', '.join(f'{stage.name}={stage.queue.qsize()}' for stage in self.stages)}")
+        return results
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until the sources of all earlier calls of `run` have left the pipeline.
+
+        Args:
+            timeout: The maximum wait in seconds, no limit if None.
+
+        Returns:
+            True if no source is left in the pipeline.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for job in list(self._pending.values()):
+            if not job.done.wait(None if deadline is None else max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+    @property
+    def stages(self) -> List[Stage]:
+        return [self.fetch, self.parse, self.dedup, self.write]
+
+    def stats(self) -> Dict[str, object]:
+        """Returns the counters of every stage and the scraped articles per second of the last cycle."""
+        return {'stages': {stage.name: stage.stats() for stage in self.stages}, 'articles_per_s': self._throughput}
+
+    def _fetch(self, jobs: List[Job]) -> None:
+        for job in jobs:
+            scraper = job.scraper
+            if not scraper.website_url:
+                job.articles = scraper.get_headers()
+                self.dedup.put(job)
+                continue
+            job.content = scraper.fetch(scraper.website_url)
+            if job.content is not None:
+                self.parse.put(job)
+            else:
+                job.finish(None if get_fetch_state(scraper.website_url).consecutive_errors else 0)
+
+    def _parse(self, jobs: List[Job]) -> None:
+        for job in jobs:
+            scraper = job.scraper
+            try:
+                with metrics.scraper_phase_seconds.time(scraper.name, 'parse'):
+                    job.articles = scraper.extract_articles(scraper.parse(job.content))
+            except Exception:
+                # the same content would fail again, fetch it in full next time
+                forget_content(scraper.website_url)
+                raise
+            finally:
+                job.content = None
+            metrics.scraper_pages_total.inc(scraper.name, 'parsed')
+            self.dedup.put(job)
+
+    def _dedup(self, jobs: List[Job]) -> None:
+        for job in jobs:
+            source = job.scraper.name
+            metrics.scraper_get_headers_seconds.observe(time.perf_counter() - job.started, source)
+            job.scraped = len(job.articles)
+            keys = set()
+            new_articles = []
+            for article in job.articles:
+                if not article.header or article.url in self.seen_urls:
+                    continue
+                if not article.validated and not check_url(article.url):
+                    continue
+                try:
+                    key = dedup.url_key(article.url)
+                except ValueError as e:
+                    logger.error(f"Invalid article URL {article.url!r} from {source} skipped: {e}")
+                    continue
+                if key not in keys:
+                    keys.add(key)
+                    new_articles.append(article)
+            if not new_articles:
+                logger.info(f"No new articles from {source}")
+                metrics.scraper_articles_total.inc(source, 'duplicate', amount=job.scraped)
+                job.finish(0)
+                continue
+            job.articles = new_articles
+            self.write.put(job)
+
+    def _write(self, jobs: List[Job]) -> None:
+        articles = [article for job in jobs for article in job.articles]
+        try:
+            inserted = service.save_new_articles(articles)
+        except Exception as e:
+            for job in jobs:
+                if job.scraper.website_url:
+                    forget_content(job.scraper.website_url)
+                metrics.scraper_pages_total.inc(job.scraper.name, 'failed')
+                logger.error(f"Scraper Errror: {job.scraper.name} : exit(){e}")
+                job.finish(None)
+            return
+        finally:
+            db.session.remove()
+        self.seen_urls.update(article.url for article in articles)
+        for job in jobs:
+            source = job.scraper.name
+            saved = {article.url for article in job.articles} & inserted
+            inserted -= saved
+            metrics.scraper_articles_total.inc(source, 'new', amount=len(saved))
+            metrics.scraper_articles_total.inc(source, 'duplicate', amount=job.scraped - len(saved))
+            logger.info(f"Saved {len(saved)} new articles from {source}, skipped {job.scraped - len(saved)}")
+            job.articles = []
+            job.finish(len(saved))
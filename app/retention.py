@@ -0,0 +1,204 @@
+"""
+Partitions, retention and archival of articles.
+
+The `article` table is partitioned by month of `timestamp`: partition
+`article_pYYYY_MM` holds the articles stored in that month (UTC), the default
+partition `article_default` catches articles no monthly partition covers and
+should stay empty. `ensure_partitions` creates the partitions of the current
+month and of `PARTITION_MONTHS_AHEAD` following months. `maintain` calls it
+and applies the retention; the scraper calls it daily, and so does this script
+when run directly (e.g. by cron while the scraper is stopped).
+
+PostgreSQL refuses to create a partition for rows already caught by the default
+partition, so `create_partition` first moves the articles of the month out of
+it into the new table and attaches that. `maintain` logs an error while the
+default partition still holds any articles.
+
+Old articles are removed by whole partitions, which is instant and leaves no
+dead rows for vacuum and no bloat in the indexes. With `RETENTION_DAYS` set,
+`maintain` drops the monthly partitions whose articles are all older than that;
+with `ARCHIVE_DIR` set, every partition is first written there as gzipped NDJSON
+(`article_pYYYY_MM.ndjson.gz`, one article per line). The URLs of dropped
+articles are removed from `article_url` as well.
+"""
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from app import db
+from app.model import Article
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MONTHS_AHEAD = 2
+RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', 0))
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR')
+ARCHIVE_BATCH_SIZE = 1000
+
+PARTITION_PATTERN = re.compile(r'^article_p(\d{4})_(\d{2})$')
+
+
+def month_start(moment: datetime) -> datetime:
+    """Returns the start of the month (UTC) containing the moment."""
+    moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    """Returns the start of the month `months` after the given month start."""
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f'article_p{month.year:04d}_{month.month:02d}'
+
+
+def create_partition(connection: Connection, month: datetime) -> None:
+    """
+    Creates the partition of the month unless it exists.
+
+    Articles of the month in the default partition are moved into the new partition
+    in the same transaction.
+    """
+    name = partition_name(month)
+    bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    if connection.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar() is not None:
+        return
+    parameters = {'start': month, 'end': add_months(month, 1)}
+    if connection.execute(text("SELECT to_regclass('article_default')")).scalar() is None or \
+            not connection.execute(text("SELECT EXISTS (SELECT FROM article_default "
+                                        "WHERE timestamp >= :start AND timestamp < :end)"), parameters).scalar():
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF article FOR VALUES {bounds}"))
+        return
+    # no new rows of the month may reach the default partition until the new one is attached
+    connection.execute(text("LOCK TABLE article_default IN EXCLUSIVE MODE"))
+    # the generated search vector is computed again; the URLs stay claimed, the trigger does not fire
+    columns = ', '.join(column.name for column in Article.__table__.columns if column.computed is None)
+    connection.execute(text(f"CREATE TABLE {name} (LIKE article INCLUDING DEFAULTS INCLUDING GENERATED)"))
+    moved = connection.execute(text(
+        f"WITH moved AS (DELETE FROM article_default WHERE timestamp >= :start AND timestamp < :end "
+        f"RETURNING {columns}) INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+    ), parameters).rowcount
+    connection.execute(text(f"ALTER TABLE article ATTACH PARTITION {name} FOR VALUES {bounds}"))
+    logger.warning(f"Moved {moved} articles from the default partition into {name}")
+
+
+def default_partition_rows(connection: Connection) -> int:
+    """Returns the number of articles in the default partition, which no monthly partition covers."""
+    return connection.execute(text("SELECT count(*) FROM article_default")).scalar()
+
+
+def ensure_partitions(connection: Connection, now: Optional[datetime] = None, since: Optional[datetime] = None,
+                      ahead: int = PARTITION_MONTHS_AHEAD) -> None:
+    """
+    Creates the default partition and the monthly partitions up to `ahead` months after now.
+
+    Args:
+        connection: An open DB connection.
+        now: The current time, `datetime.now()` by default.
+        since: The earliest moment to create a partition for, now by default.
+        ahead: The number of months after the current one to create partitions for.
+    """
+    now = now or datetime.now(timezone.utc)
+    connection.execute(text("CREATE TABLE IF NOT EXISTS article_default PARTITION OF article DEFAULT"))
+    month = month_start(since or now)
+    last = add_months(month_start(now), ahead)
+    while month <= last:
+        create_partition(connection, month)
+        month = add_months(month, 1)
+
+
+def list_partitions(connection: Connection) -> List[datetime]:
+    """Returns the starts of months of the monthly partitions, oldest first."""
+    names = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'article'"
+    )).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            months.append(datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc))
+    return sorted(months)
+
+
+def archive_partition(connection: Connection, month: datetime, directory: Path) -> Path:
+    """
+    Writes the articles of a monthly partition into a gzipped NDJSON file.
+
+    The file is written under a temporary name and renamed when complete.
+
+    Returns:
+        The path of the archive.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    name = partition_name(month)
+    path = directory / f'{name}.ndjson.gz'
+    partial = path.with_suffix('.gz.partial')
+    result = connection.execute(text(f"SELECT id, header, url, timestamp FROM {name} ORDER BY timestamp, id")
+                                .execution_options(yield_per=ARCHIVE_BATCH_SIZE))
+    with gzip.open(partial, 'wt', encoding='utf-8') as file:
+        for article_id, header, url, timestamp in result:
+            file.write(json.dumps({'id': article_id, 'header': header, 'url': url,
+                                   'timestamp': timestamp.isoformat()}, ensure_ascii=False) + '\n')
+    partial.rename(path)
+    return path
+
+
+def apply_retention(days: int, archive_dir: Optional[Path] = None, now: Optional[datetime] = None) -> List[str]:
+    """
+    Drops the monthly partitions whose articles are all older than `days` days.
+
+    Every partition is archived first if `archive_dir` is given, and dropped
+    in its own transaction.
+
+    Returns:
+        The names of the dropped partitions.
+    """
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=days)
+    dropped = []
+    with db.engine.connect() as connection:
+        months = list_partitions(connection)
+        connection.rollback()
+    for month in months:
+        end = add_months(month, 1)
+        if end > cutoff:
+            break
+        name = partition_name(month)
+        with db.engine.begin() as connection:
+            if archive_dir is not None:
+                logger.info(f"Archived {name} into {archive_partition(connection, month, archive_dir)}")
+            connection.execute(text(f"ALTER TABLE article DETACH PARTITION {name}"))
+            connection.execute(text(f"DROP TABLE {name}"))
+            connection.execute(text("DELETE FROM article_url WHERE timestamp < :end"), {'end': end})
+        logger.info(f"Dropped partition {name}")
+        dropped.append(name)
+    return dropped
+
+
+def maintain() -> None:
+    """Creates the upcoming partitions and applies the configured retention."""
+    with db.engine.begin() as connection:
+        ensure_partitions(connection)
+        stray = default_partition_rows(connection)
+    if stray:
+        logger.error(f"Default partition holds {stray} articles outside of the monthly partitions")
+    if RETENTION_DAYS:
+        apply_retention(RETENTION_DAYS, Path(ARCHIVE_DIR) if ARCHIVE_DIR else None)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    try:
+        maintain()
+    except Exception as e:
+        logger.error(f'Error maintaining partitions: {e}')
@@ -0,0 +1,107 @@
+"""
+Adaptive scheduling of news sources.
+
+Every source is scraped at its own interval. The interval shrinks while the
+source publishes new articles and grows while it is quiet, always within
+`MIN_INTERVAL` and `MAX_INTERVAL`. A failing source is retried with
+exponential backoff. Runs are planned at a fixed rate (the next run is
+planned from the previous planned time, not from the end of the scrape),
+with random jitter so that sources do not synchronize.
+
+`plan_next` holds the planning rules, so that the workers of `app.worker`,
+which keep the schedules in the DB, plan runs the same way.
+"""
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from app.news import NewsScraper
+
+BASE_INTERVAL = 10.0
+MIN_INTERVAL = 5.0
+MAX_INTERVAL = 300.0
+SPEEDUP = 0.5
+SLOWDOWN = 1.5
+MAX_BACKOFF = 600.0
+JITTER = 0.1
+
+
+@dataclass
+class SourceSchedule:
+    """Schedule of one source."""
+    interval: float
+    next_run: float
+    failures: int = 0
+
+
+class Scheduler:
+    """Plans runs of scrapers at intervals adapted to their publishing rate."""
+
+    def __init__(self, scrapers: List[NewsScraper], clock: Callable[[], float] = time.monotonic,
+                 rng: Callable[[], float] = random.random):
+        """
+        Args:
+            scrapers: The scrapers to schedule; all of them are due immediately.
+            clock: The source of the current time in seconds.
+            rng: The source of random numbers from [0, 1) used for jitter.
+        """
+        self.clock = clock
+        self.rng = rng
+        now = clock()
+        self.schedules: Dict[NewsScraper, SourceSchedule] = {
+            scraper: SourceSchedule(interval=BASE_INTERVAL, next_run=now) for scraper in scrapers
+        }
+
+    def due(self) -> List[NewsScraper]:
+        """Returns the scrapers whose planned run time has come."""
+        now = self.clock()
+        return [scraper for scraper, schedule in self.schedules.items() if schedule.next_run <= now]
+
+    def next_run(self) -> float:
+        """Returns the planned time of the earliest run."""
+        return min(schedule.next_run for schedule in self.schedules.values())
+
+    def record(self, scraper: NewsScraper, new_articles: Optional[int]) -> None:
+        """
+        Adapts the schedule of the scraper to the result of its run and plans the next one.
+
+        Args:
+            scraper: The scraper which has run.
+            new_articles: The number of new articles, None if the run failed.
+        """
+        plan_next(self.schedules[scraper], new_articles, self.clock(), self.rng)
+
+    def jitter(self, delay: float) -> float:
+        """Returns the delay randomly changed by at most `JITTER` of its length."""
+        return jitter(delay, self.rng)
+
+
+def jitter(delay: float, rng: Callable[[], float] = random.random) -> float:
+    """Returns the delay randomly changed by at most `JITTER` of its length."""
+    return delay * (1 + JITTER * (2 * rng() - 1))
+
+
+def plan_next(schedule: SourceSchedule, new_articles: Optional[int], now: float,
+              rng: Callable[[], float] = random.random) -> None:
+    """
+    Adapts the schedule to the result of a run and plans the next one.
+
+    Args:
+        schedule: The schedule of the source which has run; updated in place.
+        new_articles: The number of new articles, None if the run failed.
+        now: The current time in seconds, on the same clock as `schedule.next_run`.
+        rng: The source of random numbers from [0, 1) used for jitter.
+    """
+    if new_articles is None:
+        schedule.failures += 1
+        delay = min(MAX_BACKOFF, schedule.interval * 2 ** schedule.failures)
+        schedule.next_run = now + jitter(delay, rng)
+        return
+
+    schedule.failures = 0
+    if new_articles > 0:
+        schedule.interval = max(MIN_INTERVAL, schedule.interval * SPEEDUP)
+    else:
+        schedule.interval = min(MAX_INTERVAL, schedule.interval * SLOWDOWN)
+    # fixed rate: plan from the previous planned time, but never catch up with a burst of runs
+    schedule.next_run = max(schedule.next_run + jitter(schedule.interval, rng), now)
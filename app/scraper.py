@@ -2,40 +2,118 @@
 Web scraping service.
 
 This script periodically retrieves news articles from configured servers,
-extracting headers and URLs, and stores new articles in the database.
+extracting headers and URLs, and stores new articles in the database
+in batch inserts. URLs already stored are remembered in a bounded
+in-process cache (`seen_urls`), so a cycle in which nothing changed
+does not touch the DB at all.
 
-It leverages a list of scraper objects (e.g., IdnesScraper, IhnedScraper)
-to fetch articles from different news sources. Errors encountered during
-scraping are logged with details.
+It leverages a list of scraper objects, created from the declarative source
+definitions of `app.sources`, to fetch articles from different news sources.
+With `SCRAPER_SHARDS` set, every scraper process runs only the sources which
+consistent hashing assigns to its `SCRAPER_SHARD` (0 to SCRAPER_SHARDS - 1). The sources are fetched,
+parsed, deduplicated and written by the concurrent stages of `app.pipeline`, so
+one cycle takes roughly as long as its slowest stage and is cut off after
+`CYCLE_TIMEOUT` seconds.
+When run directly, each source is scraped whenever `app.scheduler.Scheduler`
+plans it, at an interval adapted to how often the source publishes.
+Errors encountered during scraping are logged with details.
+Timings and per-source counters are recorded in `app.metrics`; they are served
+at `/metrics` on `SCRAPER_METRICS_PORT` when the variable is set.
 """
 import logging
+import os
 import app.service
+from app import db, metrics, retention
+import threading
 import time
-from app.news import IdnesScraper, IhnedScraper, BbcScraper
+from typing import Dict, List, Optional
+from app.cache import LRUSet
+from app.news import NewsScraper
+from app.pipeline import Pipeline
+from app.scheduler import Scheduler
+from app.sources import load_scrapers
 
 logger = logging.getLogger(__name__)
-SCRAPERS = [IdnesScraper(), IhnedScraper(), BbcScraper()]
+SHARD = int(os.environ.get('SCRAPER_SHARD', 0))
+SHARDS = int(os.environ.get('SCRAPER_SHARDS', 1))
+SCRAPERS = load_scrapers(shard=SHARD, shards=SHARDS)
 
-def scrape_news():
+CYCLE_TIMEOUT = 30
+SEEN_URLS_CAPACITY = 200_000
+MAINTENANCE_INTERVAL = 24 * 60 * 60
+METRICS_PORT = int(os.environ.get('SCRAPER_METRICS_PORT', 0))
+
+seen_urls = LRUSet(SEEN_URLS_CAPACITY)
+_pipeline: Optional[Pipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def warm_seen_urls() -> None:
+    """Fills the seen-URL cache with URLs of the most recently stored articles."""
+    try:
+        urls = app.service.get_recent_urls(SEEN_URLS_CAPACITY)
+    finally:
+        # do not keep the read transaction open while cycles without new articles skip the DB
+        db.session.remove()
+    seen_urls.update(reversed(urls))
+    logger.info(f"Seen-URL cache warmed with {len(urls)} URLs")
+
+
+def get_pipeline() -> Pipeline:
+    """Returns the scraping pipeline, starting its threads on first use."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = Pipeline(seen_urls)
+        return _pipeline
+
+
+def scrape_news(scrapers: Optional[List[NewsScraper]] = None,
+                timeout: float = CYCLE_TIMEOUT) -> Dict[NewsScraper, Optional[int]]:
     """Gets articles from news servers and saves new ones into our DB.    
 
+    The sources pass the stages of `app.pipeline.Pipeline` concurrently.
     Logs informational messages about scraping and errors encountered
     with individual scrapers. Handles scraper errors gracefully,
     allowing continued operation
+
+    Args:
+        scrapers: The scrapers to run, all `SCRAPERS` by default.
+        timeout: The deadline of the whole cycle in seconds.
+
+    Returns:
+        The number of new articles saved from each scraper, None for scrapers which failed.
     """
-    for scraper in SCRAPERS:
-        logger.info(f"Scraping news using {type(scraper).__name__}")   
-        try:   
-            articles = scraper.get_headers()
-            for article in articles:
-                app.service.save_article_if_new(article)
-        except Exception as e:
-            logger.error(f"Scraper Errror: {type(scraper).__name__} : exit(){e}")
+    scrapers = SCRAPERS if scrapers is None else scrapers
+    return get_pipeline().run(scrapers, timeout)
+
+
+def maintain_partitions() -> None:
+    """Creates upcoming partitions of the article table and applies the retention (see `app.retention`)."""
+    try:
+        retention.maintain()
+    except Exception as e:
+        logger.error(f"Partition maintenance error: {e}")
+
+
+def run(scheduler: Scheduler) -> None:
+    """Scrapes the sources whenever the scheduler plans them, forever; maintains partitions daily."""
+    next_maintenance = time.monotonic()
+    while True:
+        if time.monotonic() >= next_maintenance:
+            maintain_partitions()
+            next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+        due = scheduler.due()
+        if due:
+            for scraper, new_articles in scrape_news(due).items():
+                scheduler.record(scraper, new_articles)
+        time.sleep(max(0.0, scheduler.next_run() - time.monotonic()))
 
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, format='{asctime} {levelname:<8} {name}:{module}:{lineno} - {message}', style='{')    
 
-    while True:
-        scrape_news()
-        time.sleep(10)
\ No newline at end of file
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+    warm_seen_urls()
+    run(Scheduler(SCRAPERS))
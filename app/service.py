@@ -3,38 +3,297 @@ Service layer for managing articles.
 
 This module provides functions to interact with articles in the application.
 It utilizes the database session (`session`) from `app.db` and the `Article` model from `app.model`.
+The search and the save path have async counterparts (`*_async`) executing the same statements
+by the async engine of `app.db`, so a coroutine can keep many of them in flight.
+The searches, the estimate and the ingest generation are read by `db.read_session`, so they are
+served by a read replica when one is configured; the feed (`get_articles_since`, `get_watermark`)
+and everything which writes use the primary, since the feed is woken by commits on the primary.
+The duration of the calls is recorded in `app.metrics.service_call_seconds`.
 """
 import logging
-from typing import List
-from app.model import Article
-from app import db
-from sqlalchemy import or_
-from app.news import check_url
+import re
+from datetime import datetime
+from functools import reduce
+from typing import TYPE_CHECKING, Iterator, List, Optional, Set, Tuple
+from app.model import SEARCH_CONFIGS, Article, ArticleUrl, IngestGeneration
+from app import db, dedup, metrics
+from sqlalchemy import Executable, Row, Select, Text, cast, func, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import REGCONFIG, Insert, insert
+from app.urls import check_url
+
+if TYPE_CHECKING:
+    # the scraping stack is not needed to save articles, only their type
+    from app import news
+
 logger = logging.getLogger(__name__)
 
+SEARCH_ORDERS = ('newest', 'relevance')
+STREAM_BATCH_SIZE = 500
+WORD_PATTERN = re.compile(r'\w+')
+INGEST_CHANNEL = 'article_ingest'
+# the columns of searched articles; plain rows are much cheaper than ORM objects in the identity map
+ARTICLE_COLUMNS = (Article.id, Article.timestamp, Article.header, Article.url)
+LEXEME_PATTERN = re.compile(r"'((?:[^']|'')*)'")
+
+
+def search_query(keywords: List[str]):
+    """
+    Builds a full-text query matching headers which contain at least one keyword.
+
+    Every word of a keyword is matched as a word prefix without diacritics, so the keyword
+    matches also inflected forms common in Czech ("babiš" matches "Babišovi"). All words
+    of one keyword have to match, keywords are combined by OR.
 
-def get_articles_with_keywords(keywords: List[str]) -> List[Article]:
+    Args:
+      keywords: A list of keywords to search for.
+
+    Returns:
+        A `tsquery` SQL expression, or None if the keywords contain no words.
+    """
+    queries = []
+    for keyword in keywords:
+        words = WORD_PATTERN.findall(keyword)
+        if not words:
+            continue
+        for config in SEARCH_CONFIGS:
+            queries.append(reduce(lambda a, b: a.op('&&')(b), [word_query(word, config) for word in words]))
+    if not queries:
+        return None
+    return reduce(lambda a, b: a.op('||')(b), queries)
+
+
+def word_query(word: str, config: str):
+    """
+    Builds a `tsquery` matching the word as a prefix without diacritics.
+
+    The unaccented word is quoted as a literal before `:*` is appended, so no user input
+    (nor anything `unaccent` turns it into) can be parsed as `tsquery` syntax.
+
+    Args:
+      word: The word to search for.
+      config: The text search configuration.
+    """
+    prefix = func.quote_literal(func.f_unaccent(word)).concat(':*')
+    return func.to_tsquery(cast(config, REGCONFIG), prefix)
+
+
+def search_articles(keywords: List[str], order: str = 'newest', limit: Optional[int] = None,
+                    after: Optional[Tuple[datetime, int]] = None,
+                    newer_than: Optional[datetime] = None) -> Optional[Select]:
+    """
+    Builds a statement selecting the `ARTICLE_COLUMNS` of articles containing at least one keyword.
+
+    The statement is executed by `get_articles_with_keywords` and its async counterpart alike;
+    see it for the arguments.
+
+    Returns:
+        The statement, or None if no article can match.
+    """
+    if order not in SEARCH_ORDERS:
+        raise ValueError(f"Order has to be one of: {', '.join(SEARCH_ORDERS)}.")
+    if after is not None and order != 'newest':
+        raise ValueError("Cursor can be used only with the 'newest' order.")
+
+    query = search_query(keywords) if keywords else None
+    if query is None:
+        return None
+
+    statement = select(*ARTICLE_COLUMNS).where(Article.search_vector.op('@@')(query))
+    if newer_than is not None:
+        statement = statement.where(Article.timestamp >= newer_than)
+    if after is not None:
+        statement = statement.where(tuple_(Article.timestamp, Article.id) < tuple_(*after))
+    if order == 'relevance':
+        statement = statement.order_by(func.ts_rank(Article.search_vector, query).desc(), Article.id.desc())
+    else:
+        statement = statement.order_by(Article.timestamp.desc(), Article.id.desc())
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+@metrics.timed(metrics.service_call_seconds)
+def get_articles_with_keywords(keywords: List[str], order: str = 'newest', limit: Optional[int] = None,
+                               after: Optional[Tuple[datetime, int]] = None,
+                               newer_than: Optional[datetime] = None) -> List[Row]:
     """
     Fetches articles containing at least one keyword from the database.
 
-    This function searches for articles whose headers contain at least one of the provided keywords.
-    Articles are retrieved in descending order of their timestamps (newest first).
+    This function searches for articles whose headers contain at least one of the provided keywords
+    using the full-text index (see `search_query`).
+    Articles are retrieved in descending order of their timestamps (newest first),
+    or by relevance of their headers to the keywords.
 
     Args:
       keywords: A list of keywords to search for.
+      order: 'newest' or 'relevance'.
+      limit: The maximum number of articles to return, no limit if None.
+      after: The (timestamp, id) key of the last article of the previous page; only articles
+        older than it are returned. Can be used only with the 'newest' order.
+      newer_than: Only articles stored since this moment are searched, so only the recent
+        partitions of the table are scanned; all articles if None.
 
     Returns:
-        A list of articles matching the criteria.
+        A list of rows with the `id`, `timestamp`, `header` and `url` of the matching articles.
         If no keywords are provided, an empty list is returned.
     """
-    if not keywords: 
+    statement = search_articles(keywords, order, limit, after, newer_than)
+    return db.read_session.execute(statement).all() if statement is not None else []
+
+
+@metrics.timed(metrics.service_call_seconds)
+async def get_articles_with_keywords_async(keywords: List[str], order: str = 'newest', limit: Optional[int] = None,
+                                           after: Optional[Tuple[datetime, int]] = None,
+                                           newer_than: Optional[datetime] = None) -> List[Row]:
+    """
+    Fetches articles containing at least one keyword by the async engine (see `db.get_async_engine`).
+
+    Runs the same statement as `get_articles_with_keywords`, see it for the arguments and the result.
+    """
+    statement = search_articles(keywords, order, limit, after, newer_than)
+    if statement is None:
         return []
-    
-    conditions = [Article.header.like(f"%{keyword}%") for keyword in keywords]  
-    query = db.session.query(Article).order_by(Article.timestamp.desc()).filter(or_(*conditions))    
-    return query.all()
+    async with db.async_session() as session:
+        return (await session.execute(statement)).all()
+
+
+def iter_articles_with_keywords(keywords: List[str], order: str = 'newest', limit: Optional[int] = None,
+                                after: Optional[Tuple[datetime, int]] = None,
+                                newer_than: Optional[datetime] = None,
+                                batch_size: int = STREAM_BATCH_SIZE) -> Iterator[Row]:
+    """
+    Streams articles containing at least one keyword from the database.
+
+    Works as `get_articles_with_keywords`, but the articles are read from a server-side
+    cursor in batches of `batch_size`, so memory use does not grow with the number of matches.
+    """
+    statement = search_articles(keywords, order, limit, after, newer_than)
+    if statement is None:
+        return iter([])
+    return stream_statement(statement.execution_options(yield_per=batch_size))
+
+
+def stream_statement(statement: Select) -> Iterator:
+    """
+    Executes the statement once iterated and yields its rows.
+
+    The server-side cursor is closed when the iteration ends, even if the rows were not fully read.
+    """
+    result = db.read_session.execute(statement)
+    try:
+        yield from result
+    finally:
+        result.close()
+
+
+@metrics.timed(metrics.service_call_seconds)
+def get_query_lexemes(word: str) -> List[List[str]]:
+    """
+    Returns the lexemes which the prefix query of the word (see `word_query`) matches.
+
+    Args:
+      word: A word of a keyword.
+
+    Returns:
+        For every configuration of `SEARCH_CONFIGS`, the lexemes which all have to be
+        matched as prefixes; empty if the configuration ignores the word (a stop word).
+    """
+    row = db.read_session.execute(select(*[cast(word_query(word, config), Text) for config in SEARCH_CONFIGS])).one()
+    return [[lexeme.replace("''", "'") for lexeme in LEXEME_PATTERN.findall(query)] for query in row]
+
+
+def iter_index_rows(since: Optional[Tuple[datetime, int]] = None,
+                    batch_size: int = STREAM_BATCH_SIZE) -> Iterator[Tuple[int, datetime, str, str, List[str]]]:
+    """
+    Streams articles with the lexemes of their search vectors, oldest first.
+
+    Args:
+      since: Only articles after this (timestamp, id) key are returned, all if None.
+      batch_size: The number of rows read from the server-side cursor at once.
+
+    Returns:
+        Tuples of id, timestamp, header, URL and lexemes.
+    """
+    statement = select(Article.id, Article.timestamp, Article.header, Article.url,
+                       func.tsvector_to_array(Article.search_vector))
+    if since is not None:
+        statement = statement.where(Article.timestamp >= since[0], tuple_(Article.timestamp, Article.id) > tuple_(*since))
+    statement = statement.order_by(Article.timestamp, Article.id).execution_options(yield_per=batch_size)
+    result = db.read_session.execute(statement)
+    try:
+        for row in result:
+            yield tuple(row)
+    finally:
+        result.close()
+
+
+@metrics.timed(metrics.service_call_seconds)
+def estimate_articles_with_keywords(keywords: List[str], newer_than: Optional[datetime] = None) -> int:
+    """
+    Estimates the number of articles containing at least one keyword.
+
+    The estimate is the row count expected by the query planner, so it costs no scan
+    of the matching articles, but it can differ from the exact count.
+
+    Args:
+      keywords: A list of keywords to search for.
+      newer_than: Only articles stored since this moment are counted; all articles if None.
+
+    Returns:
+        The estimated number of matching articles.
+    """
+    query = search_query(keywords) if keywords else None
+    if query is None:
+        return 0
+
+    statement = select(Article.id).where(Article.search_vector.op('@@')(query))
+    if newer_than is not None:
+        statement = statement.where(Article.timestamp >= newer_than)
+    compiled = statement.compile(dialect=db.engine.dialect)
+    plan = db.read_session.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+@metrics.timed(metrics.service_call_seconds)
+def get_articles_since(keywords: List[str], since: Optional[Tuple[datetime, int]], limit: int) -> List[Row]:
+    """
+    Fetches articles stored after the watermark, oldest first.
+
+    The watermark is the (timestamp, id) key of the last article a client has seen. Writers
+    insert articles only while holding the generation lock (see `generation_lock`) and stamp
+    them with the time of the insert, so articles committed later always sort after the
+    watermark, however many writers overlap; the range is read from the `timestamp` index.
+
+    Args:
+      keywords: Only articles containing at least one keyword are returned; all articles if empty.
+      since: The watermark, all articles if None.
+      limit: The maximum number of articles to return.
+
+    Returns:
+        Rows of `ARTICLE_COLUMNS` of the articles in ascending order of (timestamp, id).
+    """
+    statement = db.session.query(*ARTICLE_COLUMNS)
+    if keywords:
+        query = search_query(keywords)
+        if query is None:
+            return []
+        statement = statement.filter(Article.search_vector.op('@@')(query))
+    if since is not None:
+        statement = statement.filter(Article.timestamp >= since[0],
+                                     tuple_(Article.timestamp, Article.id) > tuple_(*since))
+    return statement.order_by(Article.timestamp, Article.id).limit(limit).all()
+
 
+@metrics.timed(metrics.service_call_seconds)
+def get_watermark() -> Optional[Tuple[datetime, int]]:
+    """
+    Returns the (timestamp, id) key of the newest stored article, None if there is none.
+    """
+    row = db.session.query(Article.timestamp, Article.id).order_by(Article.timestamp.desc(), Article.id.desc()).first()
+    return (row.timestamp, row.id) if row else None
 
+
+@metrics.timed(metrics.service_call_seconds)
 def save_article_if_new(article: Article) -> None:    
     """
     Saves an article if it's not already in the database based on URL.
@@ -48,17 +307,191 @@ def save_article_if_new(article: Article) -> None:
     if not article.url or not article.header:
         return   
     
-    if check_url(article.url)!=True:
+    # scraped articles (`news.Article`) had their URL checked on extraction
+    if not getattr(article, 'validated', False) and check_url(article.url)!=True:
         return
 
     try:                
-        existing_article = db.session.query(Article).filter_by(url=article.url).first()
+        existing_url = db.session.get(ArticleUrl, dedup.url_key(article.url))
 
-        if not existing_article:
+        if not existing_url:
+            db.session.execute(generation_lock())
             new_article = Article(header=article.header, url=article.url)
             db.session.add(new_article)
+            bump_generation()
             db.session.commit()
     except Exception as e:
         logger.error(f"Error saving article: {e}")
         
-        db.session.close()
\ No newline at end of file
+        db.session.close()
+
+
+@metrics.timed(metrics.service_call_seconds)
+def save_articles(articles: List['news.Article']) -> Tuple[int, int]:
+    """
+    Saves new articles in one transaction, skipping those already in the database.
+
+    Args:
+        articles: The scraped articles to save.
+
+    Returns:
+        A tuple of the number of inserted and skipped articles.
+
+    Raises:
+        Exception: Any DB error; the transaction is rolled back.
+    """
+    inserted = len(save_new_articles(articles))
+    return inserted, len(articles) - inserted
+
+
+def save_new_articles(articles: List['news.Article']) -> Set[str]:
+    """
+    Saves new articles in one transaction and returns the URLs of those inserted.
+
+    Invalid articles (missing header or invalid URL, unless `validated`) and repeated canonical URLs
+    are dropped first, and with `dedup.NEAR_DUPLICATES` also headlines nearly equal
+    to a recently stored one. The rest is written by a single multi-row `INSERT`.
+    Articles whose canonical URL is already stored are skipped by the database
+    (see `model.CLAIM_URL_FUNCTION`), so the uniqueness is enforced across all partitions.
+
+    The insert waits for the generation lock held by concurrent writers until they commit
+    (see `generation_lock`). If any article is inserted, the ingest generation is increased
+    in the same transaction.
+
+    Args:
+        articles: The scraped articles to save, possibly of several sources.
+
+    Returns:
+        The URLs of the inserted articles.
+
+    Raises:
+        Exception: Any DB error; the transaction is rolled back.
+    """
+    statement = insert_articles(articles)
+    if statement is None:
+        return set()
+    try:
+        db.session.execute(generation_lock())
+        inserted = db.session.execute(statement).all()
+        if inserted:
+            bump_generation()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return record_inserted(inserted)
+
+
+@metrics.timed(metrics.service_call_seconds)
+async def save_articles_async(articles: List['news.Article']) -> Tuple[int, int]:
+    """
+    Saves new articles in one transaction by the async engine (see `db.get_async_engine`).
+
+    Works as `save_articles`.
+    """
+    inserted = len(await save_new_articles_async(articles))
+    return inserted, len(articles) - inserted
+
+
+async def save_new_articles_async(articles: List['news.Article']) -> Set[str]:
+    """
+    Saves new articles in one transaction by the async engine and returns the URLs of those inserted.
+
+    Runs the same statements as `save_new_articles`, see it for the details.
+    """
+    statement = insert_articles(articles)
+    if statement is None:
+        return set()
+    async with db.async_session() as session, session.begin():
+        await session.execute(generation_lock())
+        inserted = (await session.execute(statement)).all()
+        if inserted:
+            for generation_statement in generation_statements():
+                await session.execute(generation_statement)
+    return record_inserted(inserted)
+
+
+def insert_articles(articles: List['news.Article']) -> Optional[Insert]:
+    """
+    Builds the multi-row `INSERT` of the articles worth saving, returning the URL and header of inserted rows.
+
+    Invalid articles (including URLs `dedup.url_key` cannot parse, which are logged) and repeated
+    canonical URLs are dropped, and with `dedup.NEAR_DUPLICATES` also near-duplicate headlines
+    (see `save_new_articles`).
+
+    Returns:
+        The statement, or None if no article is left.
+    """
+    rows = {}
+    for article in articles:
+        if not article.header or not (article.validated or check_url(article.url)):
+            continue
+        try:
+            key = dedup.url_key(article.url)
+        except ValueError as e:
+            # one unparsable URL must not fail the whole batch
+            logger.error(f"Invalid article URL {article.url!r} skipped: {e}")
+            continue
+        if key not in rows and not (dedup.NEAR_DUPLICATES and dedup.near_duplicates.contains(article.header)):
+            rows[key] = {'header': article.header, 'url': article.url, 'url_key': key}
+    if not rows:
+        return None
+    return insert(Article).values(list(rows.values())).returning(Article.url, Article.header)
+
+
+def record_inserted(inserted: List[Row]) -> Set[str]:
+    """Adds the headers of the inserted rows to the near-duplicate index if enabled and returns their URLs."""
+    if dedup.NEAR_DUPLICATES:
+        dedup.near_duplicates.add([header for _, header in inserted])
+    return {url for url, _ in inserted}
+
+
+@metrics.timed(metrics.service_call_seconds)
+def get_recent_urls(limit: int) -> List[str]:
+    """
+    Fetches URLs of the most recently stored articles.
+
+    Args:
+        limit: The maximum number of URLs to return.
+
+    Returns:
+        URLs of articles in descending order of their timestamps (newest first).
+    """
+    query = db.session.query(Article.url).order_by(Article.timestamp.desc()).limit(limit)
+    return [url for url, in query]
+
+
+def bump_generation() -> None:
+    """
+    Increases the ingest generation within the current transaction.
+
+    Listeners of `INGEST_CHANNEL` are notified once the transaction commits.
+    """
+    for statement in generation_statements():
+        db.session.execute(statement)
+
+
+def generation_lock() -> Select:
+    """
+    Returns the statement locking the ingest generation row until the end of the transaction.
+
+    Every writer executes it before inserting articles, so writers commit one at a time in the
+    order of their inserts; with the insert time as `Article.timestamp`, an article committed
+    later never sorts before one already visible, which the watermarks of the feed and of the
+    keyword index rely on.
+    """
+    return select(IngestGeneration.value).where(IngestGeneration.id == 1).with_for_update()
+
+
+def generation_statements() -> List[Executable]:
+    """Returns the statements increasing the ingest generation and notifying `INGEST_CHANNEL`."""
+    return [update(IngestGeneration).where(IngestGeneration.id == 1).values(value=IngestGeneration.value + 1),
+            text(f"NOTIFY {INGEST_CHANNEL}")]
+
+
+@metrics.timed(metrics.service_call_seconds)
+def get_generation() -> int:
+    """
+    Returns the ingest generation, which changes whenever new articles are stored.
+    """
+    return db.read_session.query(IngestGeneration.value).filter_by(id=1).scalar() or 0
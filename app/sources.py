@@ -0,0 +1,202 @@
+"""
+Declarative news sources.
+
+A source is defined by data instead of a `NewsScraper` subclass:
+
+- `name`: unique name of the source in logs and metrics,
+- `url`: the front page,
+- `item`: CSS selector of the elements holding one article each,
+- `link`: CSS selector of the link within an item, the item itself if empty,
+- `headline`: CSS selector of the headline within an item, the item itself if empty,
+- `url_rule`: `join` resolves relative links against the front page, `keep` keeps them as they are,
+- `strainer`: optional `{"name": ..., "attrs": {...}}` of the elements kept while parsing
+  (see `NewsScraper.parse_only`); a `class` attribute matches one of the element's classes.
+
+`DeclarativeScraper` compiles the selectors of a definition once and extracts
+the articles of any source with the same code. The definitions are loaded
+by `load_scrapers` from `SOURCES_FILE` (a JSON list, `SCRAPER_SOURCES` overrides
+the path) and from the `app.sources` entry point group, whose entries are lists
+of definitions or functions returning them. An entry `{"class": "module.Class"}`
+adds a custom `NewsScraper` subclass instead.
+
+With many sources, several scraper processes can share them: `shard` keeps the
+sources which a consistent-hash ring (`HashRing`) assigns to one of the processes,
+so adding or removing a process moves only the sources of its share.
+"""
+import hashlib
+import importlib
+import json
+import logging
+import os
+import re
+from bisect import bisect
+from dataclasses import dataclass, field
+from importlib.metadata import entry_points
+from pathlib import Path
+from typing import Iterable, List, Optional
+from urllib.parse import urljoin
+import soupsieve
+from bs4 import BeautifulSoup, SoupStrainer
+from app.news import Article, NewsScraper, check_url
+
+logger = logging.getLogger(__name__)
+
+SOURCES_FILE = Path(os.environ.get('SCRAPER_SOURCES', Path(__file__).parent / 'sources.json'))
+ENTRY_POINT_GROUP = 'app.sources'
+URL_RULES = ('join', 'keep')
+RING_REPLICAS = 100
+
+
+@dataclass(frozen=True)
+class SourceDefinition:
+    """Declarative definition of a news source."""
+    name: str
+    url: str
+    item: str
+    link: str = ''
+    headline: str = ''
+    url_rule: str = 'join'
+    strainer: Optional[dict] = field(default=None, hash=False, compare=False)
+
+    def __post_init__(self):
+        if self.url_rule not in URL_RULES:
+            raise ValueError(f"Source {self.name}: URL rule has to be one of: {', '.join(URL_RULES)}.")
+        if not check_url(self.url):
+            raise ValueError(f"Source {self.name}: invalid URL {self.url}.")
+
+
+def compile_strainer(strainer: Optional[dict]) -> Optional[SoupStrainer]:
+    """Builds the `SoupStrainer` of a definition."""
+    if not strainer:
+        return None
+    attrs = dict(strainer.get('attrs', {}))
+    # the strainer sees the raw class attribute, which can hold more classes
+    if isinstance(attrs.get('class'), str):
+        attrs['class'] = re.compile(rf"(^|\s){re.escape(attrs['class'])}(\s|$)")
+    return SoupStrainer(strainer.get('name'), attrs=attrs)
+
+
+class DeclarativeScraper(NewsScraper):
+    """Scraper of a source given by a `SourceDefinition`."""
+
+    def __init__(self, definition: SourceDefinition):
+        self.definition = definition
+        self.website_url = definition.url
+        self.parse_only = compile_strainer(definition.strainer)
+        self._item = soupsieve.compile(definition.item)
+        self._link = soupsieve.compile(definition.link) if definition.link else None
+        self._headline = soupsieve.compile(definition.headline) if definition.headline else None
+
+    @property
+    def name(self) -> str:
+        return self.definition.name
+
+    def get_headers(self) -> List[Article]:
+        """
+        Scrapes article headers and URLs from the source's front page.
+
+        Returns:
+            A list of articles (Article class) containing headers and URLs.
+        """
+        soup = self.get_soup(self.website_url)
+        articles = self.extract_articles(soup) if soup else []
+        logger.info(f"Articles from {self.website_url}: {len(articles)}")
+        return articles
+
+    def extract_articles(self, soup: BeautifulSoup) -> List[Article]:
+        """Extracts articles from the parsed front page by the definition's selectors."""
+        articles = []
+        for item in self._item.select(soup):
+            link = self._link.select_one(item) if self._link else item
+            headline = self._headline.select_one(item) if self._headline else item
+            href = link.get('href') if link is not None else None
+            header = headline.text.strip() if headline is not None else ''
+            if not href or not header:
+                continue
+            url = urljoin(self.website_url + '/', href) if self.definition.url_rule == 'join' else href
+            if check_url(url):
+                articles.append(Article(header=header, url=url, validated=True))
+        return articles
+
+
+def create_scraper(entry: dict) -> NewsScraper:
+    """
+    Creates the scraper of one configuration entry.
+
+    Raises:
+        ValueError: If the entry is not a valid definition.
+    """
+    if 'class' in entry:
+        module, _, name = entry['class'].rpartition('.')
+        return getattr(importlib.import_module(module), name)()
+    try:
+        return DeclarativeScraper(SourceDefinition(**entry))
+    except TypeError as e:
+        raise ValueError(f"Invalid source definition {entry}: {e}")
+
+
+def load_entries(path: Optional[Path] = SOURCES_FILE) -> List[dict]:
+    """Returns the source definitions of the file and of the entry points."""
+    entries = []
+    if path is not None and path.exists():
+        entries.extend(json.loads(path.read_text()))
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        loaded = entry_point.load()
+        entries.extend(loaded() if callable(loaded) else loaded)
+    return entries
+
+
+def load_scrapers(entries: Optional[Iterable[dict]] = None, shard: int = 0, shards: int = 1) -> List[NewsScraper]:
+    """
+    Creates the scrapers of the configured sources which belong to the shard.
+
+    Args:
+        entries: The source definitions, `load_entries()` by default.
+        shard: The index of this process among the scraper processes.
+        shards: The number of scraper processes.
+
+    Raises:
+        ValueError: If a definition is invalid or two sources have the same name.
+    """
+    scrapers = [create_scraper(entry) for entry in (load_entries() if entries is None else entries)]
+    names = [scraper.name for scraper in scrapers]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate sources: {', '.join(sorted(duplicates))}.")
+    return shard_scrapers(scrapers, shard, shards)
+
+
+def hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring assigning keys to nodes."""
+
+    def __init__(self, nodes: Iterable[str], replicas: int = RING_REPLICAS):
+        """
+        Args:
+            nodes: The names of the nodes.
+            replicas: The number of points of every node on the ring; more points spread keys more evenly.
+        """
+        self._ring = sorted((hash_key(f'{node}#{i}'), node) for node in nodes for i in range(replicas))
+        self._points = [point for point, _ in self._ring]
+        if not self._ring:
+            raise ValueError("Ring needs at least one node.")
+
+    def node(self, key: str) -> str:
+        """Returns the node the key is assigned to."""
+        return self._ring[bisect(self._points, hash_key(key)) % len(self._ring)][1]
+
+
+def shard_scrapers(scrapers: List[NewsScraper], shard: int, shards: int) -> List[NewsScraper]:
+    """Returns the scrapers whose source names the ring of `shards` nodes assigns to `shard`."""
+    if not 0 <= shard < shards:
+        raise ValueError(f"Shard has to be from 0 to {shards - 1}.")
+    if shards == 1:
+        return scrapers
+    ring = HashRing(str(i) for i in range(shards))
+    kept = [scraper for scraper in scrapers if ring.node(scraper.name) == str(shard)]
+    logger.info(f"Shard {shard} of {shards} scrapes {len(kept)} of {len(scrapers)} sources: "
+                f"{', '.join(scraper.name for scraper in kept) or '-'}")
+    return kept
@@ -1,6 +1,15 @@
 import pytest
+from datetime import datetime
+import gzip
+import json
+import threading
+import time
+from unittest.mock import patch
 from app.api import app
-from app import api
+from app import api, db, news, service
+from app.model import Article
+from app.notifications import IngestListener
+from app.tests.config import session, clear_data
 
 
 def test_find_articles_invalid_data():
@@ -25,11 +34,9 @@ from pytest import fixture  # Assuming you haven't imported it already
 @pytest.fixture
 def client():
     # Create a test client for your Flask app
-    """
-    app.run(debug=True)
-    with app.find_articles() as client:
+    api.result_cache.clear()
+    with app.test_client() as client:
         yield client
-    """
 
 def test_find_articles_valid_request(client):
   """Tests finding articles with valid keywords."""
@@ -38,3 +45,245 @@ def test_find_articles_valid_request(client):
   #response = client.post('/articles/find', json=data)
   #assert response.status_code == 200
   #assert response.json['articles']  # Check if 'articles' key exists
+
+
+def add_articles(count):
+    for i in range(count):
+        db.session.add(Article(header=f'Dog number {i}', url=f'https://example.com/{i}'))
+    db.session.commit()
+
+
+def test_find_articles_pages(client, session, clear_data):
+    add_articles(5)
+
+    response = client.post('/articles/find', json={'keywords': ['dog'], 'limit': 2})
+    assert response.status_code == 200
+    assert [a['text'] for a in response.json['articles']] == ['Dog number 4', 'Dog number 3'], "Newest articles should be first"
+
+    seen = [a['url'] for a in response.json['articles']]
+    while response.json['next_cursor']:
+        response = client.post('/articles/find', json={'keywords': ['dog'], 'limit': 2, 'cursor': response.json['next_cursor']})
+        assert response.status_code == 200
+        seen += [a['url'] for a in response.json['articles']]
+    assert len(seen) == 5 and len(set(seen)) == 5, "Pages should return every article exactly once"
+
+
+def test_find_articles_count(client, session, clear_data):
+    add_articles(3)
+    response = client.post('/articles/find', json={'keywords': ['dog'], 'count': True})
+    assert response.status_code == 200
+    assert response.json['next_cursor'] is None, "Last page should have no cursor"
+    assert isinstance(response.json['total_estimate'], int), "Estimate should be returned"
+
+
+def test_find_articles_invalid_paging(client):
+    for data in [{'keywords': ['dog'], 'limit': 0},
+                 {'keywords': ['dog'], 'limit': api.MAX_PAGE_SIZE + 1},
+                 {'keywords': ['dog'], 'limit': '10'},
+                 {'keywords': ['dog'], 'cursor': 'invalid'},
+                 {'keywords': ['dog'], 'cursor': 1},
+                 {'keywords': ['dog'], 'order': 'relevance', 'cursor': api.encode_cursor(Article(id=1, timestamp=datetime.now()))}]:
+        response = client.post('/articles/find', json=data)
+        assert response.status_code == 422, f"Invalid paging {data} should be rejected"
+
+
+def test_find_articles_stream_json(client, session, clear_data):
+    add_articles(250)
+    with client.post('/articles/find?stream=json', json={'keywords': ['dog']}) as response:
+        assert response.status_code == 200
+        assert response.mimetype == 'application/json'
+        assert len(response.json['articles']) == 250, "Streamed response should not be paged"
+        assert response.json['articles'][0]['text'] == 'Dog number 249', "Newest articles should be first"
+
+
+def test_find_articles_stream_ndjson(client, session, clear_data):
+    add_articles(3)
+    with client.post('/articles/find', json={'keywords': ['dog'], 'limit': 2},
+                     headers={'Accept': 'application/x-ndjson'}) as response:
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line)['text'] for line in lines] == ['Dog number 2', 'Dog number 1'], "Limit should apply to stream"
+
+    with client.post('/articles/find?stream=ndjson', json={'keywords': ['cat']}) as response:
+        assert response.get_data(as_text=True) == '', "No matches should stream nothing"
+
+
+def test_find_articles_stream_invalid(client):
+    response = client.post('/articles/find?stream=xml', json={'keywords': ['dog']})
+    assert response.status_code == 422
+
+
+def test_find_articles_stream_not_accepted(client, session, clear_data):
+    add_articles(1)
+    response = client.post('/articles/find', json={'keywords': ['dog']},
+                           headers={'Accept': 'application/x-ndjson;q=0'})
+    assert response.status_code == 200
+    assert 'next_cursor' in response.json, "NDJSON with zero quality should not be streamed"
+
+
+def test_find_articles_compression(client, session, clear_data):
+    add_articles(50)
+    plain = client.post('/articles/find', json={'keywords': ['dog']})
+    assert 'Content-Encoding' not in plain.headers, "Response should not be compressed unless accepted"
+    assert 'Accept-Encoding' in plain.headers['Vary'], "Response should vary by Accept-Encoding"
+
+    response = client.post('/articles/find', json={'keywords': ['dog']}, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(response.data) < len(plain.data), "Compressed body should be smaller"
+    assert json.loads(gzip.decompress(response.data)) == plain.json, "Compressed body should hold the same articles"
+
+    response = client.post('/articles/find', json={'keywords': ['dog'], 'limit': 1}, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers, "Short body should not be compressed"
+
+
+def test_find_articles_cache(client, session, clear_data, monkeypatch):
+    monkeypatch.setattr(api, 'GENERATION_CHECK_INTERVAL', 0)
+    service.save_articles([news.Article(header='Dog one', url='https://example.com/1')])
+
+    hits = api.result_cache.stats()['hits']
+    response = client.post('/articles/find', json={'keywords': ['dog', 'Dog']})
+    response = client.post('/articles/find', json={'keywords': ['DOG']})
+    assert len(response.json['articles']) == 1
+    assert api.result_cache.stats()['hits'] == hits + 1, "Normalized keywords should hit the cache"
+
+    service.save_articles([news.Article(header='Dog two', url='https://example.com/2')])
+    response = client.post('/articles/find', json={'keywords': ['dog']})
+    assert len(response.json['articles']) == 2, "New articles should invalidate the cache"
+
+    response = client.get('/articles/cache')
+    assert response.status_code == 200
+    assert response.json['invalidations'] >= 1
+
+
+def test_metrics(client, session, clear_data):
+    client.post('/articles/find', json={'keywords': ['metrics']})
+
+    response = client.get('/metrics')
+    assert response.status_code == 200, "Metrics should be available"
+    assert response.content_type.startswith('text/plain'), "Metrics should be in the Prometheus text format"
+    text = response.get_data(as_text=True)
+    assert 'api_request_seconds_count{endpoint="find_articles",status="200"}' in text, "Requests should be timed"
+    assert 'service_call_seconds_count{function="get_articles_with_keywords"}' in text, "Service calls should be timed"
+    assert 'db_query_seconds_count{statement="SELECT"}' in text, "DB statements should be timed"
+
+
+def test_feed(client, session, clear_data):
+    response = client.post('/articles/feed', json={})
+    assert response.status_code == 200
+    watermark = response.json['watermark']
+    assert response.json['articles'] == [], "Feed without watermark should return only the watermark"
+
+    service.save_articles([news.Article(header=f"Feed {i}", url=f"https://example.com/feed/{i}") for i in range(3)])
+    response = client.post('/articles/feed', json={'since': watermark, 'limit': 2})
+    assert [i['text'] for i in response.json['articles']] == ['Feed 0', 'Feed 1'], "New articles should be returned oldest first"
+    assert response.json['more'] is True, "Cut off articles should be reported"
+
+    response = client.post('/articles/feed', json={'since': response.json['watermark']})
+    assert [i['text'] for i in response.json['articles']] == ['Feed 2'], "Feed should continue after the watermark"
+    assert response.json['more'] is False
+
+    response = client.post('/articles/feed', json={'since': response.json['watermark']})
+    assert response.json['articles'] == [], "No articles should follow the newest one"
+
+
+def test_feed_invalid(client):
+    for data in ({'since': 'invalid'}, {'limit': 0}, {'wait': 100}, {'keywords': 'text'}):
+        response = client.post('/articles/feed', json=data)
+        assert response.status_code == 422, f"Invalid request {data} should be rejected"
+
+
+def test_feed_long_poll(client, session, clear_data):
+    watermark = client.post('/articles/feed', json={}).json['watermark']
+    api.listener.ticket()
+    time.sleep(0.5)  # let the listener connect
+
+    def store():
+        time.sleep(0.3)
+        service.save_articles([news.Article(header="Polled", url="https://example.com/polled")])
+        db.session.remove()
+    thread = threading.Thread(target=store)
+    thread.start()
+    start = time.monotonic()
+    response = client.post('/articles/feed', json={'since': watermark, 'wait': 10})
+    thread.join()
+
+    assert [i['text'] for i in response.json['articles']] == ['Polled'], "Waiting request should get the new article"
+    assert time.monotonic() - start < 5, "Waiting request should wake up on commit"
+
+
+def test_feed_events(client, session, clear_data, monkeypatch):
+    monkeypatch.setattr(api, 'SSE_MAX_DURATION', 0.5)
+    monkeypatch.setattr(api, 'SSE_HEARTBEAT', 0.2)
+    service.save_articles([news.Article(header="Event", url="https://example.com/event")])
+
+    response = client.get('/articles/feed/events?since=' + api.encode_key(api.EMPTY_WATERMARK))
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    assert 'event: articles\n' in body, "New articles should be sent as an event"
+    assert '"text": "Event"' in body, "Event should contain the article"
+    assert ': keepalive' in body, "Idle stream should send heartbeats"
+
+
+def test_feed_stream_limit(client, session, clear_data, monkeypatch):
+    monkeypatch.setattr(api, 'SSE_MAX_DURATION', 0.2)
+    monkeypatch.setattr(api, 'listener', IngestListener(max_streams=1))
+    watermark = client.post('/articles/feed', json={}).json['watermark']
+    assert api.listener.acquire_stream(), "Free slot should be reserved"
+
+    response = client.get('/articles/feed/events?since=' + watermark)
+    assert response.status_code == 503, "Event stream above the limit should be refused"
+    assert response.headers['Retry-After'], "Refused client should be told when to retry"
+    start = time.monotonic()
+    response = client.post('/articles/feed', json={'since': watermark, 'wait': 10})
+    assert response.status_code == 200 and time.monotonic() - start < 5, "Long-poll above the limit should not wait"
+
+    api.listener.release_stream()
+    response = client.get('/articles/feed/events?since=' + watermark)
+    assert response.status_code == 200, "Released slot should serve a stream"
+    response.get_data()
+    response.close()
+    assert api.listener.acquire_stream(), "Finished stream should release its slot"
+
+
+def test_find_articles_keyword_index(client, session, clear_data, monkeypatch):
+    service.save_articles([news.Article(header=f"Indexed {i}", url=f"https://example.com/indexed/{i}") for i in range(3)])
+    index = api.KeywordIndex()
+    index.load()
+    monkeypatch.setattr(api, 'keyword_index', index)
+
+    with patch('app.api.get_articles_with_keywords') as mock_search:
+        response = client.post('/articles/find', json={'keywords': ['indexed'], 'limit': 2})
+        assert not mock_search.called, "Newest pages should be served by the loaded index"
+    assert [i['text'] for i in response.json['articles']] == ['Indexed 2', 'Indexed 1']
+    response = client.post('/articles/find', json={'keywords': ['indexed'], 'cursor': response.json['next_cursor']})
+    assert [i['text'] for i in response.json['articles']] == ['Indexed 0'], "Cursor should work with the index"
+
+
+def test_find_articles_history(client, session, clear_data):
+    db.session.add(Article(header='Archive story', url='https://example.com/archive',
+                           timestamp=datetime(2021, 3, 1, tzinfo=api.timezone.utc)))
+    db.session.commit()
+
+    response = client.post('/articles/find', json={'keywords': ['archive']})
+    assert response.json['articles'] == [], "Only recent articles should be searched by default"
+    response = client.post('/articles/find', json={'keywords': ['archive'], 'history': True})
+    assert [i['text'] for i in response.json['articles']] == ['Archive story'], "History should search all articles"
+
+
+def test_find_articles_max_staleness(client, session, clear_data, monkeypatch):
+    replica = db.ReadRouter([])
+    monkeypatch.setattr(db, 'read_router', replica)
+    service.save_articles([news.Article(header='Cat one', url='https://example.com/1')])
+    with patch.object(replica, 'engine', wraps=replica.engine) as engine:
+        response = client.post('/articles/find', json={'keywords': ['cat'], 'max_staleness': 0})
+        assert len(response.json['articles']) == 1
+        engine.assert_called_with(0)
+
+    hits = api.result_cache.stats()['hits']
+    client.post('/articles/find', json={'keywords': ['cat'], 'max_staleness': 0})
+    assert api.result_cache.stats()['hits'] == hits, "Bounded reads should bypass the cache"
+
+    for value in (-1, 'now', True):
+        response = client.post('/articles/find', json={'keywords': ['cat'], 'max_staleness': value})
+        assert response.status_code == 422, f"Max staleness {value!r} should be rejected"
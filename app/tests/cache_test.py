@@ -0,0 +1,57 @@
+from app.cache import LRUSet, ResultCache
+import pytest
+
+
+def test_lru_set():
+    urls = LRUSet(2)
+    urls.add('a')
+    urls.add('b')
+    assert 'a' in urls, "Added item should be in set"
+    urls.add('c')
+    assert len(urls) == 2, "Set should not grow over its capacity"
+    assert 'b' not in urls, "Least recently used item should be evicted"
+    assert 'a' in urls and 'c' in urls, "Recently used items should be kept"
+
+
+def test_lru_set_update_and_clear():
+    urls = LRUSet(3)
+    urls.update(['a', 'b', 'c', 'd'])
+    assert 'a' not in urls, "Oldest item should be evicted"
+    urls.clear()
+    assert len(urls) == 0, "Cleared set should be empty"
+
+
+def test_lru_set_invalid_capacity():
+    with pytest.raises(ValueError):
+        LRUSet(0)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_result_cache():
+    clock = FakeClock()
+    cache = ResultCache(2, ttl=10, clock=clock)
+    assert cache.get('a', 1) is None, "Empty cache should miss"
+    cache.put('a', 'A', 1)
+    cache.put('b', 'B', 1)
+    assert cache.get('a', 1) == 'A', "Stored value should be returned"
+    cache.put('c', 'C', 1)
+    assert cache.get('b', 1) is None, "Least recently used entry should be evicted"
+
+    clock.now = 11
+    assert cache.get('a', 1) is None, "Expired entry should not be returned"
+    assert cache.stats() == {'size': 1, 'hits': 1, 'misses': 3, 'evictions': 1, 'invalidations': 0}
+
+
+def test_result_cache_generation():
+    cache = ResultCache(10, ttl=10)
+    cache.put('a', 'A', 1)
+    assert cache.get('a', 2) is None, "New generation should invalidate entries"
+    assert cache.stats()['invalidations'] == 1
+    assert cache.stats()['size'] == 0
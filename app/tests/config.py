@@ -1,5 +1,5 @@
 from app import db, service
-from app.model import Article
+from app.model import Article, ArticleUrl
 import pytest
 
 
@@ -11,4 +11,6 @@ def session():
 
 @pytest.fixture(scope="function")
 def clear_data():
-    db.session.query(Article).delete()
\ No newline at end of file
+    db.session.query(Article).delete()
+    db.session.query(ArticleUrl).delete()
+    db.session.commit()
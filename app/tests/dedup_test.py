@@ -0,0 +1,43 @@
+from sqlalchemy import text
+from app import db
+from app.dedup import NearDuplicateIndex, canonical_url, minhash, shingles, similarity, url_key
+from app.tests.config import session
+
+
+def test_canonical_url():
+    assert canonical_url('HTTP://WWW.Example.com:80//news//1/?utm_source=x&b=2&a=1#top') == \
+        'https://example.com/news/1?a=1&b=2', "Scheme, host, path and query should be normalized"
+    assert canonical_url('https://example.com') == 'https://example.com/', "Empty path should be the root"
+    assert canonical_url('https://example.com:8080/a%2fb c') == 'https://example.com:8080/a%2Fb%20c', \
+        "Non-default port should be kept and escapes normalized"
+    assert canonical_url('https://example.com/?q=') == 'https://example.com/?q=', "Blank parameters should be kept"
+
+
+def test_url_key(session):
+    url = 'https://www.example.com/news/1?fbclid=1'
+    assert url_key(url) == url_key('http://example.com/news/1'), "Equal canonical URLs should have equal keys"
+    assert url_key(url) != url_key('https://example.com/news/2')
+    with db.engine.connect() as connection:
+        key = connection.execute(text("SELECT md5(:url)::uuid"), {'url': canonical_url(url)}).scalar()
+    assert key == url_key(url), "Key should equal the MD5 of the canonical URL in PostgreSQL"
+
+
+def test_minhash_similarity():
+    first = shingles('Vláda schválila rozpočet na příští rok')
+    assert first == shingles('vlada schvalila rozpocet na pristi rok'), "Shingles should ignore case and diacritics"
+    second = shingles('Vláda schválila rozpočet na příští rok 2025')
+    assert similarity(minhash(first), minhash(second)) > 0.6, "Similar headlines should have similar signatures"
+    assert similarity(minhash(first), minhash(shingles('Bouře zasáhla pobřeží'))) < 0.2
+
+
+def test_near_duplicate_index():
+    index = NearDuplicateIndex(capacity=2)
+    index.add(['Government approves the new budget for next year', 'Storm hits the coast', ''])
+    assert index.contains('Government approves the new budget for next year.'), "Near-duplicate should be found"
+    assert not index.contains('Parliament rejects the budget'), "Different headline should not be found"
+    assert not index.contains(''), "Empty headline should not be a duplicate"
+
+    index.add(['Elections will be held in October'])
+    assert len(index) == 2, "Index should be bounded"
+    assert not index.contains('Government approves the new budget for next year'), "Oldest headline should be evicted"
+    assert index.contains('Storm hits the coast')
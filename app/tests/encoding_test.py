@@ -0,0 +1,29 @@
+import gzip
+import json
+import pytest
+from unittest.mock import patch
+from app.encoding import EncodedBody, compress, dumps
+
+
+def test_dumps():
+    value = {'text': 'Babiš', 'url': 'https://example.com/1', 'n': [1, None]}
+    assert json.loads(dumps(value)) == value
+    with patch('app.encoding.orjson', None):
+        assert dumps(value) == '{"text":"Babiš","url":"https://example.com/1","n":[1,null]}'.encode(), \
+            "Fallback should write compact UTF-8 JSON"
+
+
+def test_encoded_body():
+    body = EncodedBody({'articles': [{'text': f'Header {i}', 'url': f'https://example.com/{i}'} for i in range(100)]})
+    assert body.encoded(None) is body.data
+    compressed = body.encoded('gzip')
+    assert gzip.decompress(compressed) == body.data
+    assert body.encoded('gzip') is compressed, "Compressed variant should be computed once"
+
+    short = EncodedBody({'articles': []})
+    assert short.encoded('gzip') is short.data, "Short body should not be compressed"
+
+
+def test_compress_unsupported():
+    with pytest.raises(ValueError):
+        compress(b'data', 'deflate')
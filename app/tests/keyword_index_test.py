@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+from app import db, news, service
+from app.keyword_index import KeywordIndex
+from app.model import Article
+from app.tests.config import session, clear_data
+
+HEADERS = [
+    "Babiš jednal s Prymulou o opatřeních",
+    "Prymula: Babišovi jsem to řekl",
+    "Running dogs in London",
+    "The dog runs fast",
+    "O'Neil wins covid_19 award",
+    "Počasí na víkend",
+]
+
+
+def save_headers(headers, prefix='index'):
+    service.save_articles([news.Article(header=header, url=f"https://example.com/{prefix}/{i}")
+                           for i, header in enumerate(headers)])
+
+
+def test_search_matches_db(session, clear_data):
+    save_headers(HEADERS)
+    index = KeywordIndex()
+    index.load()
+
+    for keywords in (['babis'], ['prymul', 'babiš'], ['running'], ['dog run'], ['the'], ["o'neil"],
+                     ['pocasi vikend'], ['missing'], ['!!!'], ['London', 'počasí']):
+        expected = [i.url for i in service.get_articles_with_keywords(keywords)]
+        assert [i.url for i in index.search(keywords)] == expected, f"Index should match DB search of {keywords}"
+
+
+def test_search_paging(session, clear_data):
+    save_headers([f"Dog {i}" for i in range(5)])
+    index = KeywordIndex()
+    index.load()
+
+    page = index.search(['dog'], limit=2)
+    assert [i.header for i in page] == ['Dog 4', 'Dog 3'], "Newest articles should be first"
+    page = index.search(['dog'], limit=2, after=(page[-1].timestamp, page[-1].id))
+    assert [i.header for i in page] == ['Dog 2', 'Dog 1'], "Next page should continue after the key"
+
+
+def test_refresh(session, clear_data):
+    index = KeywordIndex()
+    assert index.search(['dog']) is None, "Index should not be used before it is loaded"
+    index.load()
+    assert index.search(['dog']) == [], "Empty index should match nothing"
+
+    save_headers(["Dog news"], prefix='refresh')
+    index.refresh(index.generation)
+    assert index.search(['dog']) == [], "Unchanged generation should not refresh"
+    index.refresh(service.get_generation())
+    assert [i.header for i in index.search(['dog'])] == ["Dog news"], "New articles should be added on refresh"
+    assert len(index) == 1
+
+
+def test_evict_old_articles(session, clear_data):
+    now = datetime.now(timezone.utc)
+    db.session.add_all([Article(header=header, url=f"https://example.com/evict/{days}", timestamp=now - timedelta(days=days))
+                        for header, days in (("Ancient dog", 10), ("Older dog", 4), ("Recent dog", 1))])
+    db.session.commit()
+    index = KeywordIndex(max_age=timedelta(days=7))
+    index.load()
+
+    assert [i.header for i in index.search(['dog'])] == ["Recent dog", "Older dog"], "Old articles should be evicted"
+    assert index.search(['ancient']) == [] and 'ancient' not in index._postings, "Unused lexemes should be evicted"
+
+    index.max_age = timedelta(days=3)
+    save_headers(["New dog"], prefix='evicted')
+    index.refresh(service.get_generation())
+    assert len(index) == 2, "Articles past the bound should be evicted on refresh"
+    assert [i.header for i in index.search(['dog'])] == ["New dog", "Recent dog"], "Positions should survive eviction"
+    page = index.search(['dog'], limit=1)
+    assert [i.header for i in index.search(['dog'], after=(page[0].timestamp, page[0].id))] == ["Recent dog"], \
+        "Paging should survive eviction"
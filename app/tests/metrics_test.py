@@ -0,0 +1,98 @@
+import asyncio
+import urllib.request
+import pytest
+from app import metrics
+
+
+def test_counter_render():
+    counter = metrics.Counter('test_events_total', 'Test events.', ('source', 'result'))
+    counter.inc('a', 'new', amount=3)
+    counter.inc('a', 'new')
+    counter.inc('b"c', 'failed')
+
+    text = '\n'.join(counter.render())
+    assert '# TYPE test_events_total counter' in text, "Type should be declared"
+    assert 'test_events_total{source="a",result="new"} 4' in text, "Increments should be summed"
+    assert 'test_events_total{source="b\\"c",result="failed"} 1' in text, "Label values should be escaped"
+
+
+def test_gauge_render():
+    gauge = metrics.Gauge('test_depth', 'Test depth.', ('stage',))
+    gauge.set(3, 'fetch')
+    gauge.set(1, 'fetch')
+
+    assert gauge.value('fetch') == 1, "Gauge should hold the last value"
+    lines = gauge.render()
+    assert '# TYPE test_depth gauge' in lines, "Type should be declared"
+    assert 'test_depth{stage="fetch"} 1' in lines
+
+
+def test_histogram_render():
+    histogram = metrics.Histogram('test_seconds', 'Test durations.', ('phase',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value, 'parse')
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{phase="parse",le="0.1"} 2' in lines, "Buckets should include their upper bound"
+    assert 'test_seconds_bucket{phase="parse",le="1"} 3' in lines, "Buckets should be cumulative"
+    assert 'test_seconds_bucket{phase="parse",le="+Inf"} 4' in lines, "+Inf bucket should count all values"
+    assert 'test_seconds_count{phase="parse"} 4' in lines, "Count should be rendered"
+    assert 'test_seconds_sum{phase="parse"} 5.65' in lines, "Sum should be rendered"
+
+
+def test_worker_label():
+    counter = metrics.Counter('test_worker_total', 'Test worker metric.', ('result',))
+    counter.inc('new')
+    metrics.set_worker('12')
+    try:
+        assert 'test_worker_total{result="new",worker="12"} 1' in counter.render(), "Worker should be labelled"
+    finally:
+        metrics.set_worker('')
+    assert 'test_worker_total{result="new"} 1' in counter.render(), "No worker label should be rendered by default"
+
+
+def test_metric_abstract():
+    class Incomplete(metrics.Metric):
+        kind = 'gauge'
+
+    with pytest.raises(TypeError):
+        Incomplete('test_incomplete', 'Test incomplete metric.')
+
+
+def test_timed():
+    histogram = metrics.Histogram('test_call_seconds', 'Test calls.', ('function',))
+
+    @metrics.timed(histogram)
+    def work(value):
+        return value * 2
+
+    assert work(2) == 4, "Decorated function should return its result"
+    assert histogram.count('work') == 1, "Call should be observed under the function name"
+
+
+def test_timed_coroutine():
+    histogram = metrics.Histogram('test_async_call_seconds', 'Test calls.', ('function',))
+
+    @metrics.timed(histogram)
+    async def work(value):
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    assert asyncio.run(work(2)) == 4, "Decorated coroutine should return its result"
+    assert histogram.count('work') == 1, "Call should be observed under the function name"
+    total = next(line for line in histogram.render() if line.startswith('test_async_call_seconds_sum'))
+    assert float(total.split()[-1]) >= 0.01, "Coroutine should be timed until it finishes"
+
+
+def test_serve():
+    counter = metrics.Counter('test_served_total', 'Test served metric.')
+    counter.inc()
+    server = metrics.serve(0, '127.0.0.1')
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as response:
+            body = response.read().decode()
+            assert response.headers['Content-Type'] == metrics.CONTENT_TYPE, "Prometheus text format should be served"
+        assert 'test_served_total 1' in body, "All metrics should be served"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -3,7 +3,7 @@ from unittest.mock import patch
 import logging
 import requests
 import re
-from app.news import check_url
+from app.news import check_url, forget_content, get_fetch_state
 
 
 def test_check_url():
@@ -26,14 +26,23 @@ def test_get_soup_invalid_url():
 
 
 class MockResponse:
-    def __init__(self, status_code, content):
+    def __init__(self, status_code, content, url="https://www.example.com", headers=None):
         self.status_code = status_code
         self.content = content
+        self.url = url
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
 
 
 def test_get_soup_success():
     url = "https://www.idnes.cz"
-    with patch("requests.get") as mock_get:
+    with patch("requests.Session.get") as mock_get:
         mock_get.return_value = MockResponse(status_code=200, content=b"<html><body><h1>Hello World!</h1></body></html>")
         soup = NewsScraper().get_soup(url)
         assert soup is not None, "With valid url response should't be None"
@@ -43,7 +52,7 @@ def test_get_soup_success():
 
 def test_get_soup_bad_status_code():
     url = "https://example.com/not-found"
-    with patch("requests.get") as mock_get:
+    with patch("requests.Session.get") as mock_get:
         mock_get.return_value = MockResponse(status_code=404, content="")
         soup = NewsScraper().get_soup(url)
         assert soup is None, "With a response other than 200 fnc should return None"
@@ -60,7 +69,7 @@ def test_get_soup_connection_error(caplog):
 
 def test_get_soup_request_exception(caplog):
     caplog.set_level(logging.ERROR)
-    with patch("requests.get") as mock_get:
+    with patch("requests.Session.get") as mock_get:
         mock_get.side_effect = requests.exceptions.RequestException("Network Error")
         soup = NewsScraper().get_soup("https://www.example.com")
         assert soup is None, "With response problem fnc shoul return None"
@@ -87,3 +96,58 @@ def test_dtest_ihned():
 
 def test_dtest_bbc():
     check_provider(BbcScraper())
+
+
+def test_get_soup_deadline(caplog):
+    caplog.set_level(logging.ERROR)
+    with patch("requests.Session.get") as mock_get, patch("app.news.HTTP_DEADLINE", -1):
+        mock_get.return_value = MockResponse(status_code=200, content=b"<html></html>")
+        soup = NewsScraper().get_soup("https://www.example.com")
+        assert soup is None, "Download exceeding the deadline should return None"
+        assert caplog.records[0].msg.startswith("Request error:"), "Exceeded deadline should be logged"
+
+
+def test_get_soup_not_modified():
+    url = "https://www.example.com/conditional"
+    forget_content(url)
+    with patch("requests.Session.get") as mock_get:
+        mock_get.return_value = MockResponse(status_code=200, content=b"<html></html>",
+                                             headers={'ETag': '"v1"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        assert NewsScraper().get_soup(url) is not None, "First fetch should be parsed"
+
+        mock_get.return_value = MockResponse(status_code=304, content=b"")
+        assert NewsScraper().get_soup(url) is None, "Not modified content should not be parsed"
+        headers = mock_get.call_args.kwargs['headers']
+        assert headers['If-None-Match'] == '"v1"', "ETag should be sent back"
+        assert headers['If-Modified-Since'] == 'Wed, 21 Oct 2015 07:28:00 GMT', "Last-Modified should be sent back"
+    assert get_fetch_state(url).unchanged == 1, "Unchanged fetch should be counted"
+
+
+def test_get_soup_same_content():
+    url = "https://www.example.com/hashed"
+    forget_content(url)
+    with patch("requests.Session.get") as mock_get:
+        mock_get.return_value = MockResponse(status_code=200, content=b"<html>a</html>")
+        assert NewsScraper().get_soup(url) is not None, "First fetch should be parsed"
+        assert NewsScraper().get_soup(url) is None, "Content with the same hash should not be parsed"
+
+        forget_content(url)
+        assert NewsScraper().get_soup(url) is not None, "Forgotten content should be parsed again"
+
+
+def test_extract_articles_with_strainer():
+    idnes = IdnesScraper()
+    soup = idnes.parse(b'<html><body><div><a href="https://www.idnes.cz/zpravy/1" score-type="Article"> Zpr\xc3\xa1va </a>'
+                       b'<a href="https://www.idnes.cz/reklama">Reklama</a></div></body></html>')
+    assert [(a.header, a.url) for a in idnes.extract_articles(soup)] == [('Zpráva', 'https://www.idnes.cz/zpravy/1')], \
+        "Only article links should be extracted, with their own URLs"
+    assert len(soup.find_all('a')) == 1, "Only strained elements should be parsed"
+
+    ihned = IhnedScraper()
+    soup = ihned.parse(b'<h3 class="article-title big"><a href="https://ihned.cz/c1-1">Titulek</a></h3><h3>Jiny</h3>')
+    assert [(a.header, a.url) for a in ihned.extract_articles(soup)] == [('Titulek', 'https://ihned.cz/c1-1')]
+
+    bbc = BbcScraper()
+    soup = bbc.parse(b'<a href="/news/articles/1" data-testid="internal-link"><h2 data-testid="card-headline">Headline</h2></a>')
+    assert [(a.header, a.url) for a in bbc.extract_articles(soup)] == [('Headline', 'https://bbc.com/news/articles/1')], \
+        "Relative links should be joined without a double slash"
@@ -0,0 +1,69 @@
+import gzip
+import json
+from datetime import datetime, timezone
+from sqlalchemy import text
+from app import db, retention, service
+from app.dedup import url_key
+from app.model import Article, ArticleUrl
+from app.tests.config import session, clear_data
+
+
+def test_month_arithmetic():
+    month = retention.month_start(datetime(2024, 12, 31, 23, 30, tzinfo=timezone.utc))
+    assert month == datetime(2024, 12, 1, tzinfo=timezone.utc)
+    assert retention.add_months(month, 1) == datetime(2025, 1, 1, tzinfo=timezone.utc), "Months should roll over years"
+    assert retention.partition_name(month) == 'article_p2024_12'
+
+
+def test_ensure_partitions(session):
+    now = datetime(2030, 11, 5, tzinfo=timezone.utc)
+    with db.engine.begin() as connection:
+        retention.ensure_partitions(connection, now=now, ahead=2)
+        months = retention.list_partitions(connection)
+    expected = [datetime(2030, 11, 1, tzinfo=timezone.utc), datetime(2030, 12, 1, tzinfo=timezone.utc),
+                datetime(2031, 1, 1, tzinfo=timezone.utc)]
+    assert all(month in months for month in expected), "Partitions of the current and following months should exist"
+
+
+def test_apply_retention(session, clear_data, tmp_path):
+    old = datetime(2020, 1, 15, tzinfo=timezone.utc)
+    with db.engine.begin() as connection:
+        retention.create_partition(connection, retention.month_start(old))
+    db.session.add_all([Article(header='Old', url='https://example.com/old', timestamp=old),
+                        Article(header='New', url='https://example.com/new')])
+    db.session.commit()
+
+    dropped = retention.apply_retention(365, tmp_path)
+    db.session.remove()
+
+    assert dropped == ['article_p2020_01'], "Partition older than the retention should be dropped"
+    with gzip.open(tmp_path / 'article_p2020_01.ndjson.gz', 'rt') as file:
+        archived = [json.loads(line) for line in file]
+    assert [i['header'] for i in archived] == ['Old'], "Dropped articles should be archived"
+    assert [i.header for i in db.session.query(Article)] == ['New'], "Recent articles should be kept"
+    assert db.session.get(ArticleUrl, url_key('https://example.com/old')) is None, "URLs of dropped articles should be removed"
+    with db.engine.connect() as connection:
+        assert connection.execute(text("SELECT to_regclass('article_p2020_01')")).scalar() is None
+
+
+def test_create_partition_moves_default_rows(session, clear_data):
+    stray = datetime(2035, 3, 10, tzinfo=timezone.utc)
+    db.session.add_all([Article(header='Stray', url='https://example.com/stray', timestamp=stray),
+                        Article(header='Later', url='https://example.com/later', timestamp=datetime(2035, 5, 1, tzinfo=timezone.utc))])
+    db.session.commit()
+    with db.engine.connect() as connection:
+        assert retention.default_partition_rows(connection) == 2, "Articles without a partition should go to the default one"
+
+    with db.engine.begin() as connection:
+        retention.create_partition(connection, retention.month_start(stray))
+    db.session.remove()
+
+    with db.engine.connect() as connection:
+        assert connection.execute(text("SELECT header FROM article_p2035_03")).scalars().all() == ['Stray'], \
+            "Articles of the month should be moved into the new partition"
+        assert retention.default_partition_rows(connection) == 1, "Other months should stay in the default partition"
+    article = db.session.query(Article).filter_by(header='Stray').one()
+    assert article.timestamp == stray and article.id is not None, "Moved article should keep its key"
+    assert [i.header for i in service.get_articles_with_keywords(['stray'])] == ['Stray'], \
+        "Moved article should stay searchable"
+    assert db.session.get(ArticleUrl, url_key('https://example.com/stray')) is not None, "URL should stay claimed"
@@ -0,0 +1,63 @@
+from app import news, scheduler
+from app.scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler():
+    clock = FakeClock()
+    source = news.NewsScraper()
+    return Scheduler([source], clock=clock, rng=lambda: 0.5), clock, source
+
+
+def test_all_sources_due_at_start():
+    plan, clock, source = make_scheduler()
+    assert plan.due() == [source], "Every source should be due immediately"
+
+
+def test_interval_adapts_to_new_articles():
+    plan, clock, source = make_scheduler()
+    plan.record(source, 0)
+    assert plan.schedules[source].interval == scheduler.BASE_INTERVAL * scheduler.SLOWDOWN, "Quiet source should slow down"
+    plan.record(source, 5)
+    plan.record(source, 5)
+    assert plan.schedules[source].interval == scheduler.MIN_INTERVAL, "Busy source should speed up to the minimum"
+    for _ in range(50):
+        plan.record(source, 0)
+    assert plan.schedules[source].interval == scheduler.MAX_INTERVAL, "Interval should not exceed the maximum"
+
+
+def test_fixed_rate():
+    plan, clock, source = make_scheduler()
+    clock.now = 3.0  # the scrape took 3 seconds
+    plan.record(source, 1)
+    assert plan.next_run() == scheduler.BASE_INTERVAL * scheduler.SPEEDUP, "Next run should be planned from the previous planned time"
+
+    clock.now = 1000.0
+    plan.record(source, 1)
+    assert plan.next_run() == 1000.0, "Late source should run once, not catch up with a burst"
+
+
+def test_backoff_on_failures():
+    plan, clock, source = make_scheduler()
+    plan.record(source, None)
+    first = plan.next_run()
+    plan.record(source, None)
+    assert plan.next_run() - clock.now == 2 * first, "Backoff should grow exponentially"
+    for _ in range(20):
+        plan.record(source, None)
+    assert plan.next_run() - clock.now == scheduler.MAX_BACKOFF, "Backoff should be limited"
+
+
+def test_jitter():
+    plan, clock, source = make_scheduler()
+    plan.rng = lambda: 0.0
+    assert plan.jitter(10) == 10 * (1 - scheduler.JITTER)
+    plan.rng = lambda: 1.0
+    assert plan.jitter(10) == 10 * (1 + scheduler.JITTER)
@@ -1,8 +1,13 @@
 from typing import List
-from app import scraper, db, news
+from app import scraper, db, metrics, news
 from app.model import Article
 from app.tests.config import session, clear_data
 import logging
+import time
+from unittest.mock import patch
+from app.cache import LRUSet
+from app.pipeline import Pipeline
+from app.sources import DeclarativeScraper, SourceDefinition
 
 
 class FakeScraper(news.NewsScraper):
@@ -19,6 +24,7 @@ class FailingScraper(news.NewsScraper):
 def test_scrape_news(caplog, session, clear_data):
     # mock news scrapers and clean DB
     scraper.SCRAPERS = [FakeScraper(), FailingScraper()]
+    scraper.seen_urls.clear()
 
     # test
     scraper.scrape_news()
@@ -33,4 +39,122 @@ def test_scrape_news(caplog, session, clear_data):
     caplog.set_level(logging.ERROR)
     assert len(caplog.records) == 1, "FaillingScraper should write down exactly one ERROR logging"
     if len(caplog.records)==1:
-        assert caplog.records[0].msg.startswith("Scraper Errror:") == True, "Error logging should start with Scraper Errror:"
\ No newline at end of file
+        assert caplog.records[0].msg.startswith("Scraper Errror:") == True, "Error logging should start with Scraper Errror:"
+
+class SlowScraper(news.NewsScraper):
+    def __init__(self, delay):
+        self.delay = delay
+
+    def get_headers(self) -> List[news.Article]:
+        time.sleep(self.delay)
+        return [news.Article(header='slow', url='http://www.slow-url.cz')]
+
+
+def test_scrape_news_concurrently(session, clear_data):
+    scraper.seen_urls.clear()
+    scrapers = [SlowScraper(0.3), SlowScraper(0.3), SlowScraper(0.3)]
+    start = time.monotonic()
+    results = scraper.scrape_news(scrapers)
+    elapsed = time.monotonic() - start
+
+    assert list(results) == scrapers, "Results should keep the order of scrapers"
+    assert sorted(results.values()) == [0, 0, 1], "Every scraper should return its articles"
+    assert elapsed < 0.6, "Scrapers should run concurrently"
+
+
+def test_scrape_news_timeout(caplog, session, clear_data):
+    caplog.set_level(logging.ERROR)
+    fast, slow = SlowScraper(0), SlowScraper(1)
+    results = scraper.scrape_news([fast, slow], timeout=0.2)
+
+    assert results[slow] is None and results[fast] is not None, "Scraper exceeding the deadline should fail"
+    assert caplog.records[0].msg.startswith("Scraper Timeout:"), "Timeout should be logged"
+    # the late source is still saved; keep it out of the following tests
+    assert scraper.get_pipeline().drain(timeout=5), "Late source should leave the pipeline"
+
+
+def test_scrape_news_seen_urls(session, clear_data):
+    scraper.SCRAPERS = [FakeScraper()]
+    scraper.seen_urls.clear()
+    scraper.scrape_news()
+
+    with patch('app.service.save_articles') as mock_save:
+        scraper.scrape_news()
+        assert not mock_save.called, "Already seen articles should not reach the DB"
+
+
+def test_warm_seen_urls(session, clear_data):
+    db.session.add(Article(header='a', url='http://www.stored-url.cz'))
+    db.session.commit()
+    scraper.seen_urls.clear()
+
+    scraper.warm_seen_urls()
+    assert 'http://www.stored-url.cz' in scraper.seen_urls, "Stored URL should be in cache"
+    assert not db.session.registry.has(), "Warming should not leave an open session"
+
+
+def test_scrape_news_skips_running(caplog):
+    caplog.set_level(logging.WARNING)
+    slow = SlowScraper(0.5)
+    scraper.scrape_news([slow], timeout=0.1)
+    caplog.clear()
+
+    results = scraper.scrape_news([slow], timeout=0.1)
+    assert results == {slow: None}, "Scraper still running should not be started again"
+    assert caplog.records[0].msg.startswith("Scraper Busy:"), "Skipped scraper should be logged"
+    assert caplog.records[0].levelno == logging.WARNING, "Back-pressure should not be logged as an error"
+    assert scraper.get_pipeline().drain(timeout=5), "Late source should leave the pipeline"
+
+
+def test_pipeline_stages(session, clear_data):
+    pipeline = Pipeline(LRUSet(100), fetch_workers=2, parse_workers=1, queue_size=1)
+    scrapers = [FakeScraper(), *(SlowScraper(0.05) for _ in range(4))]
+    scrapers += [DeclarativeScraper(SourceDefinition(name=f'page{i}', url=f'https://example.com/{i}', item='a'))
+                 for i in range(3)]
+    pages = {f'https://example.com/{i}': f'<a href="/{i}">Article {i}</a>'.encode() for i in range(3)}
+    with patch.object(DeclarativeScraper, 'fetch', side_effect=lambda url: pages[url]):
+        results = pipeline.run(scrapers, timeout=5)
+
+    assert [results[s] for s in scrapers[-3:]] == [1, 1, 1], "Pages should be parsed and their articles saved"
+    assert results[scrapers[0]] == 1, "Custom scrapers should skip parsing"
+    stats = pipeline.stats()
+    assert stats['stages']['fetch']['processed'] == len(scrapers), "Every source should be fetched"
+    assert stats['stages']['parse']['processed'] == 3, "Only fetched pages should be parsed"
+    assert all(stage['max_depth'] <= 1 for stage in stats['stages'].values()), "Queues should be bounded"
+    assert stats['articles_per_s'] > 0, "Throughput should be reported"
+    assert metrics.scraper_stage_seconds.count('write') >= 1, "Stages should be timed"
+
+
+class UnparsableUrlScraper(news.NewsScraper):
+    def get_headers(self) -> List[news.Article]:
+        return [news.Article(header='bad', url='https://example.com:99999/x', validated=True),
+                news.Article(header='good', url='https://example.com/good', validated=True)]
+
+
+def test_pipeline_unparsable_url(caplog, session, clear_data):
+    source = UnparsableUrlScraper()
+    results = Pipeline(LRUSet(100), fetch_workers=1, parse_workers=1).run([source], timeout=5)
+
+    assert results == {source: 1}, "Article with an unparsable URL should be dropped, not fail the source"
+    assert [i.header for i in db.session.query(Article)] == ['good']
+    assert 'Invalid article URL' in caplog.text, "Dropped article should be logged"
+
+
+def test_scrape_news_results(session, clear_data):
+    fake, failing = FakeScraper(), FailingScraper()
+    scraper.seen_urls.clear()
+
+    results = scraper.scrape_news([fake, failing])
+    assert results == {fake: 1, failing: None}, "Results should count new articles and mark failures"
+    assert scraper.scrape_news([fake]) == {fake: 0}, "Seen articles should not be counted"
+
+
+def test_scrape_news_metrics(session, clear_data):
+    metrics.clear()
+    scraper.seen_urls.clear()
+
+    scraper.scrape_news([FakeScraper(), FailingScraper()])
+    assert metrics.scraper_articles_total.value('FakeScraper', 'new') == 1, "New articles should be counted"
+    assert metrics.scraper_articles_total.value('FakeScraper', 'duplicate') == 1, "Duplicate articles should be counted"
+    assert metrics.scraper_pages_total.value('FailingScraper', 'failed') == 1, "Failed sources should be counted"
+    assert metrics.scraper_get_headers_seconds.count('FakeScraper') == 1, "Scraping should be timed"
@@ -1,6 +1,11 @@
-from app import db, service
+import asyncio
+import threading
+import time
+from app import db, dedup, news, service
 from app.model import Article
-from unittest.mock import patch
+from unittest.mock import call, patch
+from sqlalchemy import text
+import pytest
 from app.tests.config import session, clear_data
 
 
@@ -73,9 +78,9 @@ def test_save_article_add_db_error(session, clear_data):
 
 
 def test_get_articles_with_keywords(session, clear_data):
-    db.session.add(Article(header='a b c', url=''))
-    db.session.add(Article(header='b c d', url=''))
-    db.session.add(Article(header='x y z', url=''))
+    db.session.add(Article(header='a b c', url='https://example.com/1'))
+    db.session.add(Article(header='b c d', url='https://example.com/2'))
+    db.session.add(Article(header='x y z', url='https://example.com/3'))
     db.session.commit()
 
     assert service.get_articles_with_keywords(keywords=['aaa']) == [], "No match keyword should return []"
@@ -91,4 +96,204 @@ def test_get_articles_with_keywords(session, clear_data):
     assert 'a b c' in [a.header for a in service.get_articles_with_keywords(keywords=['b', 'c'])]
     assert 'b c d' in [a.header for a in service.get_articles_with_keywords(keywords=['b', 'c'])] 
     db.session.query(Article).delete()
-    db.session.commit()
\ No newline at end of file
+    db.session.commit()
+
+
+def test_save_articles(session, clear_data):
+    db.session.add(Article(header="Existing header", url="https://example.com/existing-article"))
+    db.session.commit()
+
+    inserted, skipped = service.save_articles([
+        news.Article(header="New header", url="https://example.com/new-article"),
+        news.Article(header="Repeated header", url="https://example.com/new-article"),
+        news.Article(header="Existing header 2", url="https://example.com/existing-article"),
+        news.Article(header="", url="https://example.com/empty-header-article"),
+        news.Article(header="Invalid URL", url="invalid_url"),
+    ])
+
+    assert (inserted, skipped) == (1, 4), "Only one article should be inserted"
+    saved_articles = db.session.query(Article).order_by(Article.id).all()
+    assert [a.header for a in saved_articles] == ["Existing header", "New header"], "First of repeated URLs should be saved"
+    assert saved_articles[1].timestamp is not None, "Timestamp should be set"
+
+
+def test_save_articles_validated(session, clear_data):
+    with patch('app.service.check_url', return_value=True) as check_url:
+        inserted, _ = service.save_articles([
+            news.Article(header="Checked", url="https://example.com/checked", validated=True),
+            news.Article(header="Unchecked", url="https://example.com/unchecked"),
+        ])
+
+    assert inserted == 2
+    assert check_url.call_args_list == [call("https://example.com/unchecked")], "Validated URLs should not be checked again"
+
+
+def test_save_articles_unparsable_url(session, clear_data):
+    inserted, skipped = service.save_articles([
+        news.Article(header="Good", url="https://example.com/good", validated=True),
+        news.Article(header="Bad port", url="https://example.com:99999/x", validated=True),
+        news.Article(header="Bad host", url="https://[1::2::3]/x", validated=True),
+        news.Article(header="Other", url="https://example.com/other", validated=True),
+    ])
+
+    assert (inserted, skipped) == (2, 2), "Unparsable URLs should be dropped, not fail the batch"
+    assert sorted(i.header for i in db.session.query(Article)) == ["Good", "Other"]
+
+
+def test_save_articles_canonical_urls(session, clear_data):
+    db.session.add(Article(header="Existing", url="https://www.example.com/news/1?utm_source=feed"))
+    db.session.commit()
+
+    inserted, skipped = service.save_articles([
+        news.Article(header="Variant 1", url="http://example.com//news/1/"),
+        news.Article(header="Variant 2", url="https://EXAMPLE.com/news/1#comments"),
+        news.Article(header="Other", url="https://example.com/news/2?b=2&a=1"),
+        news.Article(header="Other reordered", url="https://example.com/news/2?a=1&b=2&fbclid=x"),
+    ])
+    assert (inserted, skipped) == (1, 3), "URLs with the same canonical form should be duplicates"
+
+
+def test_save_articles_near_duplicates(session, clear_data):
+    with patch('app.dedup.NEAR_DUPLICATES', True), patch('app.dedup.near_duplicates', dedup.NearDuplicateIndex()):
+        assert service.save_articles([
+            news.Article(header="Government approves the new budget for next year", url="https://a.example.com/1"),
+        ]) == (1, 0)
+        assert service.save_articles([
+            news.Article(header="Government approves the new budget for next year!", url="https://b.example.com/1"),
+            news.Article(header="Storm hits the coast", url="https://b.example.com/2"),
+        ]) == (1, 1), "Near-duplicate headline from another source should be skipped"
+
+
+def test_save_articles_empty(session, clear_data):
+    assert service.save_articles([]) == (0, 0), "Nothing should be inserted"
+    assert db.session.query(Article).count() == 0
+
+
+def test_get_articles_with_keywords_full_text(session, clear_data):
+    db.session.add(Article(header='Babiš jednal s prezidentem', url='https://example.com/1'))
+    db.session.add(Article(header='Prezident přijal Babiše, Babiš odmítl', url='https://example.com/2'))
+    db.session.add(Article(header='Markets are running higher', url='https://example.com/3'))
+    db.session.commit()
+
+    assert len(service.get_articles_with_keywords(keywords=['babis'])) == 2, "Keyword without diacritics should match"
+    assert len(service.get_articles_with_keywords(keywords=['BABIŠ'])) == 2, "Search should be case insensitive"
+    assert len(service.get_articles_with_keywords(keywords=['babiš prezident'])) == 2, "All words of keyword should match"
+    assert len(service.get_articles_with_keywords(keywords=['run'])) == 1, "English words should be stemmed"
+    assert service.get_articles_with_keywords(keywords=['!!!']) == [], "Keyword without words should return []"
+
+    articles = service.get_articles_with_keywords(keywords=['babis'], order='relevance')
+    assert articles[0].url == 'https://example.com/2', "More relevant article should be first"
+    articles = service.get_articles_with_keywords(keywords=['babis'], order='newest')
+    assert [a.url for a in articles] == ['https://example.com/2', 'https://example.com/1'], "Newest article should be first"
+
+
+def test_get_articles_with_keywords_invalid_order(session, clear_data):
+    with pytest.raises(ValueError):
+        service.get_articles_with_keywords(keywords=['a'], order='oldest')
+
+
+def test_get_articles_with_keywords_special_characters(session, clear_data):
+    db.session.add(Article(header="O'Neil slaví ½ vítězství", url='https://example.com/1'))
+    db.session.commit()
+
+    for keyword in ['½', 'ﬁnance', "o'neil", 'a:*|b', '\\', 'x & !y', "'"]:
+        service.get_articles_with_keywords(keywords=[keyword])
+    assert len(service.get_articles_with_keywords(keywords=["o'neil"])) == 1, "Apostrophe should not break the query"
+    assert len(service.get_articles_with_keywords(keywords=['slavi'])) == 1
+
+
+def test_save_articles_bumps_generation(session, clear_data):
+    generation = service.get_generation()
+    service.save_articles([news.Article(header="New header", url="https://example.com/new-article")])
+    assert service.get_generation() == generation + 1, "Inserted articles should bump generation"
+    service.save_articles([news.Article(header="New header", url="https://example.com/new-article")])
+    assert service.get_generation() == generation + 1, "Skipped articles should not bump generation"
+
+
+def test_get_articles_since(session, clear_data):
+    service.save_articles([news.Article(header="Old header", url="https://example.com/old")])
+    watermark = service.get_watermark()
+    service.save_articles([news.Article(header="New header", url="https://example.com/new"),
+                           news.Article(header="Other news", url="https://example.com/other")])
+
+    articles = service.get_articles_since([], watermark, 10)
+    assert [i.url for i in articles] == ["https://example.com/new", "https://example.com/other"], \
+        "Only articles after the watermark should be returned, oldest first"
+    assert [i.url for i in service.get_articles_since(['header'], watermark, 10)] == ["https://example.com/new"], \
+        "Keywords should filter the articles"
+    assert len(service.get_articles_since([], None, 10)) == 3, "Without watermark all articles should be returned"
+    assert service.get_articles_since([], service.get_watermark(), 10) == [], "Nothing should follow the newest article"
+
+
+def test_get_articles_since_overlapping_writers(session, clear_data):
+    started, committed = threading.Event(), threading.Event()
+
+    def late_writer():
+        db.session.execute(text("SELECT 1"))  # its transaction starts before the other writer commits
+        started.set()
+        committed.wait(5)
+        service.save_articles([news.Article(header="Late", url="https://example.com/late")])
+        db.session.remove()
+    thread = threading.Thread(target=late_writer)
+    thread.start()
+    started.wait(5)
+    service.save_articles([news.Article(header="Early", url="https://example.com/early")])
+    watermark = service.get_watermark()
+    db.session.remove()
+    committed.set()
+    thread.join()
+
+    assert [i.header for i in service.get_articles_since([], watermark, 10)] == ["Late"], \
+        "Article of a transaction started earlier but committed later should follow the watermark"
+
+
+def test_save_articles_waits_for_generation_lock(session, clear_data):
+    inserted, release = threading.Event(), threading.Event()
+
+    def slow_writer():
+        db.session.execute(service.generation_lock())
+        db.session.execute(service.insert_articles([news.Article(header="First", url="https://example.com/first")]))
+        inserted.set()
+        release.wait(5)
+        db.session.commit()
+        db.session.remove()
+    first = threading.Thread(target=slow_writer)
+    first.start()
+    inserted.wait(5)
+    second = threading.Thread(target=lambda: (service.save_articles([news.Article(header="Second",
+                                                                                   url="https://example.com/second")]),
+                                              db.session.remove()))
+    second.start()
+    time.sleep(0.3)
+    assert second.is_alive(), "Writer should wait until the one holding the generation lock commits"
+    release.set()
+    first.join()
+    second.join()
+
+    assert [i.header for i in service.get_articles_since([], None, 10)] == ["First", "Second"], \
+        "Articles should be ordered as their writers committed"
+
+
+def test_async_search_and_save(session, clear_data):
+    async def run():
+        try:
+            saved = await service.save_articles_async([
+                news.Article(header="Async header", url="https://example.com/async-article"),
+                news.Article(header="Async header again", url="https://www.example.com/async-article/"),
+                news.Article(header="Other", url="https://example.com/other-article"),
+            ])
+            again = await service.save_articles_async([news.Article(header="Async", url="https://example.com/async-article")])
+            found = await asyncio.gather(*[service.get_articles_with_keywords_async(["async"]) for _ in range(5)])
+            return saved, again, found
+        finally:
+            await db.dispose_async_engine()
+
+    generation = service.get_generation()
+    saved, again, found = asyncio.run(run())
+    assert saved == (2, 1), "Canonical duplicates should be skipped"
+    assert again == (0, 1), "Stored URL should not be inserted again"
+    assert all([row.header for row in rows] == ["Async header"] for rows in found), "Concurrent searches should find the article"
+    assert found[0] == service.get_articles_with_keywords(["async"]), "Async search should return the rows of the sync one"
+    db.session.commit()
+    assert service.get_generation() == generation + 1, "Generation should be bumped once"
+    assert asyncio.run(service.get_articles_with_keywords_async([])) == [], "No keywords should match nothing"
@@ -0,0 +1,83 @@
+import json
+import pytest
+from unittest.mock import patch
+from bs4 import BeautifulSoup
+from app import sources
+from app.benchmarks.fixtures import synthetic_page
+from app.news import IhnedScraper
+from app.sources import DeclarativeScraper, HashRing, SourceDefinition, load_scrapers
+
+
+def test_shipped_sources():
+    scrapers = {scraper.name: scraper for scraper in load_scrapers(sources.load_entries(sources.SOURCES_FILE))}
+    assert set(scrapers) == {'idnes', 'ihned', 'bbc'}, "Shipped sources should be defined"
+
+    for name, scraper in scrapers.items():
+        articles = scraper.extract_articles(scraper.parse(synthetic_page(name, articles=20, noise=100)))
+        assert len(articles) == 20, f"All articles of {name} should be extracted"
+        assert all(article.header for article in articles), "Headers should be extracted"
+    bbc = scrapers['bbc'].extract_articles(scrapers['bbc'].parse(synthetic_page('bbc', articles=1, noise=0)))
+    assert bbc[0].url == 'https://bbc.com/news/articles/c00000000', "Relative links should be joined with the front page"
+
+
+def test_declarative_scraper():
+    scraper = DeclarativeScraper(SourceDefinition(name='test', url='https://example.com/news/', item='div.teaser',
+                                                  link='a[href]', headline='h2', url_rule='keep'))
+    soup = BeautifulSoup('<div class="teaser big"><h2> Title </h2><a href="https://example.com/a">more</a></div>'
+                         '<div class="teaser"><h2>No link</h2></div>'
+                         '<div class="teaser"><h2>Relative</h2><a href="/b">more</a></div>', 'html.parser')
+
+    articles = scraper.extract_articles(soup)
+    assert [(a.header, a.url) for a in articles] == [('Title', 'https://example.com/a')], \
+        "Items without a link or with an invalid kept URL should be skipped"
+    assert articles[0].validated, "Extracted articles should be marked as checked"
+    assert scraper.name == 'test', "Source name should be used in logs and metrics"
+
+
+def test_strainer_matches_class():
+    scraper = DeclarativeScraper(SourceDefinition(name='test', url='https://example.com', item='h3.title', link='a',
+                                                  strainer={'name': 'h3', 'attrs': {'class': 'title'}}))
+    soup = scraper.parse(b'<h3 class="big title"><a href="/x">X</a></h3><p>noise</p>')
+    assert soup.find('p') is None, "Strainer should skip other elements"
+    assert [a.url for a in scraper.extract_articles(soup)] == ['https://example.com/x']
+
+
+def test_load_scrapers(tmp_path):
+    path = tmp_path / 'sources.json'
+    path.write_text(json.dumps([{'name': 'a', 'url': 'https://a.example.com', 'item': 'a'},
+                                {'class': 'app.news.IhnedScraper'}]))
+    with patch('app.sources.entry_points', return_value=[]):
+        scrapers = load_scrapers(sources.load_entries(path))
+    assert [scraper.name for scraper in scrapers] == ['a', 'IhnedScraper'], "Sources should be loaded from the file"
+    assert isinstance(scrapers[1], IhnedScraper), "Custom scraper classes should be supported"
+
+    with pytest.raises(ValueError):
+        load_scrapers([{'name': 'a', 'url': 'https://a.example.com', 'item': 'a'}] * 2)
+    with pytest.raises(ValueError):
+        load_scrapers([{'name': 'a', 'url': 'https://a.example.com', 'item': 'a', 'url_rule': 'other'}])
+    with pytest.raises(ValueError):
+        load_scrapers([{'name': 'a', 'url': 'https://a.example.com', 'selector': 'a'}])
+
+
+def test_load_entry_points():
+    class EntryPoint:
+        def load(self):
+            return lambda: [{'name': 'plugin', 'url': 'https://plugin.example.com', 'item': 'a'}]
+
+    with patch('app.sources.entry_points', return_value=[EntryPoint()]):
+        entries = sources.load_entries(None)
+    assert entries[0]['name'] == 'plugin', "Sources should be loaded from entry points"
+
+
+def test_shards():
+    entries = [{'name': f'source-{i}', 'url': f'https://s{i}.example.com', 'item': 'a'} for i in range(500)]
+    shards = [[scraper.name for scraper in load_scrapers(entries, shard, 4)] for shard in range(4)]
+
+    assert sorted(sum(shards, [])) == sorted(entry['name'] for entry in entries), "Every source should be in one shard"
+    assert all(80 < len(shard) < 170 for shard in shards), "Sources should be spread evenly"
+
+    names = [entry['name'] for entry in entries]
+    before, after = HashRing(['0', '1', '2', '3']), HashRing(['0', '1', '2', '3', '4'])
+    moved = [name for name in names if before.node(name) != after.node(name)]
+    assert all(after.node(name) == '4' for name in moved), "Only sources of the new shard should move"
+    assert len(moved) < 150, "About a fifth of the sources should move"
@@ -0,0 +1,93 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import logging
+from unittest.mock import patch
+import pytest
+from sqlalchemy import text
+from app import db, scheduler, sources, worker
+from app.benchmarks.fixtures import synthetic_page
+from app.model import Article, SourceJob
+from app.news import NewsScraper, forget_content
+from app.sources import DeclarativeScraper, load_scrapers
+from app.tests.config import session, clear_data
+
+NAMES = ['a', 'b', 'c']
+
+
+@pytest.fixture(scope="function")
+def clear_jobs():
+    db.session.query(SourceJob).delete()
+    db.session.commit()
+
+
+def test_claim_jobs_exclusive(session, clear_jobs):
+    assert worker.sync_jobs(NAMES) == 3, "Jobs of new sources should be added"
+    assert worker.sync_jobs(NAMES) == 0, "Existing jobs should be kept"
+
+    first = worker.claim_jobs('w1', NAMES, limit=2)
+    second = worker.claim_jobs('w2', NAMES, limit=5)
+    assert len(first) == 2 and len(second) == 1, "Claims should be limited to the due jobs"
+    assert not set(first) & set(second), "A job should be claimed by one worker only"
+    assert worker.claim_jobs('w3', NAMES) == [], "Leased jobs should not be claimed again"
+    assert worker.claim_jobs('w3', ['d']) == [], "Jobs of unknown sources should not be claimed"
+
+
+def test_claim_skips_locked_jobs(session, clear_jobs):
+    worker.sync_jobs(NAMES)
+    with db.engine.connect() as connection:
+        # a concurrent claim holding the row lock of one job
+        connection.execute(text("SELECT name FROM source_job WHERE name = 'a' FOR UPDATE"))
+        claimed = worker.claim_jobs('w1', NAMES)
+        connection.rollback()
+    assert sorted(claimed) == ['b', 'c'], "Locked jobs should be skipped without waiting"
+
+
+def test_expired_lease_is_taken_over(session, clear_jobs):
+    worker.sync_jobs(['a'])
+    assert worker.claim_jobs('dead', ['a'], lease=-1) == ['a']
+    assert worker.claim_jobs('w2', ['a']) == ['a'], "Job of a dead worker should be claimed after its lease expired"
+
+    assert worker.complete_jobs('dead', {'a': 1}) == [], "Worker which lost the lease should not complete the job"
+    assert worker.complete_jobs('w2', {'a': 1}) == ['a']
+
+
+def test_complete_jobs_reschedules(session, clear_jobs):
+    worker.sync_jobs(['a', 'b'])
+    worker.claim_jobs('w1', ['a', 'b'])
+    worker.complete_jobs('w1', {'a': 0, 'b': None}, rng=lambda: 0.5)
+
+    jobs = {job.name: job for job in db.session.query(SourceJob)}
+    assert jobs['a'].interval == scheduler.BASE_INTERVAL * scheduler.SLOWDOWN, "Quiet source should slow down"
+    assert jobs['a'].leased_by is None and jobs['a'].leased_until is None, "Lease should be released"
+    assert jobs['b'].failures == 1, "Failure should be counted"
+    db.session.commit()
+    assert worker.claim_jobs('w1', ['a', 'b']) == [], "Completed jobs should not be due before their next run"
+
+
+def test_run_once(session, clear_data, clear_jobs):
+    entries = [entry for entry in sources.load_entries(sources.SOURCES_FILE) if entry['name'] == 'bbc']
+    scrapers = {scraper.name: scraper for scraper in load_scrapers(entries)}
+    worker.sync_jobs(scrapers)
+    forget_content(scrapers['bbc'].website_url)
+    with ThreadPoolExecutor(2) as fetch_executor, \
+            ProcessPoolExecutor(1, initializer=worker.init_parser, initargs=(entries,)) as parse_executor, \
+            patch.object(DeclarativeScraper, 'fetch', return_value=synthetic_page('bbc', articles=5, noise=10)):
+        results = worker.run_once('w1', scrapers, fetch_executor, parse_executor)
+        assert results == {'bbc': 5}, "New articles should be parsed in the pool and saved"
+        assert worker.run_once('w1', scrapers, fetch_executor, parse_executor) == {}, "Job should not be due again"
+
+    assert db.session.query(Article).count() == 5, "Articles should be stored"
+    job = db.session.get(SourceJob, 'bbc')
+    assert job.leased_by is None, "Lease should be released"
+    assert job.interval == scheduler.BASE_INTERVAL * scheduler.SPEEDUP, "Busy source should speed up"
+
+
+def test_page_scrapers(caplog):
+    class CustomScraper(NewsScraper):
+        def get_headers(self):
+            return []
+
+    caplog.set_level(logging.ERROR)
+    entries = [entry for entry in sources.load_entries(sources.SOURCES_FILE) if entry['name'] == 'bbc']
+    scrapers = worker.page_scrapers(load_scrapers(entries) + [CustomScraper()])
+    assert list(scrapers) == ['bbc'], "Scrapers without a front page should not get jobs"
+    assert 'CustomScraper' in caplog.text, "Skipped scraper should be logged"
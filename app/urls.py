@@ -0,0 +1,71 @@
+"""
+Validation of article URLs.
+
+Kept apart from `app.news`, so that the API and the service layer can validate
+URLs without importing the scraping stack (requests, BeautifulSoup).
+
+`check_url` matches the URL against one precompiled pattern: an absolute `http`,
+`https` or `ftp` URL with a domain name, IPv4 or IPv6 host, optional credentials
+and port (0 to 65535), without whitespace, quotes or angle brackets. A bracketed
+host has to be a valid IPv6 address (`ipaddress`), and the URL has to be parsed
+by `urlsplit` as `app.dedup` parses it, so an accepted URL always has a canonical
+form. It accepts the same links
+of the front pages as `validators.url` at a fraction of its cost. Front pages link the same URLs in
+every cycle, so the results are kept in a cache of the `URL_CACHE_SIZE` most
+recently checked URLs.
+
+Scrapers check every link once when extracting articles and mark the article
+`validated` (see `app.news.Article`), so the later stages do not check it again.
+"""
+import ipaddress
+import os
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+URL_CACHE_SIZE = int(os.environ.get('URL_CACHE_SIZE', 65536))
+
+_OCTET = r'(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)'
+_LABEL = r'(?!-)[a-z0-9¡-￿-]{1,63}(?<!-)'
+_PORT = r'(?:6553[0-5]|655[0-2]\d|65[0-4]\d\d|6[0-4]\d{3}|[1-5]\d{4}|\d{1,4})'
+URL_PATTERN = re.compile(
+    r'(?:https?|ftp)://'
+    r'(?:[^\s/?#@:]+(?::[^\s/?#@]*)?@)?'
+    r'(?:'
+    rf'(?:{_OCTET}\.){{3}}{_OCTET}'
+    r'|\[(?P<ipv6>[0-9a-f:.]+)\]'
+    rf'|(?:{_LABEL}\.)+(?:[a-z¡-￿]{{2,63}}|xn--[a-z0-9-]{{2,59}})'
+    r')'
+    rf'(?::{_PORT})?'
+    r'(?:[/?#][^\s"<>]*)?',
+    re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def _is_valid(url: str) -> bool:
+    match = URL_PATTERN.fullmatch(url)
+    if match is None:
+        return False
+    try:
+        if match['ipv6'] is not None:
+            ipaddress.IPv6Address(match['ipv6'])
+        parts = urlsplit(url)
+        # reading them raises as in `dedup.canonical_url` for a port out of range or an invalid host
+        parts.port, parts.hostname
+    except ValueError:
+        return False
+    return True
+
+
+def check_url(url=None) -> bool:
+    """
+    Checks if the provided URL is valid.
+
+    Args:
+        url: The URL to validate
+
+    Returns:
+        True if the URL is valid, False otherwise.
+    """
+    return bool(url) and isinstance(url, str) and _is_valid(url)
@@ -0,0 +1,325 @@
+"""
+Worker mode of the scraper.
+
+Instead of every scraper process running a fixed share of the sources, any
+number of worker processes, on one host or many, take fetch jobs from a work
+queue in the DB: the `source_job` table (`model.SourceJob`) holds one job per
+source with its planned run time and adaptive interval (see `app.scheduler`).
+
+A worker repeatedly:
+
+1. claims up to `BATCH_SIZE` due jobs with `SELECT ... FOR UPDATE SKIP LOCKED`,
+   so concurrent workers never wait for each other nor claim the same job, and
+   leases them for `LEASE_SECONDS`,
+2. fetches the sources concurrently in a thread pool,
+3. parses the pages and extracts the articles in a process pool of
+   `PARSE_PROCESSES` processes, so parsing is not serialized by the GIL,
+4. saves the new articles of all claimed sources in one batch insert,
+5. plans the next runs of the jobs and releases their leases.
+
+A job stays leased only while its worker handles it. If a worker dies, its
+leases expire and other workers claim the jobs, so no source is left behind.
+The lease has to be longer than one round (two `scraper.CYCLE_TIMEOUT`s plus
+the insert); a worker whose lease expired does not overwrite the schedule
+written by the worker which took the job over.
+
+Run `python -m app.worker` in as many processes as needed; the sources are
+those of `app.sources`, added to the queue by every worker when it starts.
+Custom scrapers without `website_url` (overriding `get_headers`) cannot be split
+into fetching and parsing; the worker logs them as errors and leaves them to
+`app.scraper`.
+Workers are identified by `WORKER_ID`, the host name and process id by default.
+"""
+import logging
+import os
+import random
+import socket
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from app import db, metrics, service
+from app.model import SourceJob
+from app.news import Article, NewsScraper, forget_content, get_fetch_state
+from app.scheduler import BASE_INTERVAL, SourceSchedule, plan_next
+from app.scraper import CYCLE_TIMEOUT, MAINTENANCE_INTERVAL, METRICS_PORT, maintain_partitions, seen_urls, warm_seen_urls
+from app.sources import load_entries, load_scrapers
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = os.environ.get('WORKER_ID') or f'{socket.gethostname()}:{os.getpid()}'
+BATCH_SIZE = int(os.environ.get('WORKER_BATCH_SIZE', 16))
+LEASE_SECONDS = float(os.environ.get('WORKER_LEASE_SECONDS', 120))
+PARSE_PROCESSES = int(os.environ.get('WORKER_PARSE_PROCESSES', os.cpu_count() or 1))
+POLL_INTERVAL = 1.0
+MAINTENANCE_LOCK = 0x61727469  # pg advisory lock key, one worker maintains the partitions at a time
+
+# scrapers of the parsing processes, by source name
+_parsers: Dict[str, NewsScraper] = {}
+
+
+def sync_jobs(names: Iterable[str]) -> int:
+    """
+    Adds jobs of the sources which are not in the queue yet; they are due immediately.
+
+    Returns:
+        The number of added jobs.
+    """
+    rows = [{'name': name, 'interval': BASE_INTERVAL, 'failures': 0} for name in names]
+    if not rows:
+        return 0
+    statement = insert(SourceJob).values(rows).on_conflict_do_nothing().returning(SourceJob.name)
+    try:
+        added = len(db.session.execute(statement).all())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return added
+
+
+@metrics.timed(metrics.service_call_seconds)
+def claim_jobs(worker: str, names: Iterable[str], limit: int = BATCH_SIZE, lease: float = LEASE_SECONDS) -> List[str]:
+    """
+    Claims due jobs which are not leased by another worker.
+
+    Rows locked by a concurrent claim are skipped, not waited for.
+
+    Args:
+        worker: The id of the claiming worker.
+        names: The sources the worker can scrape; jobs of other sources are left alone.
+        limit: The maximum number of jobs to claim.
+        lease: The number of seconds after which the jobs can be claimed by another worker.
+
+    Returns:
+        The names of the claimed sources, the longest overdue first.
+    """
+    candidates = (
+        select(SourceJob.name)
+        .where(SourceJob.name.in_(list(names)), SourceJob.next_run <= func.now(),
+               or_(SourceJob.leased_until.is_(None), SourceJob.leased_until < func.now()))
+        .order_by(SourceJob.next_run)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(SourceJob)
+        .where(SourceJob.name.in_(candidates.scalar_subquery()))
+        .values(leased_by=worker, leased_until=func.now() + timedelta(seconds=lease))
+        .returning(SourceJob.name, SourceJob.next_run)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        claimed = db.session.execute(statement).all()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return [name for name, _ in sorted(claimed, key=lambda row: row.next_run)]
+
+
+@metrics.timed(metrics.service_call_seconds)
+def complete_jobs(worker: str, results: Dict[str, Optional[int]], rng: Callable[[], float] = random.random) -> List[str]:
+    """
+    Plans the next runs of the jobs by their results and releases their leases.
+
+    Jobs which another worker has claimed since (after the lease expired) are left alone.
+
+    Args:
+        worker: The id of the worker which claimed the jobs.
+        results: The number of new articles of every source, None for sources which failed.
+        rng: The source of random numbers from [0, 1) used for jitter.
+
+    Returns:
+        The names of the completed jobs.
+    """
+    if not results:
+        return []
+    statement = (
+        select(SourceJob, func.extract('epoch', SourceJob.next_run), func.extract('epoch', func.clock_timestamp()))
+        .where(SourceJob.name.in_(list(results)), SourceJob.leased_by == worker)
+        .order_by(SourceJob.name)
+        .with_for_update()
+    )
+    completed = []
+    try:
+        for job, next_run, now in db.session.execute(statement).all():
+            schedule = SourceSchedule(interval=job.interval, next_run=float(next_run), failures=job.failures)
+            plan_next(schedule, results[job.name], float(now), rng)
+            job.interval = schedule.interval
+            job.failures = schedule.failures
+            job.next_run = datetime.fromtimestamp(schedule.next_run, timezone.utc)
+            job.leased_by = None
+            job.leased_until = None
+            completed.append(job.name)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    for name in results.keys() - set(completed):
+        logger.warning(f"Lease of {name} expired, the job was taken over by another worker")
+    return completed
+
+
+def page_scrapers(scrapers: Iterable[NewsScraper]) -> Dict[str, NewsScraper]:
+    """Returns the scrapers with a front page (`website_url`) by name; logs the others, which are not run."""
+    kept = {}
+    for scraper in scrapers:
+        if scraper.website_url:
+            kept[scraper.name] = scraper
+        else:
+            logger.error(f"Worker cannot run {scraper.name}: it has no website_url, run it by app.scraper instead")
+    return kept
+
+
+def init_parser(entries: List[dict]) -> None:
+    """Creates the scrapers of a parsing process."""
+    _parsers.clear()
+    _parsers.update((scraper.name, scraper) for scraper in load_scrapers(entries))
+
+
+def parse_articles(name: str, content: bytes) -> Tuple[List[Article], float]:
+    """
+    Extracts the articles from the content of a source's page; runs in a parsing process.
+
+    Returns:
+        The articles and the parsing time in seconds.
+    """
+    scraper = _parsers[name]
+    start = time.perf_counter()
+    articles = scraper.extract_articles(scraper.parse(content))
+    return articles, time.perf_counter() - start
+
+
+def fetch_contents(scrapers: List[NewsScraper], executor: ThreadPoolExecutor,
+                   timeout: float = CYCLE_TIMEOUT) -> Dict[NewsScraper, Optional[bytes]]:
+    """
+    Fetches the front pages of the scrapers concurrently.
+
+    Returns:
+        The content of every scraper's page, None if it failed or has not changed.
+    """
+    futures: Dict[NewsScraper, Future] = {scraper: executor.submit(scraper.fetch, scraper.website_url)
+                                          for scraper in scrapers}
+    wait(futures.values(), timeout=timeout)
+    contents = {}
+    for scraper, future in futures.items():
+        if not future.done():
+            future.cancel()
+            get_fetch_state(scraper.website_url).consecutive_errors += 1
+            metrics.scraper_pages_total.inc(scraper.name, 'failed')
+            logger.error(f"Scraper Timeout: {scraper.name} did not finish within {timeout}s")
+            contents[scraper] = None
+            continue
+        contents[scraper] = future.result()
+    return contents
+
+
+def run_once(worker: str, scrapers: Dict[str, NewsScraper], fetch_executor: ThreadPoolExecutor,
+             parse_executor: ProcessPoolExecutor, limit: int = BATCH_SIZE,
+             lease: float = LEASE_SECONDS) -> Dict[str, Optional[int]]:
+    """
+    Claims due jobs, scrapes their sources, saves the new articles and completes the jobs.
+
+    Args:
+        worker: The id of the worker.
+        scrapers: The scrapers of all sources by name.
+        fetch_executor: The thread pool fetching the pages.
+        parse_executor: The process pool parsing the pages, initialized by `init_parser`.
+        limit: The maximum number of jobs to claim.
+        lease: The lease of the claimed jobs in seconds.
+
+    Returns:
+        The number of new articles saved from each claimed source, None for sources which failed.
+    """
+    names = claim_jobs(worker, scrapers, limit, lease)
+    results: Dict[str, Optional[int]] = {name: None for name in names}
+    if not names:
+        return results
+
+    parsing: Dict[str, Future] = {}
+    for scraper, content in fetch_contents([scrapers[name] for name in names], fetch_executor).items():
+        if content is not None:
+            parsing[scraper.name] = parse_executor.submit(parse_articles, scraper.name, content)
+        elif not get_fetch_state(scraper.website_url).consecutive_errors:
+            results[scraper.name] = 0
+
+    scraped: Dict[str, List[Article]] = {}
+    for name, future in parsing.items():
+        try:
+            articles, seconds = future.result(timeout=CYCLE_TIMEOUT)
+        except Exception as e:
+            forget_content(scrapers[name].website_url)
+            metrics.scraper_pages_total.inc(name, 'failed')
+            logger.error(f"Parser Error: {name} : {e}")
+            continue
+        metrics.scraper_phase_seconds.observe(seconds, name, 'parse')
+        metrics.scraper_pages_total.inc(name, 'parsed')
+        scraped[name] = articles
+
+    new_articles = [article for articles in scraped.values() for article in articles if article.url not in seen_urls]
+    try:
+        inserted = service.save_new_articles(new_articles)
+        seen_urls.update(article.url for article in new_articles)
+    except Exception as e:
+        for name in scraped:
+            forget_content(scrapers[name].website_url)
+            metrics.scraper_pages_total.inc(name, 'failed')
+        logger.error(f"Ingestion Error: {e}")
+    else:
+        for name, articles in scraped.items():
+            saved = {article.url for article in articles} & inserted
+            inserted -= saved
+            metrics.scraper_articles_total.inc(name, 'new', amount=len(saved))
+            metrics.scraper_articles_total.inc(name, 'duplicate', amount=len(articles) - len(saved))
+            results[name] = len(saved)
+        logger.info(f"Saved {sum(results[name] for name in scraped)} new articles from {len(scraped)} sources")
+
+    complete_jobs(worker, results)
+    return results
+
+
+def maintain_partitions_once() -> None:
+    """Maintains the partitions unless another worker is doing it."""
+    with db.engine.connect() as connection:
+        if not connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {'key': MAINTENANCE_LOCK}).scalar():
+            return
+        try:
+            maintain_partitions()
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MAINTENANCE_LOCK})
+
+
+def run(worker: str = WORKER_ID) -> None:
+    """Works on the jobs of all sources forever; maintains partitions daily."""
+    entries = load_entries()
+    scrapers = page_scrapers(load_scrapers(entries))
+    logger.info(f"Worker {worker} added {sync_jobs(scrapers)} jobs to the queue of {len(scrapers)} sources")
+    warm_seen_urls()
+    next_maintenance = time.monotonic()
+    with ThreadPoolExecutor(max_workers=BATCH_SIZE, thread_name_prefix='fetch') as fetch_executor, \
+            ProcessPoolExecutor(max_workers=PARSE_PROCESSES, initializer=init_parser,
+                                initargs=(entries,)) as parse_executor:
+        while True:
+            if time.monotonic() >= next_maintenance:
+                maintain_partitions_once()
+                next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+            try:
+                results = run_once(worker, scrapers, fetch_executor, parse_executor)
+            except Exception as e:
+                logger.error(f"Worker Error: {e}")
+                results = {}
+            finally:
+                db.session.remove()
+            if not results:
+                time.sleep(POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='{asctime} {levelname:<8} {name}:{module}:{lineno} - {message}', style='{')
+
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+    run()
@@ -0,0 +1,54 @@
+"""
+Gunicorn configuration of the production API server.
+
+Run from the repository root (gunicorn reads this file automatically):
+
+    gunicorn app.api:app
+
+The API is served by `WEB_WORKERS` processes (2 * CPUs + 1 by default), each with
+`WEB_THREADS` threads. By default every worker gets `DB_POOL_SIZE` threads for the
+ordinary requests, so that every one has a pooled connection, and `API_MAX_STREAMS`
+more for the long-polling and event-stream clients of the feed, which hold a thread
+but no connection while they wait (see `app.notifications`).
+
+Every worker has its own connection pools and LISTEN connection (see `app.db`), so the
+workers together can open `workers * connections_per_process()` connections; the number
+of workers is reduced to keep this within `DB_MAX_CONNECTIONS` (80 by default, leaving
+room for the scraper and administration within PostgreSQL's default `max_connections`
+of 100).
+
+Every worker keeps its own metrics (see `app.metrics`) labelled by its process id.
+"""
+import logging
+import multiprocessing
+import os
+from app import metrics
+from app.db import POOL_SIZE, connections_per_process, max_processes
+from app.notifications import MAX_STREAMS
+
+logger = logging.getLogger('gunicorn.error')
+
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 80))
+
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', POOL_SIZE + MAX_STREAMS))
+requested_workers = int(os.environ.get('WEB_WORKERS', 2 * multiprocessing.cpu_count() + 1))
+workers = min(requested_workers, max_processes(DB_MAX_CONNECTIONS))
+if workers < requested_workers:
+    logger.warning(f"Workers reduced from {requested_workers} to {workers}: each can open "
+                   f"{connections_per_process()} of {DB_MAX_CONNECTIONS} DB connections")
+# every worker imports the app itself, so no DB connection is shared across a fork
+preload_app = False
+keepalive = 5
+timeout = 60
+graceful_timeout = 30
+max_requests = 10_000
+max_requests_jitter = 1_000
+accesslog = os.environ.get('WEB_ACCESS_LOG')
+
+
+def post_fork(server, worker):
+    # the metrics are kept per worker, label them so that the scrapes of different workers can be told apart
+    metrics.set_worker(str(worker.pid))